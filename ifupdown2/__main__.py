@@ -78,6 +78,27 @@ def client():
     return status
 
 
+def daemon():
+    try:
+        from ifupdown2.ifupdown.daemon import Daemon
+    except Exception:
+        from ifupdown.daemon import Daemon
+
+    if os.geteuid() != 0:
+        sys.stderr.write('must be root to run this command\n')
+        return 1
+    try:
+        return Daemon(sys.argv).run()
+    except ArgvParseError as e:
+        root_logger.error(str(e))
+        return Status.Daemon.STATUS_INIT
+    except ExitWithStatusAndError as e:
+        root_logger.error(e.message)
+        return e.status
+    except ExitWithStatus as e:
+        return e.status
+
+
 def stand_alone():
     from datetime import datetime
     start_time = datetime.now()
@@ -121,7 +142,10 @@ def stand_alone():
 
 def main():
     try:
-        if daemon_mode():
+        if sys.argv[0].endswith("ifupdown2d"):
+            return daemon()
+        elif daemon_mode() and os.geteuid() == 0:
+            # the daemon only serves root, non-root ifquery runs stand alone
             return client()
         else:
             return stand_alone()
@@ -13,6 +13,7 @@ from setuptools.dist import strtobool
 
 try:
     from ifupdown2.lib.addon import AddonWithIpBlackList
+    from ifupdown2.lib.nlcache import NetlinkPipelineError
     from ifupdown2.nlmanager.nlmanager import Link
 
     from ifupdown2.ifupdown.iface import ifaceType, ifaceLinkKind, ifaceLinkPrivFlags, ifaceStatus, iface
@@ -29,6 +30,7 @@ try:
     import ifupdown2.ifupdown.ifupdownconfig as ifupdownconfig
 except (ImportError, ModuleNotFoundError):
     from lib.addon import AddonWithIpBlackList
+    from lib.nlcache import NetlinkPipelineError
     from nlmanager.nlmanager import Link
 
     from ifupdown.iface import ifaceType, ifaceLinkKind, ifaceLinkPrivFlags, ifaceStatus, iface
@@ -565,33 +567,48 @@ class address(AddonWithIpBlackList, moduleBase):
         if self.ipv6_dad_handling_enabled:
             nodad = ifaceobj.get_attr_value_first('dad-attempts') == '0'
 
-        for ip, attributes in user_config_ip_addrs:
-            try:
-                if ip.version == 6 and ipv6_is_disabled is None:
-                    # check (only once) if ipv6 is disabled on this device
-                    proc_path = "/proc/sys/net/ipv6/conf/%s/disable_ipv6" % ifname
-                    ipv6_is_disabled = utils.get_boolean_from_string(self.read_file_oneline(proc_path))
-
-                    if ipv6_is_disabled:
-                        # enable ipv6
-                        self.write_file(proc_path, "0")
-
-                # check if ip is not blacklisted
-                self.ip_blacklist_check(ifname, ip)
-
-                if attributes:
-                    self.netlink.addr_add(
-                        ifname, ip,
-                        scope=attributes.get("scope"),
-                        peer=attributes.get("pointopoint"),
-                        broadcast=attributes.get("broadcast"),
-                        preferred_lifetime=attributes.get("preferred-lifetime"),
-                        nodad=nodad
-                    )
-                else:
-                    self.netlink.addr_add(ifname, ip, nodad=nodad)
-            except Exception as e:
-                self.log_error(str(e), ifaceobj, raise_error=False)
+        # the RTM_NEWADDR requests are pipelined, the kernel errors (if any)
+        # are collected once all the addresses were sent
+        pipelined_ips = set()
+        try:
+            with self.netlink.pipeline():
+                for ip, attributes in user_config_ip_addrs:
+                    try:
+                        if ip in pipelined_ips:
+                            # addr_add checks the cache, which is only
+                            # updated once the pending requests are ACKed
+                            self.netlink.pipeline_flush()
+                            pipelined_ips.clear()
+                        pipelined_ips.add(ip)
+
+                        if ip.version == 6 and ipv6_is_disabled is None:
+                            # check (only once) if ipv6 is disabled on this device
+                            proc_path = "/proc/sys/net/ipv6/conf/%s/disable_ipv6" % ifname
+                            ipv6_is_disabled = utils.get_boolean_from_string(self.read_file_oneline(proc_path))
+
+                            if ipv6_is_disabled:
+                                # enable ipv6
+                                self.write_file(proc_path, "0")
+
+                        # check if ip is not blacklisted
+                        self.ip_blacklist_check(ifname, ip)
+
+                        if attributes:
+                            self.netlink.addr_add(
+                                ifname, ip,
+                                scope=attributes.get("scope"),
+                                peer=attributes.get("pointopoint"),
+                                broadcast=attributes.get("broadcast"),
+                                preferred_lifetime=attributes.get("preferred-lifetime"),
+                                nodad=nodad
+                            )
+                        else:
+                            self.netlink.addr_add(ifname, ip, nodad=nodad)
+                    except Exception as e:
+                        self.log_error(str(e), ifaceobj, raise_error=False)
+        except NetlinkPipelineError as e:
+            for error in e.errors:
+                self.log_error(str(error), ifaceobj, raise_error=False)
 
     @staticmethod
     def __add_loopback_anycast_ip_to_running_ip_addr_list(ifaceobjlist):
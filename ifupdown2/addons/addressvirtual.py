@@ -46,6 +46,8 @@ except (ImportError, ModuleNotFoundError):
 class addressvirtual(AddonWithIpBlackList, moduleBase):
     """  ifupdown2 addon module to configure virtual addresses """
 
+    cacheable_dependency_info = True
+
     _modinfo = {
         "mhelp": "address module configures virtual addresses for interfaces. "
                  "It creates a macvlan interface for every mac ip address-virtual line",
@@ -30,6 +30,8 @@ import subprocess
 class batman_adv(Addon, moduleBase):
     """  ifupdown2 addon module to configure B.A.T.M.A.N. advanced interfaces """
 
+    cacheable_dependency_info = True
+
     _modinfo = {
         'mhelp': 'batman_adv module configures B.A.T.M.A.N. advanced interfaces.' +
                  'Every B.A.T.M.A.N. advanced interface needs at least on ethernet ' +
@@ -44,6 +44,8 @@ class bond(Addon, moduleBase):
 
     overrides_ifupdown_scripts = ['ifenslave', ]
 
+    cacheable_dependency_info = True
+
     _modinfo = {
         "mhelp": "bond configuration module",
         "attrs": {
@@ -5,13 +5,13 @@
 #
 
 import re
-import json
 import time
 import itertools
 from collections import Counter
 
 try:
     from ifupdown2.lib.addon import Bridge
+    from ifupdown2.lib.nlcache import NetlinkPipelineError
 
     import ifupdown2.ifupdown.exceptions as exceptions
     import ifupdown2.ifupdown.policymanager as policymanager
@@ -26,6 +26,7 @@ try:
     from ifupdown2.ifupdownaddons.modulebase import moduleBase
 except (ImportError, ModuleNotFoundError):
     from lib.addon import Bridge
+    from lib.nlcache import NetlinkPipelineError
 
     import ifupdown.exceptions as exceptions
     import ifupdown.policymanager as policymanager
@@ -1286,25 +1287,48 @@ class bridge(Bridge, moduleBase):
             # already enslaved.
             newbridgeports_ordered.append(dummy_brport)
 
+        # the cache lookups are done first: inside the netlink pipeline the
+        # cache isn't updated until the pending requests are ACKed
+        ports_to_enslave = []
+        for bridgeport in newbridgeports_ordered:
+            if (not ifupdownflags.flags.DRYRUN and
+                not self.cache.link_exists(bridgeport)):
+                self.log_error('%s: bridge port %s does not exist'
+                               %(ifaceobj.name, bridgeport), ifaceobj, raise_error=False)
+                err += 1
+                continue
+            hwaddress = self.cache.get_link_address(bridgeport)
+            if not ifupdownflags.flags.DRYRUN and not self._valid_ethaddr(hwaddress):
+                self.log_warn('%s: skipping port %s, ' %(ifaceobj.name,
+                              bridgeport) + 'invalid ether addr %s'
+                              %hwaddress)
+                continue
+            if bridgeport not in ports_to_enslave:
+                ports_to_enslave.append(bridgeport)
+
+        # the enslavements are pipelined (a few netlink round trips for all
+        # the ports). A port that fails to be enslaved is reported (log_error)
+        # and skipped, the other ports are still enslaved.
+        try:
+            with self.netlink.pipeline():
+                for bridgeport in ports_to_enslave:
+                    try:
+                        if self.cache.get_master(bridgeport) != ifaceobj.name:
+                            self.netlink.link_set_master(bridgeport, ifaceobj.name)
+                        newly_enslaved_ports.append(bridgeport)
+                    except Exception as e:
+                        self.logger.error(str(e))
+        except NetlinkPipelineError as e:
+            for error in e.errors:
+                self.log_error(str(error), ifaceobj, raise_error=False)
+                if error.ifname in newly_enslaved_ports:
+                    newly_enslaved_ports.remove(error.ifname)
+
+        # the address flushes are batched in a single ip process
         self.iproute2.batch_start()
 
-        for bridgeport in newbridgeports_ordered:
+        for bridgeport in newly_enslaved_ports:
             try:
-                if (not ifupdownflags.flags.DRYRUN and
-                    not self.cache.link_exists(bridgeport)):
-                    self.log_error('%s: bridge port %s does not exist'
-                                   %(ifaceobj.name, bridgeport), ifaceobj, raise_error=False)
-                    err += 1
-                    continue
-                hwaddress = self.cache.get_link_address(bridgeport)
-                if not ifupdownflags.flags.DRYRUN and not self._valid_ethaddr(hwaddress):
-                    self.log_warn('%s: skipping port %s, ' %(ifaceobj.name,
-                                  bridgeport) + 'invalid ether addr %s'
-                                  %hwaddress)
-                    continue
-                self.iproute2.link_set_master(bridgeport, ifaceobj.name)
-                newly_enslaved_ports.append(bridgeport)
-
                 # dont disable ipv6 for SVD
                 if bridgeport not in self.svd_list:
                     self.handle_ipv6([bridgeport], '1')
@@ -1312,7 +1336,6 @@ class bridge(Bridge, moduleBase):
                 self.iproute2.addr_flush(bridgeport)
             except Exception as e:
                 self.logger.error(str(e))
-                pass
 
         self.iproute2.batch_commit()
         self.cache.force_add_slave_list(ifaceobj.name, newly_enslaved_ports)
@@ -1430,8 +1453,8 @@ class bridge(Bridge, moduleBase):
                         if running_pvid == pvid:
                             continue
                         else:
-                            self.iproute2.bridge_vlan_del_pvid(port, running_pvid)
-                    self.iproute2.bridge_vlan_add_pvid(port, pvid)
+                            self.netlink.link_del_bridge_vlans(port, pvid=running_pvid)
+                    self.netlink.link_add_bridge_vlans(port, pvid=pvid)
                 except Exception as e:
                     self.log_warn('%s: failed to set pvid `%s` (%s)'
                             %(ifaceobj.name, p, str(e)))
@@ -1453,13 +1476,11 @@ class bridge(Bridge, moduleBase):
                         (vids_to_del, vids_to_add) = \
                                 utils.diff_ids(vids_int, running_vids)
                         if vids_to_del:
-                            self.iproute2.bridge_vlan_del_vid_list(port,
-                                    utils.compress_into_ranges(vids_to_del))
+                            self.netlink.link_del_bridge_vlans(port, vids_to_del)
                         if vids_to_add:
-                            self.iproute2.bridge_vlan_add_vid_list(port,
-                                    utils.compress_into_ranges(vids_to_add))
+                            self.netlink.link_add_bridge_vlans(port, vids_to_add)
                     else:
-                        self.iproute2.bridge_vlan_add_vid_list(port, vids_int)
+                        self.netlink.link_add_bridge_vlans(port, vids_int)
                 except Exception as e:
                     self.log_warn('%s: failed to set vid `%s` (%s)'
                         %(ifaceobj.name, p, str(e)))
@@ -1794,6 +1815,12 @@ class bridge(Bridge, moduleBase):
                            %bportifaceobj.name + ' vids = %s' %str(vids) +
                            'pvid = %s ' %pvid + '(%s)' %str(e),
                            bportifaceobj, raise_error=False)
+        # the vids and the pvid are deleted with a single netlink message,
+        # then added with another one (the pvid last, it might be part of
+        # the added vid ranges). If a message fails, the vids and the pvid
+        # are sent separately to keep the per-step error handling: vids and
+        # pvid delete failures are warnings, a vids add failure is a non
+        # fatal error and only a pvid add failure raises.
         try:
             if vids_to_del:
                if pvid_to_add in vids_to_del:
@@ -1801,42 +1828,67 @@ class bridge(Bridge, moduleBase):
 
                vids_to_del = sorted(list(self.remove_bridge_vlans_mapped_to_vnis_from_vids_list(None, bportifaceobj, vids_to_del)))
 
-               self.iproute2.batch_start()
-               self.iproute2.bridge_vlan_del_vid_list_self(bportifaceobj.name,
-                                          utils.compress_into_ranges(
-                                          vids_to_del), isbridge)
-               self.iproute2.batch_commit()
+            if vids_to_del and pvid_to_del:
+               self.netlink.link_del_bridge_vlans(bportifaceobj.name,
+                                                  vids_to_del,
+                                                  pvid=pvid_to_del,
+                                                  bridge_self=isbridge)
+               vids_to_del = pvid_to_del = None
+        except Exception as e:
+            self.logger.debug('%s: failed to del vid `%s` pvid `%s` (%s): '
+                              'retrying separately'
+                              %(bportifaceobj.name, str(vids_to_del),
+                                pvid_to_del, str(e)))
+
+        try:
+            if vids_to_del:
+               self.netlink.link_del_bridge_vlans(bportifaceobj.name,
+                                                  vids_to_del,
+                                                  bridge_self=isbridge)
         except Exception as e:
                 self.log_warn('%s: failed to del vid `%s` (%s)'
                         %(bportifaceobj.name, str(vids_to_del), str(e)))
 
         try:
             if pvid_to_del:
-               self.iproute2.bridge_vlan_del_pvid(bportifaceobj.name,
-                                               pvid_to_del)
+               self.netlink.link_del_bridge_vlans(bportifaceobj.name,
+                                                  pvid=pvid_to_del,
+                                                  bridge_self=isbridge)
         except Exception as e:
                 self.log_warn('%s: failed to del pvid `%s` (%s)'
                         %(bportifaceobj.name, pvid_to_del, str(e)))
 
+        if not pvid_to_add or pvid_to_add == running_pvid:
+            pvid_to_add = None
+
         try:
+            if vids_to_add and pvid_to_add:
+                self.netlink.link_add_bridge_vlans(bportifaceobj.name,
+                                                   vids_to_add,
+                                                   pvid=pvid_to_add,
+                                                   bridge_self=isbridge)
+                vids_to_add = pvid_to_add = None
+        except Exception as e:
+            self.logger.debug('%s: failed to set vid `%s` pvid `%s` (%s): '
+                              'retrying separately'
+                              %(bportifaceobj.name, str(vids_to_add),
+                                pvid_to_add, str(e)))
 
+        try:
             if vids_to_add:
-                self.iproute2.batch_start()
-                self.iproute2.bridge_vlan_add_vid_list_self(
-                    bportifaceobj.name,
-                    utils.compress_into_ranges(sorted(list(vids_to_add))),
-                    isbridge
-                )
-                self.iproute2.batch_commit()
+                self.netlink.link_add_bridge_vlans(bportifaceobj.name,
+                                                   vids_to_add,
+                                                   bridge_self=isbridge)
         except Exception as e:
                 self.log_error('%s: failed to set vid `%s` (%s)'
                                %(bportifaceobj.name, str(vids_to_add),
                                  str(e)), bportifaceobj, raise_error=False)
 
         try:
-            if pvid_to_add and pvid_to_add != running_pvid:
-                self.iproute2.bridge_vlan_add_pvid(bportifaceobj.name,
-                                                pvid_to_add)
+            if pvid_to_add:
+                self.netlink.link_add_bridge_vlans(bportifaceobj.name,
+                                                   pvid=pvid_to_add,
+                                                   bridge_self=isbridge)
         except Exception as e:
                 self.log_error('%s: failed to set pvid `%s` (%s)'
                                %(bportifaceobj.name, pvid_to_add, str(e)),
@@ -2521,19 +2573,6 @@ class bridge(Bridge, moduleBase):
         if single_vxlan_device_ifaceobj:
             self.apply_bridge_port_vlan_vni_map(single_vxlan_device_ifaceobj)
 
-    @staticmethod
-    def range_to_string(range_start, range_end):
-        return "%s" % range_start if range_start == range_end else "%s-%s" % (range_start, range_end)
-
-    def range_list_to_string(self, ifname, vni_list):
-        range_list = [v for v in utils.ints_to_ranges(vni_list)]
-
-        if len(range_list) != 1 and len(range_list[0]) > 0:
-            self.logger.debug("%s: vlan-vni-map has duplicated ranges: %s" % (ifname, json.dumps(range_list, indent=4)))
-            self.log_error("misconfiguration detected - see debug output for details")
-
-        return self.range_to_string(range_list[0][0], range_list[0][1])
-
     def check_duplicate_vnis(self, ifaceobj, vlan_vni_dict):
         rev = {}
 
@@ -2553,53 +2592,6 @@ class bridge(Bridge, moduleBase):
 
         return True
 
-    def get_vlan_vni_ranges_from_dict(self, ifname, vlan_vni_dict):
-        """
-        Since bridge-vlan-vni-map is a multiline attribute, we expend all the ranges
-        and have all the vlan-vni mapping in vlan_vni_dict. We need to reconstruct the
-        ranges to execute iproute2 commands.
-
-        i.e. for a multiline vlan-vni configuration:
-            bridge-vlan-vni-map 1=1
-            bridge-vlan-vni-map 2=2
-            bridge-vlan-vni-map 3=3
-            bridge-vlan-vni-map 4=4
-
-        we will only execute a single ranged-command: vlan add dev vxlan48 vid 1-4 tunnel_info id 1-4
-
-        If we find duplicated vlan/vnis in ranges we raise an exception
-        """
-        vlan_vni_ranges = {}
-
-        def list_to_range(vlan_list, vni_list, range_dict):
-            if not vlan_list and not vni_list:
-                return
-            vlans = self.range_list_to_string(ifname, vlan_list)
-            vnis = self.range_list_to_string(ifname, vni_list)
-            range_dict[vlans] = vnis
-
-        current_vlan_range = []
-        current_vni_range = []
-
-        for vlan in sorted(vlan_vni_dict.keys()):
-            vni = vlan_vni_dict[vlan]
-
-            if not current_vlan_range:
-                current_vlan_range.append(vlan)
-                current_vni_range.append(vni)
-
-            else:
-                if vlan - 1 == current_vlan_range[-1] and vni - 1 == current_vni_range[-1]:
-                    current_vlan_range.append(vlan)
-                    current_vni_range.append(vni)
-                else:
-                    list_to_range(current_vlan_range, current_vni_range, vlan_vni_ranges)
-                    current_vlan_range = [vlan]
-                    current_vni_range = [vni]
-
-        list_to_range(current_vlan_range, current_vni_range, vlan_vni_ranges)
-        return vlan_vni_ranges
-
     def check_bridge_vlan_vni_map_reserved(self, ifaceobj, vlan_to_add):
         for vlan in sorted(vlan_to_add):
             self._handle_reserved_vlan(vlan, ifaceobj.name)
@@ -2611,9 +2603,7 @@ class bridge(Bridge, moduleBase):
         """
         vxlan_name = ifaceobj.name
         try:
-            self.iproute2.batch_start()
-
-            bridge_vlan_tunnel_info_running_config = self.iproute2.bridge_vlan_tunnel_show(vxlan_name)
+            bridge_vlan_tunnel_info_running_config = self.cache.get_vlan_vni_map(vxlan_name)
             all_user_config = {}
 
             for bridge_vlan_vni_map_entry in ifaceobj.get_attr_value("bridge-vlan-vni-map"):
@@ -2642,25 +2632,16 @@ class bridge(Bridge, moduleBase):
             for k, v in set(all_user_config.items()) - set(bridge_vlan_tunnel_info_running_config.items()):
                 vlan_vni_to_add[k] = v
 
-            vlan_vni_ranges_to_remove = self.get_vlan_vni_ranges_from_dict(ifaceobj.name, vlan_vni_to_remove)
-
             # check if we have duplicated vnis in the user configuration
             self.check_duplicate_vnis(ifaceobj, vlan_vni_to_add)
 
             # check reserved vlans
             self.check_bridge_vlan_vni_map_reserved(ifaceobj, vlan_vni_to_add.keys())
 
-            vlan_vni_ranges_to_add = self.get_vlan_vni_ranges_from_dict(ifaceobj.name, vlan_vni_to_add)
-
-            for vlan_range, vni_range in vlan_vni_ranges_to_remove.items():
-                self.iproute2.bridge_vlan_del_vid_list_self(vxlan_name, [vlan_range], False)
-                self.iproute2.bridge_vlan_del_vlan_tunnel_info(vxlan_name, vlan_range, vni_range)
-
-            for vlan_range, vni_range in vlan_vni_ranges_to_add.items():
-                self.iproute2.bridge_vlan_add_vid_list_self(vxlan_name, [vlan_range], False)
-                self.iproute2.bridge_vlan_add_vlan_tunnel_info(vxlan_name, vlan_range, vni_range)
-
-            self.iproute2.batch_commit()
+            # the vlans and their tunnel info are removed (then added) with
+            # one netlink message for all the ranges
+            self.netlink.link_del_bridge_vlan_tunnels(vxlan_name, vlan_vni_to_remove)
+            self.netlink.link_add_bridge_vlan_tunnels(vxlan_name, vlan_vni_to_add)
         except Exception as e:
             ifaceobj.set_status(ifaceStatus.ERROR)
             raise BridgeVlanVniMapError("%s: error while processing bridge-vlan-vni-map: %s" % (vxlan_name, str(e)))
@@ -26,6 +26,8 @@ class bridgevlan(Addon, moduleBase):
     """  ifupdown2 addon module to configure vlan attributes on a vlan
          aware bridge """
 
+    cacheable_dependency_info = True
+
     _modinfo = {
         "mhelp": "bridgevlan module configures vlan attributes on a vlan aware "
                  "bridge. This module only understands vlan interface name "
@@ -213,10 +213,10 @@ class ethtool(Addon, moduleBase):
             # Save default value
             # Load state data
             if not default_val:
-                ifaceobj.config[default] = [running_val]
+                ifaceobj.replace_config(default, running_val)
             elif config_val:
                 # resave for state
-                ifaceobj.config[default] = [default_val]
+                ifaceobj.replace_config(default, default_val)
 
             if not config_val:
                 config_val = default_val
@@ -30,6 +30,8 @@ except (ImportError, ModuleNotFoundError):
 
 
 class link(Addon, moduleBase):
+    cacheable_dependency_info = True
+
     _modinfo = {
         "mhelp": "create/configure link types. similar to ip-link",
         "attrs": {
@@ -42,6 +42,8 @@ class mstpctlFlags:
 class mstpctl(Addon, moduleBase):
     """  ifupdown2 addon module to configure mstp attributes """
 
+    cacheable_dependency_info = True
+
     _modinfo = {
         "mhelp": "mstp configuration module for bridges",
         "attrs": {
@@ -739,11 +741,14 @@ class mstpctl(Addon, moduleBase):
                 stp = utils.get_boolean_from_string(stp)
 
             if self.mstpd_running and stp:
+                # nested in the run_batch batch when run by level
                 self.mstpctlcmd.batch_start()
-                self._apply_bridge_settings(ifaceobj, ifaceobj_getfunc)
-                self._apply_bridge_port_settings_all(ifaceobj,
-                            ifaceobj_getfunc=ifaceobj_getfunc)
-                self.mstpctlcmd.batch_commit()
+                try:
+                    self._apply_bridge_settings(ifaceobj, ifaceobj_getfunc)
+                    self._apply_bridge_port_settings_all(ifaceobj,
+                                ifaceobj_getfunc=ifaceobj_getfunc)
+                finally:
+                    self.mstpctlcmd.batch_commit()
         except Exception as e:
             self.log_error(str(e), ifaceobj)
         if porterr:
@@ -1329,3 +1334,38 @@ class mstpctl(Addon, moduleBase):
                        ifaceobj_getfunc=ifaceobj_getfunc)
         else:
             op_handler(self, ifaceobj, ifaceobj_getfunc=ifaceobj_getfunc)
+
+    def run_batch(self, ifaceobjs, operation, ifaceobj_getfunc=None):
+        """ run mstp configuration on a level of interfaces (see
+        ifaceScheduler.run_iface_level_ops)
+
+        On pre-up the mstpctl commands of all the bridge ports are sent
+        in a single 'mstpctl batch' process instead of one mstpctl process
+        per port attribute.
+        """
+        if operation != 'pre-up':
+            for ifaceobj in ifaceobjs:
+                try:
+                    self.run(ifaceobj, operation,
+                             ifaceobj_getfunc=ifaceobj_getfunc)
+                except Exception as e:
+                    self.log_error(str(e), ifaceobj, raise_error=False)
+            return
+
+        self._init_command_handlers()
+        self.mstpctlcmd.batch_start()
+        try:
+            for ifaceobj in ifaceobjs:
+                self.mstpctlcmd.batch_set_owner(ifaceobj)
+                try:
+                    self.run(ifaceobj, operation,
+                             ifaceobj_getfunc=ifaceobj_getfunc)
+                except Exception as e:
+                    self.log_error(str(e), ifaceobj, raise_error=False)
+        finally:
+            # a failed batch is executed again interface by interface, the
+            # errors are reported on the interfaces whose commands failed
+            self.mstpctlcmd.batch_commit(
+                on_error=lambda ifaceobj, e: self.log_error(
+                    '%s: %s' %(ifaceobj.name, str(e)), ifaceobj,
+                    raise_error=False))
@@ -30,6 +30,8 @@ import os
 class openvswitch(Addon, moduleBase):
     """  ifupdown2 addon module to configure Openvswitch bridge """
 
+    cacheable_dependency_info = True
+
     _modinfo = {
         'mhelp': 'openvswitch module configure openvswitch bridges',
         'attrs': {
@@ -30,6 +30,8 @@ import os
 class openvswitch_port(Addon, moduleBase):
     """  ifupdown2 addon module to configure openvswitch ports """
 
+    cacheable_dependency_info = True
+
     _modinfo = {
         'mhelp': 'openvswitch module configure openvswitch ports',
         'attrs': {
@@ -29,6 +29,8 @@ class ppp(Addon, moduleBase):
     """
     ifupdown2 addon module to configure ppp
     """
+    cacheable_dependency_info = True
+
     _modinfo = {
         'mhelp': 'create/configure ppp interfaces',
         'attrs': {
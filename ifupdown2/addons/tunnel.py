@@ -32,6 +32,8 @@ class tunnel(Addon, moduleBase):
     """
     ifupdown2 addon module to configure tunnels
     """
+    cacheable_dependency_info = True
+
     _modinfo = {
         'mhelp': 'create/configure GRE/IPIP/SIT and GRETAP tunnel interfaces',
         'attrs': {
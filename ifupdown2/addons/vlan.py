@@ -27,6 +27,8 @@ except (ImportError, ModuleNotFoundError):
 class vlan(Addon, moduleBase):
     """  ifupdown2 addon module to configure vlans """
 
+    cacheable_dependency_info = True
+
     _modinfo = {
         "mhelp": "vlan module configures vlan interfaces. "
                  "This module understands vlan interfaces with dot "
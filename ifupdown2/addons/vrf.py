@@ -4,11 +4,13 @@
 # Author: Roopa Prabhu, roopa@cumulusnetworks.com
 #
 
-import re
 import os
+import errno
+import socket
 import fcntl
 import atexit
 import signal
+import threading
 
 try:
     from ifupdown2.lib.addon import Addon
@@ -20,7 +22,9 @@ try:
     from ifupdown2.ifupdown.iface import ifaceRole, ifaceLinkKind, ifaceLinkPrivFlags, ifaceLinkType
     from ifupdown2.ifupdown.utils import utils
 
+    from ifupdown2.lib.nlcache import FibRule
     from ifupdown2.nlmanager.nlmanager import Link
+    from ifupdown2.nlmanager.sockdiag import SockDiag, get_socket_pids, TCPF_CONNECTED
 
     from ifupdown2.ifupdownaddons.dhclient import dhclient
     from ifupdown2.ifupdownaddons.utilsbase import *
@@ -35,7 +39,9 @@ except (ImportError, ModuleNotFoundError):
     from ifupdown.iface import ifaceRole, ifaceLinkKind, ifaceLinkPrivFlags, ifaceLinkType
     from ifupdown.utils import utils
 
+    from lib.nlcache import FibRule
     from nlmanager.nlmanager import Link
+    from nlmanager.sockdiag import SockDiag, get_socket_pids, TCPF_CONNECTED
 
     from ifupdownaddons.dhclient import dhclient
     from ifupdownaddons.utilsbase import *
@@ -73,6 +79,10 @@ class vrf(Addon, moduleBase):
     VRF_TABLE_START = 1001
     VRF_TABLE_END = 5000
 
+    VRF_RULE_PREF = 200
+    RULE_FAMILIES = (socket.AF_INET, socket.AF_INET6)
+    RT_TABLE_LOCAL = 255
+
     system_reserved_rt_tables = {
         "255": "local",
         "254": "main",
@@ -112,39 +122,16 @@ class vrf(Addon, moduleBase):
                 except Exception as e:
                     self.logger.debug('vrf: removing file failed (%s)'
                                       %str(e))
-        try:
-            ip_rules = utils.exec_command('%s rule show'
-                                          %utils.ip_cmd).splitlines()
-            self.ip_rule_cache = [' '.join(r.split()) for r in ip_rules]
-        except Exception as e:
-            self.ip_rule_cache = []
-            self.logger.warning('vrf: cache v4: %s' % str(e))
-
-        try:
-            ip_rules = utils.exec_command('%s -6 rule show'
-                                          %utils.ip_cmd).splitlines()
-            self.ip6_rule_cache = [' '.join(r.split()) for r in ip_rules]
-        except Exception as e:
-            self.ip6_rule_cache = []
-            self.logger.warning('vrf: cache v6: %s' % str(e))
-
-        #self.logger.debug("vrf: ip rule cache")
-        #self.logger.info(self.ip_rule_cache)
-
-        #self.logger.info("vrf: ip -6 rule cache")
-        #self.logger.info(self.ip6_rule_cache)
-
+        # the fib rules are dumped over netlink on first use (see
+        # _add_vrf_rules): the l3mdev rule is added by the kernel when the
+        # first vrf device is created
         self.l3mdev_checked = False
-        self.l3mdev4_rule = False
-        if self._l3mdev_rule(self.ip_rule_cache):
-            self.l3mdev4_rule = True
-            self.l3mdev_checked = True
-        self.l3mdev6_rule = False
-        if self._l3mdev_rule(self.ip6_rule_cache):
-            self.l3mdev6_rule = True
-            self.l3mdev_checked = True
         self._iproute2_vrf_map_initialized = False
         self.iproute2_vrf_map = {}
+        # with -j the vrf stanzas are run concurrently: the vrf map (and
+        # the map file), the table id allocation and the vrf count are
+        # only accessed with this lock held
+        self._vrf_map_lock = threading.RLock()
         self.iproute2_vrf_map_sync_to_disk = False
 
         self.vrf_table_id_start = policymanager.policymanager_api.get_module_globals(module_name=self.__class__.__name__, attr='vrf-table-id-start')
@@ -202,6 +189,10 @@ class vrf(Addon, moduleBase):
         return True
 
     def _iproute2_vrf_map_initialize(self, writetodisk=True):
+        with self._vrf_map_lock:
+            self._iproute2_vrf_map_initialize_nolock(writetodisk)
+
+    def _iproute2_vrf_map_initialize_nolock(self, writetodisk=True):
         if self._iproute2_vrf_map_initialized:
             return
 
@@ -344,16 +335,17 @@ class vrf(Addon, moduleBase):
         return None
 
     def _get_avail_vrf_table_id(self):
-        if self.last_used_vrf_table == None:
-            table_id_start = self.vrf_table_id_start
-        else:
-            table_id_start = self.last_used_vrf_table + 1
-        for t in range(table_id_start, self.vrf_table_id_end + 1):
-            if (not self.iproute2_vrf_map.get(t)
-                    and t not in self.user_reserved_vrf_table):
-                self.last_used_vrf_table = t
-                return str(t)
-        return None
+        with self._vrf_map_lock:
+            if self.last_used_vrf_table == None:
+                table_id_start = self.vrf_table_id_start
+            else:
+                table_id_start = self.last_used_vrf_table + 1
+            for t in range(table_id_start, self.vrf_table_id_end + 1):
+                if (not self.iproute2_vrf_map.get(t)
+                        and t not in self.user_reserved_vrf_table):
+                    self.last_used_vrf_table = t
+                    return str(t)
+            return None
 
     def _iproute2_is_vrf_tableid_inuse(self, vrfifaceobj, table_id):
         old_vrf_name = self.iproute2_vrf_map.get(int(table_id))
@@ -362,15 +354,16 @@ class vrf(Addon, moduleBase):
                            %(table_id, old_vrf_name), vrfifaceobj)
 
     def _iproute2_vrf_table_entry_add(self, vrfifaceobj, table_id):
-        old_vrf_name = self.iproute2_vrf_map.get(int(table_id))
-        if not old_vrf_name:
-            self.iproute2_vrf_map[int(table_id)] = vrfifaceobj.name
-            with open(self.iproute2_vrf_filename, "a+") as vrf_map_fd:
-                vrf_map_fd.write('%s %s\n'
-                                 % (table_id, vrfifaceobj.name))
-                vrf_map_fd.flush()
-                self.vrf_count += 1
-            return
+        with self._vrf_map_lock:
+            old_vrf_name = self.iproute2_vrf_map.get(int(table_id))
+            if not old_vrf_name:
+                self.iproute2_vrf_map[int(table_id)] = vrfifaceobj.name
+                with open(self.iproute2_vrf_filename, "a+") as vrf_map_fd:
+                    vrf_map_fd.write('%s %s\n'
+                                     % (table_id, vrfifaceobj.name))
+                    vrf_map_fd.flush()
+                    self.vrf_count += 1
+                return
         if old_vrf_name != vrfifaceobj.name:
             self.log_error('table id %d already assigned to vrf dev %s'
                            %(table_id, old_vrf_name))
@@ -378,8 +371,9 @@ class vrf(Addon, moduleBase):
     def _iproute2_vrf_table_entry_del(self, table_id):
         try:
             # with any del of vrf map, we need to force sync to disk
-            self.iproute2_vrf_map_sync_to_disk = True
-            del self.iproute2_vrf_map[int(table_id)]
+            with self._vrf_map_lock:
+                self.iproute2_vrf_map_sync_to_disk = True
+                del self.iproute2_vrf_map[int(table_id)]
         except Exception as e:
             self.logger.info('vrf: iproute2 vrf map del failed for %s (%s)'
                              %(table_id, str(e)))
@@ -532,117 +526,66 @@ class vrf(Addon, moduleBase):
                     return True
         return False
 
+    def _get_vrf_rules(self, vrf_dev_name, vrf_table, families):
+        """ returns the set of iif/oif rules of the vrf, i.e. for ipv4:
+            200: from all oif blue lookup blue
+            200: from all iif blue lookup blue
+        """
+        try:
+            table = int(vrf_table)
+        except (TypeError, ValueError):
+            table = self.cache.get_link_info_data_attribute(vrf_dev_name, Link.IFLA_VRF_TABLE)
+        if not table:
+            return set()
+        rules = set()
+        for family in families:
+            rules.add(FibRule(family, self.VRF_RULE_PREF, table,
+                              oifname=vrf_dev_name))
+            rules.add(FibRule(family, self.VRF_RULE_PREF, table,
+                              iifname=vrf_dev_name))
+        return rules
+
     def _del_vrf_rules(self, vrf_dev_name, vrf_table):
-        pref = 200
-        ip_rule_out_format = '%s: from all %s %s lookup %s'
-        ip_rule_cmd = '%s %s rule del pref %s %s %s table %s'
-
-        rule = ip_rule_out_format %(pref, 'oif', vrf_dev_name, vrf_dev_name)
-        if rule in self.ip_rule_cache:
-            rule_cmd = ip_rule_cmd %(utils.ip_cmd,
-                                     '', pref, 'oif', vrf_dev_name,
-                                     vrf_dev_name)
-            utils.exec_command(rule_cmd)
-
-        rule = ip_rule_out_format %(pref, 'iif', vrf_dev_name, vrf_dev_name)
-        if rule in self.ip_rule_cache:
-            rule_cmd = ip_rule_cmd %(utils.ip_cmd,
-                                     '', pref, 'iif', vrf_dev_name,
-                                     vrf_dev_name)
-            utils.exec_command(rule_cmd)
-
-        rule = ip_rule_out_format %(pref, 'oif', vrf_dev_name, vrf_dev_name)
-        if rule in self.ip6_rule_cache:
-            rule_cmd = ip_rule_cmd %(utils.ip_cmd,
-                                     '-6', pref, 'oif', vrf_dev_name,
-                                     vrf_dev_name)
-            utils.exec_command(rule_cmd)
-
-        rule = ip_rule_out_format %(pref, 'iif', vrf_dev_name, vrf_dev_name)
-        if rule in self.ip6_rule_cache:
-            rule_cmd = ip_rule_cmd %(utils.ip_cmd,
-                                     '-6', pref, 'iif', vrf_dev_name,
-                                     vrf_dev_name)
-            utils.exec_command(rule_cmd)
-
-    def _l3mdev_rule(self, ip_rules):
-        for rule in ip_rules:
-            if not re.search(r"\d.*from\s+all\s+lookup\s+\W?l3mdev-table\W?",
-                             rule):
+        rules = self._get_vrf_rules(vrf_dev_name, vrf_table,
+                                    self.RULE_FAMILIES)
+        running_rules = set()
+        for family in self.RULE_FAMILIES:
+            running_rules.update(self.netlink.get_rules(family))
+        self.netlink.rules_del(rules & running_rules)
+
+    def _l3mdev_rule(self, family):
+        return any(rule.l3mdev for rule in self.netlink.get_rules(family))
+
+    def _fix_local_table_rules(self, vrf_dev_name):
+        """ moves the local table lookup after the vrf rules:
+            0: from all lookup local -> 32765: from all lookup local
+        """
+        for family in self.RULE_FAMILIES:
+            rule = FibRule(family, 0, self.RT_TABLE_LOCAL)
+            if rule not in self.netlink.get_rules(family):
                 continue
-            return True
-        return False
-
-    def _rule_cache_fill(self):
-        ip_rules = utils.exec_command('%s rule show'
-                                      %utils.ip_cmd).splitlines()
-        self.ip_rule_cache = [' '.join(r.split()) for r in ip_rules]
-        self.l3mdev4_rule = self._l3mdev_rule(self.ip_rule_cache)
-        ip_rules = utils.exec_command('%s -6 rule show'
-                                      %utils.ip_cmd).splitlines()
-        self.ip6_rule_cache = [' '.join(r.split()) for r in ip_rules]
-        self.l3mdev6_rule = self._l3mdev_rule(self.ip6_rule_cache)
+            try:
+                self.netlink.rules_del([rule])
+                self.netlink.rules_add([FibRule(family, 32765,
+                                                self.RT_TABLE_LOCAL)])
+            except Exception as e:
+                self.logger.info('%s: %s' % (vrf_dev_name, str(e)))
+                pass
 
     def _add_vrf_rules(self, vrf_dev_name, vrf_table):
-        pref = 200
-        ip_rule_out_format = '%s: from all %s %s lookup %s'
-        ip_rule_cmd = '%s %s rule add pref %s %s %s table %s'
+        if not self.l3mdev_checked:
+            self.netlink.rules_flush_cache()
+            self.l3mdev_checked = True
+
         if self.vrf_fix_local_table:
             self.vrf_fix_local_table = False
-            rule = '0: from all lookup local'
-            if rule in self.ip_rule_cache:
-                try:
-                    utils.exec_command('%s rule del pref 0'
-                                       %utils.ip_cmd)
-                    utils.exec_command('%s rule add pref 32765 table local'
-                                       %utils.ip_cmd)
-                except Exception as e:
-                    self.logger.info('%s: %s' % (vrf_dev_name, str(e)))
-                    pass
-            if rule in self.ip6_rule_cache:
-                try:
-                    utils.exec_command('%s -6 rule del pref 0'
-                                       %utils.ip_cmd)
-                    utils.exec_command('%s -6 rule add pref 32765 table local'
-                                       %utils.ip_cmd)
-                except Exception as e:
-                    self.logger.info('%s: %s' % (vrf_dev_name, str(e)))
-                    pass
+            self._fix_local_table_rules(vrf_dev_name)
 
-        if not self.l3mdev_checked:
-            self._rule_cache_fill()
-            self.l3mdev_checked = True
-        #Example ip rule
-        #200: from all oif blue lookup blue
-        #200: from all iif blue lookup blue
-
-        rule = ip_rule_out_format %(pref, 'oif', vrf_dev_name, vrf_dev_name)
-        if not self.l3mdev4_rule and rule not in self.ip_rule_cache:
-            rule_cmd = ip_rule_cmd %(utils.ip_cmd,
-                                     '', pref, 'oif', vrf_dev_name,
-                                     vrf_dev_name)
-            utils.exec_command(rule_cmd)
-
-        rule = ip_rule_out_format %(pref, 'iif', vrf_dev_name, vrf_dev_name)
-        if not self.l3mdev4_rule and rule not in self.ip_rule_cache:
-            rule_cmd = ip_rule_cmd %(utils.ip_cmd,
-                                     '', pref, 'iif', vrf_dev_name,
-                                     vrf_dev_name)
-            utils.exec_command(rule_cmd)
-
-        rule = ip_rule_out_format %(pref, 'oif', vrf_dev_name, vrf_dev_name)
-        if not self.l3mdev6_rule and rule not in self.ip6_rule_cache:
-            rule_cmd = ip_rule_cmd %(utils.ip_cmd,
-                                     '-6', pref, 'oif', vrf_dev_name,
-                                     vrf_dev_name)
-            utils.exec_command(rule_cmd)
-
-        rule = ip_rule_out_format %(pref, 'iif', vrf_dev_name, vrf_dev_name)
-        if not self.l3mdev6_rule and rule not in self.ip6_rule_cache:
-            rule_cmd = ip_rule_cmd %(utils.ip_cmd,
-                                     '-6', pref, 'iif', vrf_dev_name,
-                                     vrf_dev_name)
-            utils.exec_command(rule_cmd)
+        families = [f for f in self.RULE_FAMILIES if not self._l3mdev_rule(f)]
+        rules = self._get_vrf_rules(vrf_dev_name, vrf_table, families)
+        for family in families:
+            rules.difference_update(self.netlink.get_rules(family))
+        self.netlink.rules_add(rules)
 
     def _is_address_virtual_slaves(self, vrfobj, config_vrfslaves,
                                    vrfslave):
@@ -723,6 +666,12 @@ class vrf(Addon, moduleBase):
         return False
 
     def _create_vrf_dev(self, ifaceobj, vrf_table):
+        # the table id check (or allocation), the vrf creation and the vrf
+        # map update of a vrf must not interleave with another vrf's
+        with self._vrf_map_lock:
+            return self._create_vrf_dev_nolock(ifaceobj, vrf_table)
+
+    def _create_vrf_dev_nolock(self, ifaceobj, vrf_table):
         if not self.cache.link_exists(ifaceobj.name):
             self._check_vrf_system_reserved_names(ifaceobj)
 
@@ -812,6 +761,25 @@ class vrf(Addon, moduleBase):
         except Exception as e:
             self.log_error('%s: %s' %(ifaceobj.name, str(e)), ifaceobj)
 
+    def _get_ssh_session_pid(self):
+        """ returns the pid of the sshd process of our ssh session (the
+        first sshd ancestor whose parent is also sshd, not the ssh server) """
+        ancestors = []
+        pid = os.getpid()
+        while pid > 1:
+            try:
+                with open('/proc/%d/stat' % pid) as f:
+                    # <pid> (<comm>) <state> <ppid> ...
+                    comm, stat = f.read().split('(', 1)[1].rsplit(')', 1)
+            except (IOError, OSError, IndexError, ValueError):
+                break
+            ancestors.append((pid, comm))
+            pid = int(stat.split()[1])
+        for (pid, comm), (_, parent_comm) in zip(ancestors, ancestors[1:]):
+            if comm == 'sshd' and parent_comm == 'sshd':
+                return pid
+        return None
+
     def _kill_ssh_connections(self, ifacename, ifaceobj):
         try:
             iplist = [str(ip.ip) for ip in self.cache.get_managed_ip_addresses(
@@ -821,48 +789,28 @@ class vrf(Addon, moduleBase):
 
             if not iplist:
                 return
-            proc=[]
-            #Example output:
-            #ESTAB      0      0      10.0.1.84:ssh       10.0.1.228:45186
-            #users:(("sshd",pid=2528,fd=3))
-            cmdl = [utils.ss_cmd, '-t', '-p']
-            for line in utils.exec_commandl(cmdl).splitlines():
-                citems = line.split()
-                addr = None
-                if '%' in citems[3]:
-                    addr = citems[3].split('%')[0]
-                elif ':ssh' in citems[3]:
-                    addr = citems[3].split(':')[0]
-                if not addr:
-                    continue
-                if addr in iplist:
-                    if len(citems) == 6:
-                        proc.append(citems[5].split(',')[1].split('=')[1])
+            # ss -t -p: ssh connections on our addresses and their processes
+            with SockDiag() as sock_diag:
+                sockets = sock_diag.get_sockets(protocols=[socket.IPPROTO_TCP],
+                                                states=TCPF_CONNECTED,
+                                                local_addresses=iplist,
+                                                local_port=22)
+            proc = set()
+            for pids in get_socket_pids([s.inode for s in sockets]).values():
+                proc.update(pids)
 
             if not proc:
                 return
-            pid = None
-            # outpt of '/usr/bin/pstree -Aps <pid>':
-            # 'systemd(1)---sshd(990)---sshd(16112)---sshd(16126)---bash(16127)---sudo(16756)---ifreload(16761)---pstree(16842)\n'
-            # get the above output to following format
-            # ['systemd(1)', 'sshd(990)', 'sshd(16112)', 'sshd(16126)', 'bash(16127)', 'sudo(16756)', 'ifreload(16761)', 'pstree(16850)']
-            pstree = list(reversed(utils.exec_command('%s -Aps %s' %
-                                                       (utils.pstree_cmd, os.getpid())).strip().split('---')))
-            for index, process in enumerate(pstree):
-                # check the parent of SSH process to make sure
-                # we don't kill SSH server or systemd process
-                if 'sshd' in process and 'sshd' in pstree[index + 1]:
-                    pid = [x for x in process if x.isdigit()]
-                    break
+            pid = self._get_ssh_session_pid()
             self.logger.info("%s: killing active ssh sessions: %s"
-                             %(ifacename, str(proc)))
+                             %(ifacename, str(sorted(proc))))
 
             if ifupdownflags.flags.DRYRUN:
                 return
             for id in proc:
                 if id != pid:
                     try:
-                        os.kill(int(id), signal.SIGINT)
+                        os.kill(id, signal.SIGINT)
                     except OSError as e:
                         continue
 
@@ -882,8 +830,8 @@ class vrf(Addon, moduleBase):
                         self.logger.info("pid=%d  pgid=%d" % (os.getpid(), os.getpgid(0)))
                 try:
                     self.logger.info("%s: killing our session: %s"
-                                     %(ifacename, str(proc)))
-                    os.kill(int(pid), signal.SIGINT)
+                                     %(ifacename, pid))
+                    os.kill(pid, signal.SIGINT)
                     return
                 except OSError as e:
                     return
@@ -943,12 +891,24 @@ class vrf(Addon, moduleBase):
         if not ifindex:
             return
 
+        # ss -aK "dev == <ifindex>"
         try:
-            utils.exec_command('%s -aK \"dev == %s\"'
-                               %(utils.ss_cmd, ifindex))
+            with SockDiag() as sock_diag:
+                sockets = sock_diag.get_sockets(ifindex=ifindex)
+                if not sockets:
+                    return
+                if ifupdownflags.flags.DRYRUN:
+                    self.log_info_dry_run('%s: closing %d sockets'
+                                          %(ifacename, len(sockets)))
+                    return
+                errors = sock_diag.destroy(sockets)
+            for sock, error in errors:
+                if error != errno.ENOENT:
+                    self.logger.info('%s: closing socket %s failed (%s)'
+                                     %(ifacename, sock, os.strerror(error)))
         except Exception as e:
-            self.logger.info('%s: closing socks using ss'
-                             ' failed (%s)' %(ifacename, str(e)))
+            self.logger.info('%s: closing socks failed (%s)'
+                             %(ifacename, str(e)))
             pass
 
     def _down_vrf_dev(self, ifaceobj, vrf_table, ifaceobj_getfunc=None):
@@ -18,7 +18,6 @@ try:
     from ifupdown2.ifupdown.iface import ifaceLinkKind, ifaceLinkPrivFlags, ifaceStatus, iface
     from ifupdown2.ifupdown.utils import utils
     from ifupdown2.ifupdown.statemanager import statemanager_api as statemanager
-    from ifupdown2.ifupdownaddons.cache import *
     from ifupdown2.ifupdownaddons.modulebase import moduleBase
 
 except (ImportError, ModuleNotFoundError):
@@ -35,7 +34,6 @@ except (ImportError, ModuleNotFoundError):
     from ifupdown.utils import utils
     from ifupdown.statemanager import statemanager_api as statemanager
 
-    from ifupdownaddons.cache import *
     from ifupdownaddons.modulebase import moduleBase
 
 
@@ -1049,7 +1047,10 @@ class vxlan(Vxlan, moduleBase):
                 self.logger.error("%s: %s (%s)" %(ifaceobj.name, vlan_vni_map, str(e)))
                 return
 
-        self.iproute2.bridge_link_update_vni_filter(ifaceobj.name, vnisd)
+        try:
+            self.netlink.vxlan_vni_filter_update(ifaceobj.name, vnisd)
+        except Exception as e:
+            self.logger.error("%s: vni filter update failed: %s" % (ifaceobj.name, str(e)))
 
     def check_and_raise_svd_tvd_errors(self, ifaceobj):
         err = self.svd_tvd_errors.get(ifaceobj.name)
@@ -1110,7 +1111,7 @@ class vxlan(Vxlan, moduleBase):
         self.__config_vxlan_udp_csum(ifaceobj, link_exists, user_request_vxlan_info_data, cached_vxlan_ifla_info_data)
         local = self.__config_vxlan_local_tunnelip(ifname, ifaceobj, link_exists, user_request_vxlan_info_data, cached_vxlan_ifla_info_data)
 
-        vxlan_vni = self.__get_vxlan_vni_list(ifaceobj)
+        vxlan_vni = self.__get_vxlan_vni_list(ifaceobj, string=False)
 
         vxlan_mcast_grp = self.__get_vxlan_attribute(ifaceobj, "vxlan-mcastgrp")
         vxlan_svcnodeip = self.__get_vxlan_attribute(ifaceobj, "vxlan-svcnodeip")
@@ -1202,28 +1203,14 @@ class vxlan(Vxlan, moduleBase):
                         return
 
         if ifaceobj.link_privflags & ifaceLinkPrivFlags.L3VXI:
-            add_vni = True
-            if link_exists:
-                running_vxlan_vni_set = set()
-
-                for obj in json.loads(utils.exec_command("bridge -j -p vni show dev %s" % ifname) or "[]"):
-                    for vni_obj in obj.get("vnis", []):
-                        start = vni_obj.get("vni")
-                        end = vni_obj.get("vniEnd")
-
-                        for vni in utils.ranges_to_ints(["%s-%s" % (start, end if end else start)]):
-                            running_vxlan_vni_set.add(vni)
-
-                if running_vxlan_vni_set != set(utils.ranges_to_ints([vxlan_vni])):
-                    self.iproute2.bridge_vni_int_set_del(ifname, running_vxlan_vni_set)
+            user_config_vnis = dict.fromkeys(vxlan_vni or [])
+            try:
+                if link_exists:
+                    self.netlink.vxlan_vni_filter_update(ifname, user_config_vnis)
                 else:
-                    add_vni = False
-
-            if add_vni:
-                try:
-                    self.iproute2.bridge_vni_add(ifname, vxlan_vni)
-                except Exception as e:
-                    self.logger.warning("%s: l3 vxlan vni failure: %s" % (ifname, e))
+                    self.netlink.vxlan_vni_filter_add(ifname, user_config_vnis)
+            except Exception as e:
+                self.logger.warning("%s: l3 vxlan vni failure: %s" % (ifname, e))
 
         if ifaceobj.link_privflags & ifaceLinkPrivFlags.SINGLE_VXLAN:
             if vxlan_vnifilter and utils.get_boolean_from_string(vxlan_vnifilter):
@@ -1547,15 +1534,7 @@ class vxlan(Vxlan, moduleBase):
         # not ideal but will work for now, l3vxi dev:
         if ifaceobj.link_privflags & ifaceLinkPrivFlags.L3VXI:
             user_config_vni_list = set(self.__get_vxlan_vni_list(ifaceobj, string=False))
-            vxlan_vni_list = set()
-
-            for obj in json.loads(utils.exec_command("bridge -j -p vni show dev %s" % ifname) or "[]"):
-                for vni_obj in obj.get("vnis", []):
-                    start = vni_obj.get("vni")
-                    end = vni_obj.get("vniEnd")
-
-                    for vni in utils.ranges_to_ints(["%s-%s" % (start, end if end else start)]):
-                        vxlan_vni_list.add(vni)
+            vxlan_vni_list = set(self.netlink.get_vxlan_vni_filter(ifname))
 
             ifaceobjcurr.update_config_with_status(
                 "vxlan-vni",
@@ -1584,16 +1563,13 @@ class vxlan(Vxlan, moduleBase):
                     fdb_remote.setdefault(int(src_vni), []).append(ip)
 
         if user_mcastgrp_map:
-            for obj in json.loads(utils.exec_command("bridge -j -p vni show dev %s" % ifname) or "[]"):
-                for vni in obj.get("vnis", []):
-                    group = vni.get("group")
-
-                    if not group:
-                        continue
+            for vni, group in self.netlink.get_vxlan_vni_filter(ifname).items():
+                if not group:
+                    continue
 
-                    # we need to reconvert back to ipaddress.IPv4Address because
-                    # the existing code uses this type of obj (namely: __get_vxlan_mcastgrp_map)
-                    fdb_mcast[vni.get("vni")] = IPv4Address(group)
+                # we need to reconvert back to ipaddress.IPv4Address because
+                # the existing code uses this type of obj (namely: __get_vxlan_mcastgrp_map)
+                fdb_mcast[vni] = IPv4Address(group)
 
         #
         # vxlan-mcastgrp-map
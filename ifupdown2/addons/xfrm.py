@@ -42,6 +42,8 @@ class xfrm(Addon, moduleBase):
     """
     ifupdown2 addon module to create a xfrm interface
     """
+    cacheable_dependency_info = True
+
     _modinfo = {
         'mhelp': 'xfrm module creates a xfrm interface for',
         'attrs': {
@@ -96,6 +96,8 @@ class Parse:
         if self.op == 'reload':
             if not self.args.all and not self.args.currentlyup and not self.args.CLASS:
                 raise ArgvParseError("'-a' or '-c' or '-allow' option is required")
+            if getattr(self.args, 'delta', False) and self.args.currentlyup:
+                raise ArgvParseError("'--delta' option is mutually exclusive with '-c'")
         elif not self.args.iflist and not self.args.all and not self.args.CLASS:
             raise ArgvParseError("'-a' option or interface list are required")
 
@@ -104,6 +106,9 @@ class Parse:
 
         if self.op != 'reload' and self.args.CLASS and self.args.all:
             raise ArgvParseError("'--allow' option is mutually exclusive with '-a'")
+
+        if getattr(self.args, 'jobs', 1) < 1:
+            raise ArgvParseError("'-j' option requires a positive number of jobs")
         return True
 
     def get_op(self):
@@ -159,6 +164,9 @@ class Parse:
                            choices=['list', 'dot'], help='print iface dependency')
         group.add_argument('--no-scripts', '--admin-state', dest='noaddons', action='store_true',
                            help='dont run any addon modules/scripts. Only bring the interface administratively up/down')
+        argparser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                               help='number of interfaces to configure in parallel. Independent subtrees '
+                                    'of the dependency graph (eg. bonds and their slaves) are run concurrently')
 
     def update_ifup_argparser(self, argparser):
         argparser.add_argument('-s', '--syntax-check', dest='syntaxcheck',
@@ -192,6 +200,8 @@ class Parse:
                            help='check interface file contents against running state of an interface')
         group.add_argument('-x', '--raw', action='store_true', dest='raw', help='print raw config file entries')
         group.add_argument('--print-savedstate', action='store_true', dest='printsavedstate', help=argparse.SUPPRESS)
+        group.add_argument('--changed', action='store_true', dest='changed',
+                           help='list the interfaces whose config changed since the last saved state')
         argparser.add_argument('-o', '--format', dest='format', default='native',
                                choices=['native', 'json'], help='interface display format')
         argparser.add_argument('-p', '--print-dependency', dest='printdependency',
@@ -220,8 +230,9 @@ class Parse:
         argparser.add_argument('--perfmode', dest='perfmode', action='store_true', help=argparse.SUPPRESS)
         argparser.add_argument('--nocache', dest='nocache', action='store_true', help=argparse.SUPPRESS)
         argparser.add_argument('-X', '--exclude', dest='excludepats', action='append', help=argparse.SUPPRESS)
-        # argparser.add_argument('-j', '--jobs', dest='jobs', type=int,
-        #            default=-1, choices=range(1,12), help=argparse.SUPPRESS)
+        argparser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                               help='number of interfaces to configure in parallel. Independent subtrees '
+                                    'of the dependency graph (eg. bonds and their slaves) are run concurrently')
         # argparser.add_argument('-i', '--interfaces', dest='interfacesfile',
         #            default='/etc/network/interfaces',
         #            help='use interfaces file instead of default ' +
@@ -236,6 +247,10 @@ class Parse:
         argparser.add_argument('-f', '--force', dest='force', action='store_true', help='force run all operations')
         argparser.add_argument('-s', '--syntax-check', dest='syntaxcheck', action='store_true',
                                help='Only run the interfaces file parser')
+        argparser.add_argument('--delta', dest='delta', action='store_true',
+                               help='only reload the interfaces whose configuration changed since the last '
+                                    'run, and their upper and lower interfaces. Unchanged interfaces are '
+                                    'skipped (use -v for a summary). Not supported with -c')
 
     def update_common_argparser(self, argparser):
         ''' general parsing rules '''
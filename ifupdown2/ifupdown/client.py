@@ -31,7 +31,6 @@ import logging
 import logging.handlers
 
 import os
-import re
 import sys
 import json
 import socket
@@ -147,18 +146,7 @@ class Client(SocketIO):
         signal.signal(signal.SIGTERM, self.__signal_handler)
         signal.signal(signal.SIGQUIT, self.__signal_handler)
 
-        try:
-            self.SO_PEERCRED = socket.SO_PEERCRED
-        except AttributeError:
-            # powerpc is the only non-generic we care about. alpha, mips,
-            # sparc, and parisc also have non-generic values.
-            machine = os.uname()[4]
-            if re.search(r"^(ppc|powerpc)", machine):
-                self.SO_PASSCRED = 20
-                self.SO_PEERCRED = 21
-            else:
-                self.SO_PASSCRED = 16
-                self.SO_PEERCRED = 17
+        self.init_socket_cred_options()
         try:
             self.uds.setsockopt(socket.SOL_SOCKET, self.SO_PASSCRED, 1)
         except Exception as e:
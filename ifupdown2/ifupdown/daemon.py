@@ -0,0 +1,276 @@
+# Copyright (C) 2017, 2018, 2019 Cumulus Networks, Inc. all rights reserved
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+# https://www.gnu.org/licenses/gpl-2.0-standalone.html
+#
+# Author:
+#       Julien Fortin, julien@cumulusnetworks.com
+#
+# ifupdown2 daemon-side
+#
+
+import io
+import os
+import sys
+import json
+import stat
+import socket
+import signal
+import logging
+import argparse
+import contextlib
+
+from datetime import datetime
+
+try:
+    from ifupdown2.lib.io import SocketIO
+    from ifupdown2.lib.status import Status
+    from ifupdown2.lib.log import LogManager, root_logger
+    from ifupdown2.lib.nlcache import NetlinkListenerWithCache
+    from ifupdown2.lib.exceptions import ExitWithStatus, ExitWithStatusAndError
+
+    from ifupdown2.ifupdown.main import Ifupdown2
+    from ifupdown2.ifupdown.exceptions import ArgvParseError, ArgvParseHelp
+except (ImportError, ModuleNotFoundError):
+    from lib.io import SocketIO
+    from lib.status import Status
+    from lib.log import LogManager, root_logger
+    from lib.nlcache import NetlinkListenerWithCache
+    from lib.exceptions import ExitWithStatus, ExitWithStatusAndError
+
+    from ifupdown.main import Ifupdown2
+    from ifupdown.exceptions import ArgvParseError, ArgvParseHelp
+
+
+class DaemonRequestInterrupted(BaseException):
+    """
+    Raised (from the signal handler) in the main thread to abort the request
+    being processed. Like KeyboardInterrupt it doesn't inherit from Exception
+    so it isn't swallowed by the generic exception handlers of the request.
+    """
+    pass
+
+
+class Daemon(SocketIO):
+    """
+    ifupdown2d keeps a single NetlinkListenerWithCache alive across requests.
+    The listener thread keeps the cache in sync with the kernel (via the
+    RTM_NEWLINK/NEWADDR/NEWNETCONF notifications) so a request doesn't need
+    to dump links, addresses and netconf again. Addon modules are imported
+    once and stay in sys.modules for the lifetime of the daemon.
+
+    Requests are processed one at a time, in the main thread, in the order
+    they are accepted on the unix domain socket.
+    """
+
+    UDS_DIRECTORY = "/var/run/ifupdown2d"
+    UDS_PATH = "%s/uds" % UDS_DIRECTORY
+
+    def __init__(self, argv):
+        SocketIO.__init__(self)
+
+        self.args = self.parse_argv(argv)
+
+        LogManager.get_instance().start_daemon_logging(self.args)
+
+        root_logger.info("starting ifupdown2d (pid %s)..." % os.getpid())
+
+        self.init_socket_cred_options()
+
+        self.uds = None
+        self.shutdown_flag = False
+        self.processing_request = False
+
+        # init the netlink cache once - the same cache instance will then be
+        # shared by all requests. ifupdownMain(daemon=True) doesn't restart it
+        start_time = datetime.now()
+        NetlinkListenerWithCache.init(logging.DEBUG if self.args.nldebug else logging.WARNING)
+        NetlinkListenerWithCache.get_instance().start()
+        root_logger.info("netlink cache ready in %s" % (datetime.now() - start_time))
+
+        # NetlinkListenerWithCache overrides SIGTERM, the daemon needs its own
+        # handler so it can abort the current request or exit gracefully
+        signal.signal(signal.SIGINT, self.__signal_handler)
+        signal.signal(signal.SIGTERM, self.__signal_handler)
+        signal.signal(signal.SIGQUIT, self.__signal_handler)
+
+        self.__bind_uds()
+
+    @staticmethod
+    def parse_argv(argv):
+        argparser = argparse.ArgumentParser(description="ifupdown2 daemon")
+        argparser.add_argument("-v", "--verbose", dest="verbose", action="store_true", help="verbose")
+        argparser.add_argument("-d", "--debug", dest="debug", action="store_true", help="output debug info")
+        argparser.add_argument("--console", dest="console", action="store_true", help="log on stderr")
+        argparser.add_argument("--nldebug", dest="nldebug", action="store_true", help="print netlink debug messages")
+        try:
+            return argparser.parse_args(argv[1:])
+        except SystemExit:
+            for help_str in ("-h", "--help"):
+                if help_str in argv:
+                    raise ArgvParseHelp()
+            raise ArgvParseError("invalid arguments: %s" % " ".join(argv[1:]))
+
+    def __bind_uds(self):
+        if not os.path.exists(self.UDS_DIRECTORY):
+            os.makedirs(self.UDS_DIRECTORY)
+
+        try:
+            # remove stale socket left by a previous instance
+            os.unlink(self.UDS_PATH)
+        except OSError:
+            pass
+
+        self.uds = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.uds.setsockopt(socket.SOL_SOCKET, self.SO_PASSCRED, 1)
+            self.uds.bind(self.UDS_PATH)
+            # root only: the requests run as root in the daemon (templates,
+            # interfaces file given with -i...). Non-root ifquery doesn't go
+            # through the daemon, it runs with the user's own privileges
+            os.chmod(self.UDS_PATH, stat.S_IRUSR | stat.S_IWUSR)
+            self.uds.listen(16)
+        except Exception as e:
+            self.__shutdown()
+            raise ExitWithStatusAndError(
+                status=Status.Daemon.STATUS_SOCKET_ERROR,
+                message="%s: %s" % (self.UDS_PATH, str(e))
+            )
+
+    def __shutdown(self):
+        try:
+            if self.uds:
+                self.uds.close()
+                self.uds = None
+        except Exception:
+            pass
+        try:
+            os.unlink(self.UDS_PATH)
+        except OSError:
+            pass
+        try:
+            if NetlinkListenerWithCache.is_init():
+                NetlinkListenerWithCache.get_instance().cleanup()
+        except Exception:
+            pass
+
+    def __signal_handler(self, sig, frame):
+        """
+        The client forwards SIGINT/SIGTERM/SIGQUIT to the daemon. If a request
+        is being processed we only abort that request, otherwise we exit.
+        """
+        if self.processing_request:
+            raise DaemonRequestInterrupted()
+
+        root_logger.info("ifupdown2d: caught signal %s, shutting down" % sig)
+        self.shutdown_flag = True
+        raise ExitWithStatus(status=Status.Daemon.STATUS_SUCCESS)
+
+    def run(self):
+        try:
+            while not self.shutdown_flag:
+                try:
+                    connection, _ = self.uds.accept()
+                except socket.error as e:
+                    root_logger.error("ifupdown2d: accept: %s" % str(e))
+                    continue
+
+                try:
+                    self.handle_connection(connection)
+                finally:
+                    connection.close()
+
+            return Status.Daemon.STATUS_SUCCESS
+        except ExitWithStatus as e:
+            return e.status
+        finally:
+            self.__shutdown()
+
+    def handle_connection(self, connection):
+        start_time = datetime.now()
+        pid, uid, _ = self.get_socket_peer_cred(connection)
+
+        try:
+            request = self.rx_json_packet(connection)
+        except Exception as e:
+            root_logger.error("ifupdown2d: client %s: invalid request: %s" % (pid, str(e)))
+            return
+
+        if not request or not request.get("argv"):
+            return
+
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+
+        self.processing_request = True
+        try:
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                status = self.process_request(uid, request)
+        finally:
+            self.processing_request = False
+
+        root_logger.info(
+            "ifupdown2d: client %s: \"%s\" exit status %s in %s"
+            % (pid, " ".join(request["argv"]), status, datetime.now() - start_time)
+        )
+
+        try:
+            self.tx_data(connection, json.dumps({
+                "stdout": stdout.getvalue(),
+                "stderr": stderr.getvalue(),
+                "status": status
+            }))
+        except Exception as e:
+            root_logger.error("ifupdown2d: client %s: cannot send response: %s" % (pid, str(e)))
+
+    def process_request(self, uid, request):
+        log_manager = LogManager.get_instance()
+        ifupdown2 = Ifupdown2(daemon=True, uid=uid)
+
+        try:
+            try:
+                ifupdown2.parse_argv(request["argv"])
+            except ArgvParseHelp:
+                return Status.Client.STATUS_SUCCESS
+            except (ArgvParseError, SystemExit) as e:
+                sys.stderr.write("error: %s\n" % str(e))
+                return Status.Client.STATUS_ARGV_ERROR
+
+            # stream this request's LogRecord to the client
+            log_manager.start_stream()
+            log_manager.set_request_logging_level(ifupdown2.args)
+
+            try:
+                return ifupdown2.main(request.get("stdin"))
+            except DaemonRequestInterrupted:
+                root_logger.error("ifupdown2d: request interrupted")
+                return Status.Daemon.STATUS_KEYBOARD_INTERRUPT
+            except Exception as e:
+                root_logger.error("ifupdown2d: request: %s" % str(e))
+                return Status.Daemon.STATUS_REQUEST_EXCEPTION
+        except DaemonRequestInterrupted:
+            return Status.Daemon.STATUS_KEYBOARD_INTERRUPT
+        finally:
+            # closing the log stream unblocks the client's LogRecord receiver
+            try:
+                log_manager.close_log_stream()
+            except Exception:
+                pass
+            log_manager.enable_syslog()
+            log_manager.set_daemon_logging_level(self.args)
+
+            # the cache may have pending errors for failed requests
+            NetlinkListenerWithCache.get_instance().reset_errorq()
@@ -14,12 +14,18 @@ file. But can be extended to include any other network interface format
 """
 
 import json
+import hashlib
 import logging
+import threading
 
 from collections import OrderedDict
 
 log = logging.getLogger()
 
+# state/status updates can come from the scheduler worker threads (-j), the
+# lock is global (not per iface) so iface objects can still be pickled
+_state_lock = threading.Lock()
+
 
 class ifaceStatusUserStrs():
     """ This class declares strings user can see during an ifquery --check
@@ -453,6 +459,8 @@ class iface():
         # types of dependencies
         self.dependency_type = ifaceDependencyType.UNKNOWN
         self.blacklisted = False
+        self._config_fingerprint = None
+        """stanza fingerprint (see get_config_fingerprint)"""
 
     def _set_attrs_from_dict(self, attrdict):
         self.auto = attrdict.get('auto', False)
@@ -464,6 +472,18 @@ class iface():
         if addr_family:
             self.addr_family.append(addr_family)
 
+    @property
+    def config(self):
+        """interface config/attributes (OrderedDict attrname: value list)"""
+        return self.__dict__['config']
+
+    @config.setter
+    def config(self, config):
+        # kept in __dict__ under its own name: the state file and the parse
+        # cache pickle the iface __dict__
+        self.__dict__['config'] = config
+        self._config_fingerprint = None
+
     def inc_refcnt(self):
         """ increment refcnt of the interface. Usually used to indicate that
         it has dependents """
@@ -491,14 +511,16 @@ class iface():
 
     def set_state_n_status(self, state, status):
         """ sets state and status of an interface """
-        self.state = state
-        if status > self.status:
-            self.status = status
+        with _state_lock:
+            self.state = state
+            if status > self.status:
+                self.status = status
 
     def set_status(self, status):
         """ sets status of an interface """
-        if status > self.status:
-            self.status = status
+        with _state_lock:
+            if status > self.status:
+                self.status = status
 
     def set_flag(self, flag):
         self.flags |= flag
@@ -575,20 +597,24 @@ class iface():
     def update_config(self, attr_name, attr_value):
         """ add attribute name and value to the interface config """
         self.config.setdefault(attr_name, []).append(attr_value)
+        self._config_fingerprint = None
 
     def replace_config(self, attr_name, attr_value):
         """ add attribute name and value to the interface config """
         self.config[attr_name] = [attr_value]
+        self._config_fingerprint = None
 
     def delete_config(self, attr_name):
         """ add attribute name and value to the interface config """
         try:
             del self.config[attr_name]
+            self._config_fingerprint = None
         except Exception:
             pass
 
     def update_config_dict(self, attrdict):
         self.config.update(attrdict)
+        self._config_fingerprint = None
 
     def update_config_with_status(self, attr_name, attr_value, attr_status=0):
         """ add attribute name and value to the interface config and also
@@ -597,6 +623,7 @@ class iface():
             attr_value = ''
         self.config.setdefault(attr_name, []).append(attr_value)
         self._config_status.setdefault(attr_name, []).append(attr_status)
+        self._config_fingerprint = None
         # set global iface state
         if attr_status == 1:
             self.status = ifaceStatus.ERROR
@@ -613,6 +640,7 @@ class iface():
                continue
             self.config.setdefault(attr_name, []).append('')
             self._config_status.setdefault(attr_name, []).append(attr_status)
+            self._config_fingerprint = None
 
     def get_config_attr_status(self, attr_name, idx=0):
         """ get status of a attribute config on this interface.
@@ -620,11 +648,35 @@ class iface():
         Looks at the iface _config_status dict"""
         return self._config_status.get(attr_name, [])[idx]
 
+    def get_config_fingerprint(self):
+        """ Returns a hash of the stanza: name, type, address family and
+        method, auto, classes and config. Objects that compare() equal have
+        the same fingerprint.
+
+        The fingerprint is computed when the stanza is parsed (see
+        update_config_fingerprint), cached, and saved with the state. The
+        config update methods and assigning config reset it. Changes made
+        to the config dict directly are not tracked: use update_config,
+        replace_config or delete_config """
+        if not self._config_fingerprint:
+            self.update_config_fingerprint()
+        return self._config_fingerprint
+
+    def update_config_fingerprint(self):
+        self._config_fingerprint = hashlib.sha1(repr((
+            self.name, self.type, self.addr_family, self.addr_method,
+            self.auto, self.classes, sorted(self.config.items())
+        )).encode()).hexdigest()
+        return self._config_fingerprint
+
     def compare(self, dstiface):
         """ compares iface object with iface object passed as argument
 
         Returns True if object self is same as dstiface and False otherwise """
 
+        # fast path: same stanza
+        if self.get_config_fingerprint() == dstiface.get_config_fingerprint():
+            return True
         if self.name != dstiface.name: return False
         if self.type != dstiface.type: return False
         if self.addr_family != dstiface.addr_family: return False
@@ -655,6 +707,7 @@ class iface():
         # we need to squash it
         if not self.auto and newifaceobj.auto:
             self.auto = True
+        self.update_config_fingerprint()
 
     def __getstate__(self):
         odict = self.__dict__.copy()
@@ -698,6 +751,8 @@ class iface():
         self.link_privflags = ifaceLinkPrivFlags.UNKNOWN
         self.dependency_type = ifaceDependencyType.UNKNOWN
         self.blacklisted = False
+        # state saved by an older version
+        self._config_fingerprint = None
         self.__dict__.update(dict)
 
     def dump_raw(self, logger):
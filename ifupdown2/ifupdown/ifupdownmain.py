@@ -9,6 +9,7 @@
 
 import re
 import os
+import time
 import logging
 import itertools
 import traceback
@@ -25,6 +26,8 @@ try:
 
     import ifupdown2.ifupdown.policymanager
     import ifupdown2.ifupdown.statemanager as statemanager
+    import ifupdown2.ifupdown.topology as topology
+    import ifupdown2.ifupdown.parsecache as parsecache
     import ifupdown2.ifupdown.ifupdownflags as ifupdownflags
     import ifupdown2.ifupdown.ifupdownconfig as ifupdownConfig
 
@@ -44,6 +47,8 @@ except (ImportError, ModuleNotFoundError):
     import ifupdown.ifupdownflags
     import ifupdown.policymanager
     import ifupdown.statemanager as statemanager
+    import ifupdown.topology as topology
+    import ifupdown.parsecache as parsecache
     import ifupdown.ifupdownflags as ifupdownflags
     import ifupdown.ifupdownconfig as ifupdownConfig
 
@@ -230,6 +235,16 @@ class ifupdownMain:
     def link_exists(self, ifacename):
         return os.path.exists('/sys/class/net/%s' %ifacename)
 
+    @staticmethod
+    def netlink_cache_lazy_mode(config, args):
+        """
+        Requests on a list of interfaces (i.e. ifup swp1, ifquery -c br0)
+        don't need a dump of every link and address in the system.
+        """
+        if not utils.get_boolean_from_string(config.get('netlink_cache_lazy_mode', '1')):
+            return False
+        return bool(getattr(args, 'iflist', None)) and not getattr(args, 'all', False)
+
     def __init__(self, config={}, args=None,
                  daemon=False, force=False, dryrun=False, nowait=False,
                  perfmode=False, withdepends=False, njobs=1,
@@ -261,11 +276,24 @@ class ifupdownMain:
             nlcache.NetlinkListenerWithCache.init(logging.DEBUG if args.nldebug else logging.WARNING)
 
             # start netlink listener and cache link/addr/netconf dumps
-            nlcache.NetlinkListenerWithCache.get_instance().start()
+            # (targeted requests only cache the devices they look up)
+            nlcache.NetlinkListenerWithCache.get_instance().start(
+                lazy=self.netlink_cache_lazy_mode(config, args)
+            )
 
         # save reference to nlcache
         self.netlink = nlcache.NetlinkListenerWithCache.get_instance()
         self.netlink.reset_errorq()
+        # the vni filter and the fib rules aren't refreshed by notifications,
+        # they might have changed since the last request (ifupdown2d)
+        self.netlink.vxlan_vni_filter_flush_cache()
+        self.netlink.rules_flush_cache()
+
+        # max number of reads per socket each time the netlink listener wakes up
+        try:
+            self.netlink.rx_drain_max = int(config.get('netlink_rx_drain_max', self.netlink.rx_drain_max))
+        except ValueError:
+            self.logger.warning('invalid netlink_rx_drain_max value: %s' % config.get('netlink_rx_drain_max'))
 
         # iface dictionary in the below format:
         # { '<ifacename>' : [<ifaceobject1>, <ifaceobject2> ..] }
@@ -325,6 +353,11 @@ class ifupdownMain:
         self.interfacesfile = interfacesfile
         self.interfacesfileiobuf = interfacesfileiobuf
         self.interfacesfileformat = interfacesfileformat
+        # time spent reading the interfaces file, and rendering templates
+        self.read_config_time = 0
+        self.template_render_time = 0
+        # parse cache of the interfaces file being read (see read_iface_config)
+        self._parse_cache = None
         self.config = config
         self.logger.debug(self.config)
         self.blacklisted_ifaces_present = False
@@ -366,6 +399,17 @@ class ifupdownMain:
                 traceback.print_exc()
         else:
             self.flags.STATEMANAGER_UPDATE = False
+
+        # answers of the addon modules dependency queries, persisted with
+        # the state (see topology.topologyCache)
+        self.topology = None
+        if (self.flags.STATEMANAGER_ENABLE and
+                utils.get_boolean_from_string(
+                    self.config.get('dependency_cache', '1'))):
+            self.topology = topology.topologyCache(
+                                self.statemanager.state_dir)
+            self.topology.load()
+
         self._delay_admin_state = True if self.config.get(
                             'delay_admin_state_change', '0') == '1' else False
         self._delay_admin_state_iface_queue = []
@@ -716,8 +760,9 @@ class ifupdownMain:
                 else:
                     if (not hasattr(module, 'get_dependent_ifacenames')):
                         continue
-                    dlist = module.get_dependent_ifacenames(ifaceobj,
-                                        ifacenames, old_ifaceobjs)
+                    dlist = self._query_dependency_info(module, ifaceobj,
+                                'lower', lambda: module.get_dependent_ifacenames(
+                                    ifaceobj, ifacenames, old_ifaceobjs))
             except Exception as e:
                 self.logger.warning("%s: %s: error getting dependent interfaces (%s)" % (ifaceobj.name, module, str(e)))
                 dlist = None
@@ -739,7 +784,9 @@ class ifupdownMain:
                 else:
                     if (not hasattr(module, 'get_upper_ifacenames')):
                         continue
-                    ulist = module.get_upper_ifacenames(ifaceobj, ifacenames)
+                    ulist = self._query_dependency_info(module, ifaceobj,
+                                'upper', lambda: module.get_upper_ifacenames(
+                                    ifaceobj, ifacenames))
             except Exception as e:
                 self.logger.warning('%s: error getting upper interfaces (%s)'
                                  %(ifaceobj.name, str(e)))
@@ -748,6 +795,14 @@ class ifupdownMain:
             if ulist: ret_ulist.extend(ulist)
         return list(set(ret_ulist))
 
+    def _query_dependency_info(self, module, ifaceobj, query, func):
+        """ Returns func() (the module answer to a dependency query), the
+        answer is replayed from the topology cache if the stanza didn't
+        change since it was recorded """
+        if self.topology:
+            return self.topology.query(module, ifaceobj, query, func)
+        return func()
+
     def _remove_circular_veth_dependencies(self, ifaceobj, dlist):
         # if ifaceobj isn't a veth link, ignore it.
         if ifaceobj.get_attr_value_first('link-type') != "veth":
@@ -1335,6 +1390,10 @@ class ifupdownMain:
                 a = attrsdict.get(attrname)
                 if a:
                     if a.get('deprecated'):
+                        if self._parse_cache:
+                            # the warning would be lost when replaying a
+                            # cached parse
+                            self._parse_cache.cacheable = False
                         newa = a.get('new-attribute')
                         if newa:
                             self.logger.warning('attribute %s is deprecated. use %s instead.' %(attrname, newa))
@@ -1369,13 +1428,33 @@ class ifupdownMain:
     def read_iface_config(self, raw=False):
         """ Reads default network interface config /etc/network/interfaces. """
         ret = True
+        start_time = time.time()
+        parse_cache = None
+        template_cache_dir = None
+        if (self.flags.STATEMANAGER_ENABLE and
+                utils.get_boolean_from_string(
+                    self.config.get('interfaces_parse_cache', '1'))):
+            parse_cache = parsecache.parseCache(
+                    self.statemanager.state_dir,
+                    readonly=(not self.flags.STATEMANAGER_UPDATE or
+                              os.geteuid() != 0))
+            # the syntax check depends on the enabled addon modules
+            for path in (ADDONS_CONF_PATH, IFUPDOWN2_ADDON_DROPIN_FOLDER):
+                if os.path.exists(path):
+                    parse_cache.add_file(path)
+        if (self.flags.STATEMANAGER_ENABLE and
+                utils.get_boolean_from_string(
+                    self.config.get('template_cache', '1'))):
+            template_cache_dir = os.path.join(self.statemanager.state_dir,
+                                              'templates')
         nifaces = networkInterfaces(self.interfacesfile,
                         self.interfacesfileiobuf,
                         self.interfacesfileformat,
                         template_enable=self.config.get('template_enable', 0),
                         template_engine=self.config.get('template_engine'),
                 template_lookuppath=self.config.get('template_lookuppath'),
-                                    raw=raw)
+                                    raw=raw, parse_cache=parse_cache,
+                                    template_cache_dir=template_cache_dir)
         if self._ifaceobj_squash or self._ifaceobj_squash_internal:
             nifaces.subscribe('iface_found', self._save_iface_squash)
         else:
@@ -1384,9 +1463,18 @@ class ifupdownMain:
             nifaces.subscribe('validateifaceattr',
                               self._iface_configattr_syntax_checker)
             nifaces.subscribe('validateifaceobj', self._ifaceobj_syntax_checker)
-        nifaces.load()
+        self._parse_cache = parse_cache
+        try:
+            nifaces.load()
+        finally:
+            self._parse_cache = None
         if nifaces.errors or nifaces.warns:
             ret = False
+        self.read_config_time = time.time() - start_time
+        self.template_render_time = nifaces.template_render_time
+        self.logger.info('interfaces file read in %.3f seconds (template '
+                         'rendering: %.3f seconds)'
+                         %(self.read_config_time, self.template_render_time))
 
         self._schedule_addon_translate()
         return ret
@@ -1394,7 +1482,8 @@ class ifupdownMain:
     def read_old_iface_config(self):
         """ Reads the saved iface config instead of default iface config.
         And saved iface config is already read by the statemanager """
-        self.ifaceobjdict = copy.deepcopy(self.statemanager.ifaceobjdict)
+        self.ifaceobjdict = copy.deepcopy(
+                OrderedDict(self.statemanager.ifaceobjdict.items()))
 
     def _load_addon_modules_config(self):
         """ Load addon modules config file """
@@ -1704,6 +1793,9 @@ class ifupdownMain:
         try:
             # Update persistant iface states
             self.statemanager.save_state()
+            if self.topology:
+                self.topology.save(self.statemanager.ifaceobjdict,
+                        self.statemanager.get_changed_ifacenames())
         except Exception as e:
             if self.logger.isEnabledFor(logging.DEBUG):
                 t = sys.exc_info()[2]
@@ -2018,6 +2110,9 @@ class ifupdownMain:
             except Exception:
                 raise
 
+        # removed stanzas are only listed if no iface list is given
+        list_removed = not ifacenames
+
         if ifacenames and ops[0] != 'query-running':
             # If iface list is given, always check if iface is present
             ifacenames = self._preprocess_ifacenames(ifacenames)
@@ -2045,6 +2140,10 @@ class ifupdownMain:
                 raise Exception('no ifaces found matching ' +
                         'given allow lists')
 
+        if ops[0] == 'query-changed':
+            return self.print_changed_ifaces(filtered_ifacenames, format,
+                                             list_removed)
+
         self.populate_dependency_info(ops)
         if ops[0] == 'query-dependency' and printdependency:
             self.print_dependency(filtered_ifacenames, printdependency)
@@ -2171,11 +2270,64 @@ class ifupdownMain:
         if not iface_read_ret or not ret:
             raise Exception()
 
+    def _get_reload_delta(self, old_ifaceobjdict, new_ifaceobjdict,
+                          new_dependency_graph, ifacedownlist):
+        """ returns the set of interfaces an ifreload --delta has to up:
+        stanzas added, changed or downed since the last run (compared by
+        stanza fingerprint) and their upper and lower interfaces closure
+        """
+        def fingerprints(ifaceobjs):
+            return [o.get_config_fingerprint() for o in ifaceobjs or []]
+
+        changed = set()
+        removed = set()
+        for ifname, ifaceobjs in new_ifaceobjdict.items():
+            if (fingerprints(ifaceobjs) !=
+                    fingerprints(old_ifaceobjdict.get(ifname))):
+                changed.add(ifname)
+            elif any(not topology.topologyCache.is_cacheable(o)
+                     for o in ifaceobjs):
+                # regex port lists depend on the interfaces present
+                # on the system
+                changed.add(ifname)
+        for ifname in old_ifaceobjdict.keys():
+            if ifname not in new_ifaceobjdict:
+                removed.add(ifname)
+        changed.update(i for i in ifacedownlist if i in new_ifaceobjdict)
+
+        uppers = {}
+        for ifname, lowers in new_dependency_graph.items():
+            for l in lowers or []:
+                uppers.setdefault(l, []).append(ifname)
+        # the upper interfaces of a removed interface must be updated
+        # (eg. port removed from a bridge)
+        seeds = set(changed)
+        for ifname in removed:
+            for o in old_ifaceobjdict.get(ifname) or []:
+                seeds.update(u for u in o.upperifaces or []
+                             if u in new_ifaceobjdict)
+            seeds.update(uppers.get(ifname, []))
+
+        delta = set()
+        for graph, start in ((uppers, seeds), (new_dependency_graph, changed)):
+            visited = set()
+            stack = list(start)
+            while stack:
+                ifname = stack.pop()
+                if ifname in visited:
+                    continue
+                visited.add(ifname)
+                stack.extend(graph.get(ifname) or [])
+            delta.update(visited)
+        return delta
+
     def _reload_default(self, upops, downops, auto=False, allow=None,
             ifacenames=None, excludepats=None, usecurrentconfig=False,
-            syntaxcheck=False, **extra_args):
+            syntaxcheck=False, delta=False, **extra_args):
         """ reload interface config """
         new_ifaceobjdict = {}
+        reload_delta = None
+        start_time = time.time()
 
         try:
             iface_read_ret = self.read_iface_config()
@@ -2363,6 +2515,12 @@ class ifupdownMain:
                         ifacedownlist.append(ifname)
                         continue
 
+            if delta and not ifupdownflags.flags.FORCE:
+                reload_delta = self._get_reload_delta(self.ifaceobjdict,
+                                                      new_ifaceobjdict,
+                                                      new_dependency_graph,
+                                                      ifacedownlist)
+
             if ifacedownlist:
                 self.logger.info('reload: scheduling down on interfaces: %s'
                                   %str(ifacedownlist))
@@ -2402,25 +2560,52 @@ class ifupdownMain:
             return
 
         if auto:
-            ifupdownflags.flags.ALL = True
+            # a delta reload only ups a subset of the interfaces, it
+            # runs like an ifup on that list (the dependents are already
+            # part of the list)
+            if reload_delta is None:
+                ifupdownflags.flags.ALL = True
             ifupdownflags.flags.WITH_DEPENDS = True
         # and now, we are back to the current config in ifaceobjdict
         self.ifaceobjdict = new_ifaceobjdict
         self.dependency_graph = new_dependency_graph
 
-        self.logger.info('reload: scheduling up on interfaces: %s'
-                         %str(new_filtered_ifacenames))
         ifupdownflags.flags.CACHE = True
         try:
-            ret = self._sched_ifaces(new_filtered_ifacenames, upops,
-                                     followdependents=True
-                                     if ifupdownflags.flags.WITH_DEPENDS
-                                     else False)
+            if reload_delta is not None:
+                delta_ifacenames = [i for i in new_filtered_ifacenames
+                                    if i in reload_delta]
+                self.logger.info('reload: scheduling up on changed interfaces: %s'
+                                 %str(delta_ifacenames))
+                ret = True
+                if delta_ifacenames:
+                    ret = self._sched_ifaces(delta_ifacenames, upops,
+                                             skipupperifaces=True,
+                                             followdependents=False,
+                                             sort=True)
+            else:
+                self.logger.info('reload: scheduling up on interfaces: %s'
+                                 %str(new_filtered_ifacenames))
+                ret = self._sched_ifaces(new_filtered_ifacenames, upops,
+                                         followdependents=True
+                                         if ifupdownflags.flags.WITH_DEPENDS
+                                         else False)
         except Exception as e:
             ret = None
             self.logger.error(str(e))
         finally:
             self._process_delay_admin_state_queue('up')
+        if reload_delta is not None:
+            self.logger.info('reload: %d interface(s) reloaded, %d unchanged '
+                             'interface(s) skipped in %.3f seconds (config '
+                             'read: %.3f seconds, template rendering: %.3f '
+                             'seconds)'
+                             %(len(delta_ifacenames),
+                               len(new_filtered_ifacenames) -
+                               len(delta_ifacenames),
+                               time.time() - start_time,
+                               self.read_config_time,
+                               self.template_render_time))
         if ifupdownflags.flags.DRYRUN:
             return
         self._save_state()
@@ -2472,6 +2657,40 @@ class ifupdownMain:
         for i in ifacenames:
             print(i)
 
+    def print_changed_ifaces(self, ifacenames, format='native',
+                             list_removed=False):
+        """ prints the stanzas that changed since the last saved state,
+        compared by fingerprint (the saved records aren't loaded) """
+        if not self.flags.STATEMANAGER_ENABLE:
+            raise Exception('state manager is disabled')
+        changed = []
+        for i in ifacenames:
+            fingerprints = [o.get_config_fingerprint()
+                            for o in self.get_ifaceobjs(i) or []
+                            if not self.is_ifaceobj_builtin(o)]
+            if not fingerprints:
+                continue
+            saved = self.statemanager.get_config_fingerprints(i)
+            if not saved:
+                changed.append((i, 'new', fingerprints, saved))
+            elif set(fingerprints) != set(saved):
+                changed.append((i, 'changed', fingerprints, saved))
+        if list_removed:
+            for i in self.statemanager.ifaceobjdict.keys():
+                if i not in self.ifaceobjdict:
+                    changed.append((i, 'removed', [],
+                                    self.statemanager.get_config_fingerprints(i)))
+        if format == 'json':
+            print(json.dumps([{'name': name, 'status': status,
+                               'fingerprints': fingerprints,
+                               'saved-fingerprints': saved}
+                              for name, status, fingerprints, saved in changed],
+                             indent=4, separators=(',', ': ')))
+        else:
+            for name, status, fingerprints, saved in changed:
+                print('%-8s %s %s' %(status, name,
+                                     ' '.join(fingerprints or saved)))
+
     def print_ifaceobjs_raw(self, ifacenames, format=None):
         """ prints raw lines for ifaces from config file """
 
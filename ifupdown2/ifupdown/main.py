@@ -62,7 +62,8 @@ class Ifupdown2:
         self.op = args_parse.get_op()
 
     def main(self, stdin_buffer=None):
-        if self.op != 'query' and self.uid != 0:
+        # the daemon runs the requests as root, it only serves root
+        if self.uid != 0 and (self.daemon or self.op != 'query'):
             raise Exception('must be root to run this command')
 
         try:
@@ -89,6 +90,11 @@ class Ifupdown2:
                 # if args and not args.debug:
                 #    print '\nrerun the command with \'-d\' for a detailed errormsg'
             return 1
+        finally:
+            if self.daemon and self.args:
+                # the daemon is a long-lived process, we need to release the
+                # lock otherwise the next request would find it still held
+                utils.unlockFile(self.args.lockfile)
         return 0
 
     def init(self, stdin_buffer):
@@ -176,6 +182,7 @@ class Ifupdown2:
                                                                  withdepends=args.withdepends,
                                                                  perfmode=args.perfmode,
                                                                  dryrun=args.noact,
+                                                                 njobs=args.jobs,
                                                                  cache=cachearg,
                                                                  addons_enable=not args.noaddons,
                                                                  statemanager_enable=not args.noaddons,
@@ -209,6 +216,7 @@ class Ifupdown2:
                                                                  withdepends=args.withdepends,
                                                                  perfmode=args.perfmode,
                                                                  dryrun=args.noact,
+                                                                 njobs=args.jobs,
                                                                  addons_enable=not args.noaddons,
                                                                  statemanager_enable=not args.noaddons,
                                                                  interfacesfile=self.interfaces_filename,
@@ -241,6 +249,8 @@ class Ifupdown2:
                 qop = 'query-dependency'
             elif args.printsavedstate:
                 qop = 'query-savedstate'
+            elif args.changed:
+                qop = 'query-changed'
             else:
                 qop = 'query'
             cachearg = (False if (iflist or args.nocache or args.syntaxhelp or
@@ -279,13 +289,15 @@ class Ifupdown2:
                                                                  interfacesfile=self.interfaces_filename,
                                                                  withdepends=args.withdepends,
                                                                  perfmode=args.perfmode,
-                                                                 dryrun=args.noact)
+                                                                 dryrun=args.noact,
+                                                                 njobs=args.jobs)
             ifupdown_handle.reload(['pre-up', 'up', 'post-up'],
                                    ['pre-down', 'down', 'post-down'],
                                    auto=args.all, allow=args.CLASS, ifacenames=None,
                                    excludepats=args.excludepats,
                                    usecurrentconfig=args.usecurrentconfig,
                                    syntaxcheck=args.syntaxcheck,
-                                   currentlyup=args.currentlyup)
+                                   currentlyup=args.currentlyup,
+                                   delta=args.delta)
         except Exception:
             raise
@@ -10,9 +10,9 @@
 import collections
 import copy
 import glob
+import io
 import logging
 import os
-import re
 
 try:
     from ifupdown2.ifupdown.iface import ifaceType, ifaceJsonDecoder, iface
@@ -36,7 +36,8 @@ class networkInterfaces():
     def __init__(self, interfacesfile='/etc/network/interfaces',
                  interfacesfileiobuf=None, interfacesfileformat='native',
                  template_enable='0', template_engine=None,
-                 template_lookuppath=None, raw=False):
+                 template_lookuppath=None, raw=False, parse_cache=None,
+                 template_cache_dir=None):
         """This member function initializes the networkinterfaces parser object.
 
         Kwargs:
@@ -50,6 +51,10 @@ class networkInterfaces():
 
             **template_lookuppath** (str): template lookup path
 
+            **template_cache_dir** (str): directory for the compiled templates
+
+            **parse_cache** (object): parseCache object, to reuse the result of the previous parse if the files didn't change
+
         Raises:
             AttributeError, KeyError """
 
@@ -64,6 +69,8 @@ class networkInterfaces():
         self.allow_classes = {'auto': []}
         # auto is only an aliases of allow-auto
         self.auto_ifaces = self.allow_classes['auto']
+        # class name: set of interfaces, for lookups
+        self._allow_class_sets = {'auto': set()}
         self.interfacesfile = interfacesfile
         self.interfacesfileiobuf = interfacesfileiobuf
         self.interfacesfileformat = interfacesfileformat
@@ -73,13 +80,21 @@ class networkInterfaces():
         self._template_enable = template_enable
         self._template_engine_name = template_engine
         self._template_engine_path = template_lookuppath
+        self._template_cache_dir = template_cache_dir
 
         self._currentfile_has_template = False
-        self._ws_split_regex = re.compile(r'[\s\t]\s*')
+        self._parse_cache = parse_cache
 
         self.errors = 0
         self.warns = 0
 
+    @property
+    def template_render_time(self):
+        """ time spent rendering templates (seconds) """
+        if not self._template_engine:
+            return 0
+        return self._template_engine.render_time
+
     @property
     def _currentfile(self):
         try:
@@ -145,6 +160,7 @@ class networkInterfaces():
     def _add_ifaces_to_class(self, classname, ifaces):
         if classname not in self.allow_classes:
             self.allow_classes[classname] = []
+            self._allow_class_sets[classname] = set()
 
         # This is a specific uses case: everything is considered auto if all
         # is being given to the auto or allow-auto classe.
@@ -155,11 +171,55 @@ class networkInterfaces():
         for ifname in ifaces:
             ifnames = utils.expand_iface_range(ifname) or [ifname]
             self.allow_classes[classname].extend(ifnames)
-
-    def process_allow(self, lines, cur_idx, lineno):
-        allow_line = lines[cur_idx]
-
-        words = re.split(self._ws_split_regex, allow_line)
+            self._allow_class_sets[classname].update(ifnames)
+
+    def _tokenize(self, fileiter):
+        """ yields a (lineno, line, words) token for each line of fileiter
+        (an iterable of lines: file object, list...)
+
+        line continuations ('\\') are joined, lineno is the number of the
+        first line of the continued line. words is [keyword, rest of the
+        line], or None for the empty and comment lines (only yielded in raw
+        mode: they are part of the raw config) """
+        pending = None
+        for lineno, line in enumerate(fileiter, 1):
+            if pending is not None:
+                # the continuation eats the whitespaces and empty lines
+                line = line.lstrip()
+                if not line:
+                    continue
+                start, line = pending[0], '%s %s' %(pending[1], line)
+                pending = None
+            else:
+                start = lineno
+            if '\\' in line:
+                pieces = line.split('\\')
+                line = ' '.join(p.strip() for p in pieces[:-1])
+                if not pieces[-1].strip():
+                    pending = (start, line)
+                    continue
+                line = '%s %s' %(line, pieces[-1].lstrip())
+            line = line.strip(whitespaces)
+            if not line or line[0] == '#':
+                if self.raw:
+                    yield start, line, None
+                continue
+            yield start, line, line.split(None, 1)
+        if pending is not None:
+            yield pending[0], pending[1], pending[1].split(None, 1)
+
+    def _next_token(self, tokens):
+        """ returns the next keyword line token, empty and comment lines
+        are skipped """
+        for token in tokens:
+            if token[2]:
+                return token
+        return None
+
+    def process_allow(self, tokens, lineno, line, words):
+        allow_line = line
+
+        words = line.split()
         try:
             allow_class = words[0].split('-')[1]
             ifacenames = words[1:]
@@ -168,56 +228,62 @@ class networkInterfaces():
         except IndexError:
             raise Exception(f'invalid allow line {allow_line} at line {lineno}')
         self._add_ifaces_to_class(allow_class, ifacenames)
-        return 0
+        return self._next_token(tokens)
 
-    def process_source(self, lines, cur_idx, lineno):
+    def process_source(self, tokens, lineno, line, words):
         # Support regex
-        self.logger.debug('processing sourced line ..\'%s\'' % lines[cur_idx])
-        sourced_file = re.split(self._ws_split_regex, lines[cur_idx], 2)[1]
+        self.logger.debug('processing sourced line ..\'%s\'' % line)
+        sourced_file = words[1].split()[0] if len(words) > 1 else None
 
         if sourced_file:
             if not os.path.isabs(sourced_file):
                 sourced_file = os.path.join(os.path.dirname(self._currentfile), sourced_file)
 
+            if self._parse_cache and glob.has_magic(sourced_file):
+                self._parse_cache.add_glob(sourced_file)
             filenames = sorted(glob.glob(sourced_file))
             if not filenames:
                 if '*' not in sourced_file:
                     self._parse_warn(self._currentfile, lineno,
                             'cannot find source file %s' %sourced_file)
-                return 0
+                return self._next_token(tokens)
             for f in filenames:
                 self.read_file(f)
         else:
             self._parse_error(self._currentfile, lineno,
                     'unable to read source line')
-        return 0
+        return self._next_token(tokens)
 
-    def process_source_directory(self, lines, cur_idx, lineno):
-        self.logger.debug('processing source-directory line ..\'%s\'' % lines[cur_idx])
-        sourced_directory = re.split(self._ws_split_regex, lines[cur_idx], 2)[1]
+    def process_source_directory(self, tokens, lineno, line, words):
+        self.logger.debug('processing source-directory line ..\'%s\'' % line)
+        sourced_directory = words[1].split()[0] if len(words) > 1 else None
 
         if sourced_directory:
             if not os.path.isabs(sourced_directory):
                 sourced_directory = os.path.join(os.path.dirname(self._currentfile), sourced_directory)
 
+            if self._parse_cache and glob.has_magic(sourced_directory):
+                self._parse_cache.add_glob(sourced_directory)
             folders = glob.glob(sourced_directory)
             for folder in folders:
+                if self._parse_cache:
+                    self._parse_cache.add_file(folder)
                 for file in os.listdir(folder):
                     self.read_file(os.path.join(folder, file))
         else:
             self._parse_error(self._currentfile, lineno,
                               'unable to read source-directory line')
-        return 0
+        return self._next_token(tokens)
 
-    def process_auto(self, lines, cur_idx, lineno):
-        auto_ifaces = re.split(self._ws_split_regex, lines[cur_idx])[1:]
+    def process_auto(self, tokens, lineno, line, words):
+        auto_ifaces = line.split()[1:]
 
         if not auto_ifaces:
             self._parse_error(self._currentfile, lineno,
-                    'invalid auto line \'%s\''%lines[cur_idx])
+                    'invalid auto line \'%s\''%line)
         else:
             self._add_ifaces_to_class('auto', auto_ifaces)
-        return 0
+        return self._next_token(tokens)
 
     def _add_to_iface_config(self, ifacename, iface_config, attrname,
                              attrval, lineno):
@@ -254,12 +320,11 @@ class networkInterfaces():
         else:
             iface_config[newattrname].append(attrval)
 
-    def parse_iface(self, lines, cur_idx, lineno, ifaceobj):
-        lines_consumed = 0
-        line_idx = cur_idx
-
-        iface_line = lines[cur_idx].strip(whitespaces)
-        iface_attrs = re.split(self._ws_split_regex, iface_line)
+    def parse_iface(self, tokens, lineno, line, ifaceobj):
+        """ parses the iface line and the attribute lines that follow it,
+        returns the next keyword line token """
+        iface_line = line
+        iface_attrs = line.split()
         ifacename = iface_attrs[1]
 
         if (not utils.is_ifname_range(ifacename) and
@@ -281,29 +346,30 @@ class networkInterfaces():
         if self.raw:
             ifaceobj.raw_config.append(iface_line)
         iface_config = collections.OrderedDict()
-        for line_idx in range(cur_idx + 1, len(lines)):
-            l = lines[line_idx].strip(whitespaces)
-            if self.ignore_line(l) == 1:
-                if self.raw:
-                    ifaceobj.raw_config.append(l)
+        next_token = None
+        for token in tokens:
+            attr_lineno, l, attrs = token
+            if not attrs:
+                # empty and comment lines (raw mode)
+                ifaceobj.raw_config.append(l)
                 continue
-            attrs = re.split(self._ws_split_regex, l, 1)
             if self._is_keyword(attrs[0]):
-                line_idx -= 1
+                next_token = token
                 break
             # if not a keyword, every line must have at least a key and value
             if len(attrs) < 2:
-                self._parse_error(self._currentfile, line_idx,
+                self._parse_error(self._currentfile, attr_lineno,
                         'iface %s: invalid syntax \'%s\'' %(ifacename, l))
                 continue
             if self.raw:
                 ifaceobj.raw_config.append(l)
             attrname = attrs[0]
             # preprocess vars (XXX: only preprocesses $IFACE for now)
-            attrval = re.sub(r'\$IFACE', ifacename, attrs[1])
+            attrval = attrs[1]
+            if '$IFACE' in attrval:
+                attrval = attrval.replace('$IFACE', ifacename)
             self._add_to_iface_config(ifacename, iface_config, attrname,
-                                      attrval, line_idx+1)
-        lines_consumed = line_idx - cur_idx
+                                      attrval, attr_lineno)
 
         # Create iface object
         if ifacename.find(':') != -1:
@@ -323,14 +389,14 @@ class networkInterfaces():
             pass
         self._validate_addr_family(ifaceobj, lineno)
 
-        if self.auto_all or (ifaceobj.name in self.auto_ifaces):
+        if self.auto_all or (ifaceobj.name in self._allow_class_sets['auto']):
             ifaceobj.auto = True
 
         classes = self.get_allow_classes_for_iface(ifaceobj.name)
         if classes:
             [ifaceobj.set_class(c) for c in classes]
 
-        return lines_consumed       # Return next index
+        return next_token
 
     def _create_ifaceobj_clone(self, ifaceobj, newifaceobjname,
                                newifaceobjtype, newifaceobjflags):
@@ -351,38 +417,47 @@ class networkInterfaces():
             obj = self._create_ifaceobj_clone(iface_orig, name, iftype, flags)
             yield obj
 
-    def process_iface(self, lines, cur_idx, lineno):
+    def _iface_found(self, ifaceobj):
+        if self._parse_cache:
+            self._parse_cache.add_iface(ifaceobj)
+        self.callbacks['iface_found'](ifaceobj)
+
+    def process_iface(self, tokens, lineno, line, words):
         ifaceobj = iface()
-        lines_consumed = self.parse_iface(lines, cur_idx, lineno, ifaceobj)
-        found_cb = self.callbacks['iface_found']
+        next_token = self.parse_iface(tokens, lineno, line, ifaceobj)
+        found_cb = self._iface_found
         ifrange = utils.expand_iface_range(ifaceobj.name)
 
         if not ifrange:
+            ifaceobj.update_config_fingerprint()
             found_cb(ifaceobj)
 
         for ifclone in self._clone_iface_range(ifrange, ifaceobj):
             if utils.check_ifname_size_invalid(ifclone.name):
                 self._parse_warn(self._currentfile, lineno,
                                  f'{ifclone.name}: interface name too long')
+            ifclone.update_config_fingerprint()
             found_cb(ifclone)
 
-        return lines_consumed       # Return next index
+        return next_token
 
-    def process_vlan(self, lines, cur_idx, lineno):
+    def process_vlan(self, tokens, lineno, line, words):
         ifaceobj = iface()
-        lines_consumed = self.parse_iface(lines, cur_idx, lineno, ifaceobj)
-        found_cb = self.callbacks['iface_found']
+        next_token = self.parse_iface(tokens, lineno, line, ifaceobj)
+        found_cb = self._iface_found
         ifrange = utils.expand_iface_range(ifaceobj.name)
         iftype = ifaceType.BRIDGE_VLAN
 
         if not ifrange:
             ifaceobj.type = iftype
+            ifaceobj.update_config_fingerprint()
             found_cb(ifaceobj)
 
         for ifclone in self._clone_iface_range(ifrange, ifaceobj, iftype):
+            ifclone.update_config_fingerprint()
             found_cb(ifclone)
 
-        return lines_consumed       # Return next index
+        return next_token
 
     network_elems = {
         'source': process_source,
@@ -409,37 +484,28 @@ class networkInterfaces():
 
     def get_allow_classes_for_iface(self, ifacename):
         classes = []
-        for class_name, ifacenames in list(self.allow_classes.items()):
+        for class_name, ifacenames in self._allow_class_sets.items():
             if ifacename in ifacenames:
                 classes.append(class_name)
         return classes
 
-    def process_interfaces(self, filedata):
-
-        # process line continuations
-        filedata = ' '.join(d.strip() for d in filedata.split('\\'))
-
-        line_idx = 0
-        lines_consumed = 0
-        raw_config = filedata.split('\n')
-        lines = [l.strip(whitespaces) for l in raw_config]
-        while (line_idx < len(lines)):
-            if self.ignore_line(lines[line_idx]):
-                line_idx += 1
-                continue
-            words = re.split(self._ws_split_regex, lines[line_idx])
-            if not words:
-                line_idx += 1
-                continue
+    def process_interfaces(self, fileiter):
+        """ parses the lines of fileiter (file object, list of lines...) in
+        a single pass: the iface objects are handed to the iface_found
+        callback as their stanza ends """
+        tokens = self._tokenize(fileiter)
+        token = self._next_token(tokens)
+        while token:
+            lineno, line, words = token
             # Check if first element is a supported keyword
             if self._is_keyword(words[0]):
                 keyword_func = self._get_keyword_func(words[0])
-                lines_consumed = keyword_func(self, lines, line_idx, line_idx+1)
-                line_idx += lines_consumed
+                # the keyword functions return the next keyword line
+                token = keyword_func(self, tokens, lineno, line, words)
             else:
-                self._parse_error(self._currentfile, line_idx + 1,
-                        'error processing line \'%s\'' %lines[line_idx])
-            line_idx += 1
+                self._parse_error(self._currentfile, lineno,
+                        'error processing line \'%s\'' %line)
+                token = self._next_token(tokens)
         return 0
 
     def read_filedata(self, filedata):
@@ -451,12 +517,22 @@ class networkInterfaces():
                     self._template_engine = templateEngine(
                         template_engine=self._template_engine_name,
                         template_enable=self._template_enable,
-                        template_lookuppath=self._template_engine_path)
+                        template_lookuppath=self._template_engine_path,
+                        template_cache_dir=self._template_cache_dir)
                 rendered_filedata = self._template_engine.render(filedata)
                 if rendered_filedata is filedata:
                     self._currentfile_has_template = False
                 else:
                     self._currentfile_has_template = True
+                    if self._parse_cache:
+                        if self._template_engine._is_static(filedata):
+                            self._parse_cache.add_template_lookuppath(
+                                                self._template_engine_path)
+                        else:
+                            # the output might depend on anything (files,
+                            # commands, other templates): render it on
+                            # each run
+                            self._parse_cache.cacheable = False
             except Exception as e:
                 self._parse_error(self._currentfile, -1,
                                   'failed to render template (%s). Continue without template rendering ...'
@@ -468,9 +544,15 @@ class networkInterfaces():
                     # some template engine might return bytes but we want str
                     rendered_filedata = rendered_filedata.decode()
 
-                self.process_interfaces(rendered_filedata)
+                self.process_interfaces(io.StringIO(rendered_filedata))
                 return
-        self.process_interfaces(filedata)
+        self.process_interfaces(io.StringIO(filedata))
+
+    def _template_enabled(self):
+        # same test as templateEngine: the file must be read as a whole
+        # to be rendered, otherwise it is parsed as it is read
+        return (self._template_enable != '0' and
+                self._template_engine_name == 'mako')
 
     def read_file(self, filename, fileiobuf=None):
         if fileiobuf:
@@ -478,14 +560,31 @@ class networkInterfaces():
             return
         self._filestack.append(filename)
         self.logger.info('processing interfaces file %s' %filename)
+        if self._parse_cache:
+            # stat before reading: a file modified while it is read is
+            # parsed again on the next run
+            self._parse_cache.add_file(filename)
         try:
-            with open(filename) as f:
-                filedata = f.read()
+            f = open(filename)
         except Exception as e:
             self.logger.warning('error processing file %s (%s)',
                              filename, str(e))
+            if self._parse_cache:
+                self._parse_cache.cacheable = False
+            self._filestack.pop()
             return
-        self.read_filedata(filedata)
+        with f:
+            if self._template_enabled():
+                self.read_filedata(f.read())
+            else:
+                self._currentfile_has_template = False
+                try:
+                    self.process_interfaces(f)
+                except (OSError, UnicodeDecodeError) as e:
+                    self.logger.warning('error processing file %s (%s)',
+                                        filename, str(e))
+                    if self._parse_cache:
+                        self._parse_cache.cacheable = False
         self._filestack.pop()
 
     def read_file_json(self, filename, fileiobuf=None):
@@ -509,6 +608,7 @@ class networkInterfaces():
                 self._validate_addr_family(ifaceobj)
                 if not self.callbacks.get('validateifaceobj')(ifaceobj):
                     errors += 1
+                ifaceobj.update_config_fingerprint()
                 self.callbacks.get('iface_found')(ifaceobj)
         self.errors += errors
 
@@ -527,5 +627,26 @@ class networkInterfaces():
         if self.interfacesfileformat == 'json':
             return self.read_file_json(self.interfacesfile,
                                        self.interfacesfileiobuf)
-        return self.read_file(self.interfacesfile,
-                              self.interfacesfileiobuf)
+        if (not self._parse_cache or self.interfacesfileiobuf or self.raw):
+            return self.read_file(self.interfacesfile,
+                                  self.interfacesfileiobuf)
+        return self._load_cached()
+
+    def _load_cached(self):
+        """ reads the interfaces file, or replays the iface objects of the
+        previous parse if none of the files changed (see parseCache) """
+        key = (self.interfacesfile, self._template_enable,
+               self._template_engine_name, self._template_engine_path,
+               self.callbacks.get('validateifaceattr') is not None)
+        ifaceobjs = self._parse_cache.load(key)
+        if ifaceobjs is not None:
+            self.logger.info('processing interfaces file %s (cached)'
+                             %self.interfacesfile)
+            for ifaceobj in ifaceobjs:
+                self.callbacks['iface_found'](ifaceobj)
+            return
+        self.read_file(self.interfacesfile)
+        if self.errors or self.warns:
+            self._parse_cache.invalidate()
+        else:
+            self._parse_cache.save(key)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+#
+# Copyright 2014-2017 Cumulus Networks, Inc. All rights reserved.
+#
+# parseCache --
+#    persisted result of the interfaces file parser
+#
+
+import os
+import glob
+import pickle
+import logging
+
+try:
+    import ifupdown2.ifupdown.config as config
+    from ifupdown2.ifupdown.iface import iface
+except (ImportError, ModuleNotFoundError):
+    import ifupdown.config as config
+    from ifupdown.iface import iface
+
+
+class parseCache():
+    """ persisted result of the interfaces file parser
+
+    The parser records the iface objects it finds (as they are before the
+    iface_found callback) and the files and directories it reads: the
+    interfaces file, the sourced files, the directories listed by the
+    source, source-directory and glob lines and the template lookup path.
+
+    On the next run, if none of these files changed (same mtime, size and
+    inode) the recorded iface objects are handed to the iface_found
+    callback directly: the files are not read, rendered nor parsed again.
+
+    Parses with errors or warnings are not saved, so that they are
+    reported on every run. Neither are the files rendering dynamic
+    templates (see templateEngine._is_static): their output might change
+    while the files don't.
+    """
+
+    VERSION = 1
+
+    state_filename = 'ifstateparse'
+    """name of the parse cache file (in the state directory)"""
+
+    def __init__(self, state_dir, readonly=False):
+        self.logger = logging.getLogger('ifupdown.' +
+                    self.__class__.__name__)
+        self.state_file = '%s/%s' %(state_dir, self.state_filename)
+        # readonly: the cache is used but never written (queries, dry-run
+        # or non root users)
+        self.readonly = readonly
+        # path: stat signature of the files and directories read
+        self.files = {}
+        # pickled __dict__ of the iface objects found
+        self.ifaces = []
+        self.cacheable = True
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def add_file(self, path):
+        """ records a file or directory the parsed config depends on """
+        if path not in self.files:
+            self.files[path] = self._stat(path)
+
+    def add_glob(self, pattern):
+        """ records the directory listed by a glob pattern """
+        dirname = os.path.dirname(pattern)
+        if glob.has_magic(dirname):
+            # the directories themselves are matched by the pattern
+            self.cacheable = False
+            return
+        self.add_file(dirname)
+
+    def add_template_lookuppath(self, lookuppath):
+        for d in (lookuppath or '').split(':'):
+            if not d:
+                continue
+            self.add_file(d)
+            try:
+                for f in os.listdir(d):
+                    self.add_file(os.path.join(d, f))
+            except OSError:
+                pass
+
+    def add_iface(self, ifaceobj):
+        if self.cacheable:
+            self.ifaces.append(pickle.dumps(ifaceobj.__dict__,
+                                            pickle.HIGHEST_PROTOCOL))
+
+    def load(self, key):
+        """ returns the recorded iface objects if the cache is valid for
+        key (the parser settings) and the recorded files didn't change,
+        None otherwise """
+        try:
+            with open(self.state_file, 'rb') as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.logger.info('parse cache: %s: %s' %(self.state_file, str(e)))
+            return None
+        if (not isinstance(data, dict) or
+                data.get('version') != self.VERSION or
+                data.get('key') != (config.__version__, key)):
+            return None
+        for path, signature in data.get('files', {}).items():
+            if signature is None or self._stat(path) != signature:
+                self.logger.debug('parse cache: %s changed' %path)
+                return None
+        ifaceobjs = []
+        for d in data.get('ifaces', []):
+            ifaceobj = iface.__new__(iface)
+            ifaceobj.__dict__.update(pickle.loads(d))
+            ifaceobjs.append(ifaceobj)
+        return ifaceobjs
+
+    def save(self, key):
+        if self.readonly:
+            return
+        if not self.cacheable or None in self.files.values():
+            self.invalidate()
+            return
+        tmp_file = '%s.tmp' %self.state_file
+        try:
+            with open(tmp_file, 'wb') as f:
+                pickle.dump({'version': self.VERSION,
+                             'key': (config.__version__, key),
+                             'files': self.files,
+                             'ifaces': self.ifaces}, f,
+                            pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_file, self.state_file)
+        except Exception as e:
+            self.logger.debug('error saving parse cache (%s)' %str(e))
+            try:
+                os.unlink(tmp_file)
+            except OSError:
+                pass
+
+    def invalidate(self):
+        if self.readonly:
+            return
+        try:
+            os.unlink(self.state_file)
+        except OSError:
+            pass
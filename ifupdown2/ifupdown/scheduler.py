@@ -10,6 +10,7 @@
 import os
 import sys
 import traceback
+import concurrent.futures
 
 from collections import OrderedDict
 
@@ -19,6 +20,8 @@ try:
     from ifupdown2.ifupdown.iface import ifaceType, ifaceLinkKind, ifaceStatus, ifaceState
     from ifupdown2.ifupdown.utils import utils
     from ifupdown2.ifupdown.statemanager import *
+    from ifupdown2.ifupdown.upperindex import ifaceUpperIndex
+    from ifupdown2.lib.iproute2 import IPRoute2
 
     import ifupdown2.ifupdown.policymanager as policymanager
     import ifupdown2.ifupdown.ifupdownflags as ifupdownflags
@@ -27,6 +30,8 @@ except (ImportError, ModuleNotFoundError):
     from ifupdown.iface import ifaceType, ifaceLinkKind, ifaceStatus, ifaceState
     from ifupdown.utils import utils
     from ifupdown.statemanager import *
+    from ifupdown.upperindex import ifaceUpperIndex
+    from lib.iproute2 import IPRoute2
 
     import ifupdown.ifupdownflags as ifupdownflags
     import ifupdown.policymanager as policymanager
@@ -50,6 +55,9 @@ class ifaceScheduler():
 
     _SCHED_STATUS = True
 
+    # reverse dependency index of the current run (see sched_ifaces)
+    _UPPER_INDEX = None
+
     VRF_MGMT_DEVNAME = policymanager.policymanager_api.get_module_globals(
         module_name="vrf",
         attr="vrf-mgmt-devname"
@@ -115,50 +123,59 @@ class ifaceScheduler():
                 # Continue with rest of the modules
                 pass
             finally:
-                if err or ifaceobj.status == ifaceStatus.ERROR:
-                    ifaceobj.set_state_n_status(ifaceState.from_str(op),
-                                                ifaceStatus.ERROR)
-                    if 'up' in  op or 'down' in op or 'query-checkcurr' in op:
-                        cls.set_sched_status(False)
-                else:
-                    # Mark success only if the interface was not already
-                    # marked with error
-                    status = (ifaceobj.status
-                              if ifaceobj.status == ifaceStatus.ERROR
-                              else ifaceStatus.SUCCESS)
-                    ifaceobj.set_state_n_status(ifaceState.from_str(op),
-                                                status)
+                cls._set_iface_op_status(ifaceobj, op, err)
 
         if ifupdownobj.config.get('addon_scripts_support', '0') == '1':
-            # execute /etc/network/ scripts
-            command_env = (cenv or {}).copy()
-            command_env.update({
-                "IFACE": ifaceobj.name if ifaceobj.name else "",
-                "LOGICAL": ifaceobj.name if ifaceobj.name else "",
-                "METHOD": ifaceobj.addr_method if ifaceobj.addr_method else "",
-                "ADDRFAM": ','.join(ifaceobj.addr_family) if ifaceobj.addr_family else "",
-            })
-
-            for mname in ifupdownobj.script_ops.get(op, []):
-                ifupdownobj.logger.debug("%s: %s : running script %s" % (ifacename, op, mname))
-                try:
-                    utils.exec_command(mname, env=command_env, stdout=False)
-                except Exception as e:
-                    if "permission denied" in str(e).lower():
-                        ifupdownobj.logger.warning('%s: %s %s' % (ifacename, op, str(e)))
-                    else:
-                        ifupdownobj.log_error('%s: %s %s' % (ifacename, op, str(e)))
+            cls._run_iface_scripts(ifupdownobj, ifaceobj, op, cenv)
 
     @classmethod
-    def run_iface_list_ops(cls, ifupdownobj, ifaceobjs, ops):
-        """ Runs all operations on a list of interface
-            configurations for the same interface
-        """
+    def _set_iface_op_status(cls, ifaceobj, op, err):
+        """ Sets the state and status of ifaceobj once a module ran op """
+        if err or ifaceobj.status == ifaceStatus.ERROR:
+            ifaceobj.set_state_n_status(ifaceState.from_str(op),
+                                        ifaceStatus.ERROR)
+            if 'up' in  op or 'down' in op or 'query-checkcurr' in op:
+                cls.set_sched_status(False)
+        else:
+            # Mark success only if the interface was not already
+            # marked with error
+            status = (ifaceobj.status
+                      if ifaceobj.status == ifaceStatus.ERROR
+                      else ifaceStatus.SUCCESS)
+            ifaceobj.set_state_n_status(ifaceState.from_str(op),
+                                        status)
+
+    @classmethod
+    def _run_iface_scripts(cls, ifupdownobj, ifaceobj, op, cenv=None):
+        """ Executes the /etc/network/ scripts for op """
+        ifacename = ifaceobj.name
+        # execute /etc/network/ scripts
+        command_env = (cenv or {}).copy()
+        command_env.update({
+            "IFACE": ifaceobj.name if ifaceobj.name else "",
+            "LOGICAL": ifaceobj.name if ifaceobj.name else "",
+            "METHOD": ifaceobj.addr_method if ifaceobj.addr_method else "",
+            "ADDRFAM": ','.join(ifaceobj.addr_family) if ifaceobj.addr_family else "",
+        })
+
+        for mname in ifupdownobj.script_ops.get(op, []):
+            ifupdownobj.logger.debug("%s: %s : running script %s" % (ifacename, op, mname))
+            try:
+                utils.exec_command(mname, env=command_env, stdout=False)
+            except Exception as e:
+                if "permission denied" in str(e).lower():
+                    ifupdownobj.logger.warning('%s: %s %s' % (ifacename, op, str(e)))
+                else:
+                    ifupdownobj.log_error('%s: %s %s' % (ifacename, op, str(e)))
 
-        # minor optimization. If operation is 'down', proceed only
-        # if interface exists in the system
+    @classmethod
+    def _skip_iface_list_down(cls, ifupdownobj, ifaceobjs, ops):
+        """ minor optimization. If operation is 'down', proceed only
+        if interface exists in the system
+
+        Returns True if the ops should be skipped (the posthook was run)
+        """
         ifacename = ifaceobjs[0].name
-        ifupdownobj.logger.info('%s: running ops ...' %ifacename)
         if ('down' in ops[0] and
                 ifaceobjs[0].type != ifaceType.BRIDGE_VLAN and
                 ifaceobjs[0].addr_method != 'ppp' and
@@ -171,24 +188,25 @@ class ifaceScheduler():
                 for ifaceobj in ifaceobjs:
                     ifaceobj.status = ifaceStatus.SUCCESS
                     posthookfunc(ifupdownobj, ifaceobj, 'down')
-            return
-        for op in ops:
-            # first run ifupdownobj handlers. This is good enough
-            # for the first object in the list
-            handler = ifupdownobj.ops_handlers.get(op)
-            if handler:
-                try:
-                    handler(ifupdownobj, ifaceobjs[0])
-                except Exception as e:
-                    if not ifupdownobj.link_master_slave_ignore_error(str(e)):
-                       ifupdownobj.logger.warning('%s: %s'
-                                   %(ifaceobjs[0].name, str(e)))
-                    pass
-            for ifaceobj in ifaceobjs:
-                cls.run_iface_op(ifupdownobj, ifaceobj, op,
-                    cenv=ifupdownobj.generate_running_env(ifaceobj, op)
-                        if ifupdownobj.config.get('addon_scripts_support',
-                            '0') == '1' else None)
+            return True
+        return False
+
+    @classmethod
+    def _run_ops_handler(cls, ifupdownobj, ifaceobjs, op):
+        """ runs ifupdownobj handlers. This is good enough
+        for the first object in the list """
+        handler = ifupdownobj.ops_handlers.get(op)
+        if handler:
+            try:
+                handler(ifupdownobj, ifaceobjs[0])
+            except Exception as e:
+                if not ifupdownobj.link_master_slave_ignore_error(str(e)):
+                   ifupdownobj.logger.warning('%s: %s'
+                               %(ifaceobjs[0].name, str(e)))
+                pass
+
+    @classmethod
+    def _run_posthook(cls, ifupdownobj, ifaceobjs, ops):
         posthookfunc = ifupdownobj.sched_hooks.get('posthook')
         if posthookfunc:
             try:
@@ -198,6 +216,107 @@ class ifaceScheduler():
                 ifupdownobj.logger.warning('%s' %str(e))
                 pass
 
+    @classmethod
+    def run_iface_list_ops(cls, ifupdownobj, ifaceobjs, ops):
+        """ Runs all operations on a list of interface
+            configurations for the same interface
+        """
+        ifupdownobj.logger.info('%s: running ops ...' %ifaceobjs[0].name)
+        if cls._skip_iface_list_down(ifupdownobj, ifaceobjs, ops):
+            return
+        for op in ops:
+            # first run ifupdownobj handlers
+            cls._run_ops_handler(ifupdownobj, ifaceobjs, op)
+            for ifaceobj in ifaceobjs:
+                cls.run_iface_op(ifupdownobj, ifaceobj, op,
+                    cenv=ifupdownobj.generate_running_env(ifaceobj, op)
+                        if ifupdownobj.config.get('addon_scripts_support',
+                            '0') == '1' else None)
+        cls._run_posthook(ifupdownobj, ifaceobjs, ops)
+
+    @classmethod
+    def run_iface_level_ops(cls, ifupdownobj, ifaceobjs_list, ops):
+        """ Runs all operations on the interfaces of a graph level
+
+        ifaceobjs_list is a list of ifaceobjs lists (one per interface),
+        the interfaces of a level don't depend on each other. Each op is
+        run on the whole level, module by module: modules implementing
+        run_batch(ifaceobjs, op, ifaceobj_getfunc=None) get all the
+        interface objects of the level in a single call, the other
+        modules are run interface by interface (see run_iface_op).
+
+        run_batch should catch the errors specific to an interface and
+        mark that ifaceobj with ifaceStatus.ERROR, an exception raised
+        by run_batch marks all the interfaces of the batch in error.
+        """
+        # like run_iface_op: without addons (--no-scripts) neither the
+        # modules nor the /etc/network/if-*.d scripts are run
+        addons = ifupdownobj.flags.ADDONS_ENABLE
+        scripts = (addons and
+                   ifupdownobj.config.get('addon_scripts_support', '0') == '1')
+        level = []
+        for ifaceobjs in ifaceobjs_list:
+            ifupdownobj.logger.info('%s: running ops ...' %ifaceobjs[0].name)
+            if not cls._skip_iface_list_down(ifupdownobj, ifaceobjs, ops):
+                level.append(ifaceobjs)
+        if not level:
+            return
+
+        ifaceobjs_all = [ifaceobj for ifaceobjs in level
+                         for ifaceobj in ifaceobjs
+                         if not ifupdownobj.type or
+                         ifupdownobj.type == ifaceobj.type]
+        for op in ops:
+            for ifaceobjs in level:
+                cls._run_ops_handler(ifupdownobj, ifaceobjs, op)
+            for mname in (ifupdownobj.module_ops.get(op) if addons else []):
+                m = ifupdownobj.modules.get(mname)
+                if hasattr(m, 'run_batch'):
+                    cls._run_module_batch(ifupdownobj, m, mname,
+                                          ifaceobjs_all, op)
+                    continue
+                if not hasattr(m, 'run'):
+                    continue
+                for ifaceobj in ifaceobjs_all:
+                    err = 0
+                    try:
+                        ifupdownobj.logger.debug('%s: %s : running module %s'
+                                                 %(ifaceobj.name, op, mname))
+                        m.run(ifaceobj, op,
+                              ifaceobj_getfunc=ifupdownobj.get_ifaceobjs)
+                    except Exception as e:
+                        if not ifupdownobj.ignore_error(str(e)):
+                            err = 1
+                            ifupdownobj.logger.error(str(e))
+                    finally:
+                        cls._set_iface_op_status(ifaceobj, op, err)
+            if scripts:
+                for ifaceobj in ifaceobjs_all:
+                    cls._run_iface_scripts(ifupdownobj, ifaceobj, op,
+                        ifupdownobj.generate_running_env(ifaceobj, op))
+        for ifaceobjs in level:
+            cls._run_posthook(ifupdownobj, ifaceobjs, ops)
+
+    @classmethod
+    def _run_module_batch(cls, ifupdownobj, m, mname, ifaceobjs, op):
+        """ Runs module op on a list of interfaces with m.run_batch """
+        if not ifaceobjs:
+            return
+        err = 0
+        try:
+            ifupdownobj.logger.debug('%s: %s : running module %s (batch)'
+                                     %(','.join(i.name for i in ifaceobjs),
+                                       op, mname))
+            m.run_batch(ifaceobjs, op,
+                        ifaceobj_getfunc=ifupdownobj.get_ifaceobjs)
+        except Exception as e:
+            if not ifupdownobj.ignore_error(str(e)):
+                err = 1
+                ifupdownobj.logger.error('%s: %s' %(mname, str(e)))
+        finally:
+            for ifaceobj in ifaceobjs:
+                cls._set_iface_op_status(ifaceobj, op, err)
+
     @classmethod
     def _check_upperifaces(cls, ifupdownobj, ifaceobj, ops, parent,
                            followdependents=False):
@@ -225,26 +344,54 @@ class ifaceScheduler():
         if not ulist:
             return True
 
-        # Get the list of upper ifaces other than the parent
-        tmpulist = ([u for u in ulist if u != parent] if parent
-                    else ulist)
-        if not tmpulist:
-            return True
-        # XXX: This is expensive. Find a cheaper way to do this.
+        if cls._UPPER_INDEX:
+            # upperifaces other than the parent that are still around
+            tmpulist = cls._UPPER_INDEX.get_alive_upperifaces(ifaceobj.name,
+                                                              skip=parent)
+        else:
+            # Get the list of upper ifaces other than the parent
+            tmpulist = [u for u in ulist if u != parent and
+                        ifupdownobj.link_exists(u)]
         # if any of the upperdevs are present,
         # return false to the caller to skip this interface
-        for u in tmpulist:
-            if ifupdownobj.link_exists(u):
-                if not ifupdownflags.flags.ALL:
-                    if ifupdownobj.is_ifaceobj_noconfig(ifaceobj):
-                        ifupdownobj.logger.info('%s: skipping interface down,'
-                            %ifaceobj.name + ' upperiface %s still around ' %u)
-                    else:
-                        ifupdownobj.logger.warning('%s: skipping interface down,'
-                            %ifaceobj.name + ' upperiface %s still around ' %u)
-                return False
+        if tmpulist:
+            u = tmpulist[0]
+            if not ifupdownflags.flags.ALL:
+                if ifupdownobj.is_ifaceobj_noconfig(ifaceobj):
+                    ifupdownobj.logger.info('%s: skipping interface down,'
+                        %ifaceobj.name + ' upperiface %s still around ' %u)
+                else:
+                    ifupdownobj.logger.warning('%s: skipping interface down,'
+                        %ifaceobj.name + ' upperiface %s still around ' %u)
+            return False
         return True
 
+    @classmethod
+    def _get_dependents(cls, ifupdownobj, ifaceobj, followdependents):
+        """ Returns the lowerifaces of ifaceobj the scheduler should
+        run before (POSTORDER) or after (INORDER) ifaceobj """
+        dlist = ifaceobj.lowerifaces
+        if not dlist:
+            return []
+
+        if ifaceobj.link_kind == ifaceLinkKind.VRF:
+            # remove non-auto lowerifaces from 'dlist'
+            for lower_ifname in list(dlist):
+                for lower_ifaceobj in ifupdownobj.get_ifaceobjs(lower_ifname) or []:
+                    if lower_ifaceobj and not lower_ifaceobj.auto and ifaceobj.name == cls.VRF_MGMT_DEVNAME:
+                        dlist.remove(lower_ifname)
+
+        ifupdownobj.logger.debug('%s: found dependents %s'
+                    %(ifaceobj.name, str(dlist)))
+        if not followdependents:
+            # XXX: this is yet another extra step,
+            # but is needed for interfaces that are
+            # implicit dependents. even though we are asked to
+            # not follow dependents, we must follow the ones
+            # that dont have user given config. Because we own them
+            return [d for d in dlist if ifupdownobj.is_iface_noconfig(d)]
+        return dlist
+
     @classmethod
     def run_iface_graph(cls, ifupdownobj, ifacename, ops, parent=None,
                         order=ifaceSchedulerFlags.POSTORDER,
@@ -273,36 +420,13 @@ class ifaceScheduler():
 
         for ifaceobj in ifaceobjs:
             # Run lowerifaces or dependents
-            dlist = ifaceobj.lowerifaces
+            dlist = cls._get_dependents(ifupdownobj, ifaceobj, followdependents)
             if dlist:
-
-                if ifaceobj.link_kind == ifaceLinkKind.VRF:
-                    # remove non-auto lowerifaces from 'dlist'
-                    for lower_ifname in list(dlist):
-                        for lower_ifaceobj in ifupdownobj.get_ifaceobjs(lower_ifname) or []:
-                            if lower_ifaceobj and not lower_ifaceobj.auto and ifaceobj.name == cls.VRF_MGMT_DEVNAME:
-                                dlist.remove(lower_ifname)
-
-                ifupdownobj.logger.debug('%s: found dependents %s'
-                            %(ifacename, str(dlist)))
                 try:
-                    if not followdependents:
-                        # XXX: this is yet another extra step,
-                        # but is needed for interfaces that are
-                        # implicit dependents. even though we are asked to
-                        # not follow dependents, we must follow the ones
-                        # that dont have user given config. Because we own them
-                        new_dlist = [d for d in dlist
-                                    if ifupdownobj.is_iface_noconfig(d)]
-                        if new_dlist:
-                            cls.run_iface_list(ifupdownobj, new_dlist, ops,
-                                           ifacename, order, followdependents,
-                                           continueonfailure=False)
-                    else:
-                        cls.run_iface_list(ifupdownobj, dlist, ops,
-                                            ifacename, order,
-                                            followdependents,
-                                            continueonfailure=False)
+                    cls.run_iface_list(ifupdownobj, dlist, ops,
+                                       ifacename, order,
+                                       followdependents,
+                                       continueonfailure=False)
                 except Exception as e:
                     if (ifupdownobj.ignore_error(str(e))):
                         pass
@@ -336,6 +460,223 @@ class ifaceScheduler():
                     else:
                         raise Exception('%s : (%s)' %(ifacename, str(e)))
 
+    @classmethod
+    def run_iface_list_parallel(cls, ifupdownobj, ifacenames, ops,
+                                order=ifaceSchedulerFlags.POSTORDER,
+                                followdependents=True, njobs=2):
+        """ Runs interface list with a pool of 'njobs' worker threads
+
+        Same traversal as run_iface_list/run_iface_graph, but instead of a
+        recursive walk, the graph reachable from ifacenames is collected
+        first and each interface is run as soon as it is ready:
+            - POSTORDER: once all its dependents (lowerifaces) are done
+            - INORDER: once all its parents (upperifaces in this graph) are
+              done, and at least one of them was run
+        Independent subtrees (eg: bonds with their own slaves, vrfs) are
+        then configured concurrently. The scheduling state is only handled
+        by the calling thread, the workers only run run_iface_list_ops.
+        """
+        cls._run_iface_list_ready(ifupdownobj, ifacenames, ops, order,
+                                  followdependents, njobs=njobs)
+
+    @classmethod
+    def run_iface_list_levels(cls, ifupdownobj, ifacenames, ops,
+                              order=ifaceSchedulerFlags.POSTORDER,
+                              followdependents=True):
+        """ Runs interface list level by level
+
+        Same traversal as run_iface_list_parallel, but all the interfaces
+        that are ready are run together as a level (see
+        run_iface_level_ops) so that the modules implementing run_batch
+        can configure them at once (one netlink pipeline, one 'ip -batch'
+        process...). The next level is the set of interfaces that became
+        ready once the current level is done.
+        """
+        cls._run_iface_list_ready(ifupdownobj, ifacenames, ops, order,
+                                  followdependents, levels=True)
+
+    @classmethod
+    def _run_iface_list_ready(cls, ifupdownobj, ifacenames, ops, order,
+                              followdependents, njobs=1, levels=False):
+        """ run_iface_list_parallel and run_iface_list_levels scheduler """
+        final_state = ifaceState.from_str(ops[-1])
+        postorder = order == ifaceSchedulerFlags.POSTORDER
+
+        # ifacename: [dependents]
+        graph = OrderedDict()
+        # ifacename: [parents]
+        parents = {}
+        # first parent that led to the interface (see _check_upperifaces)
+        parent_of = {}
+        # ifacename: error string, interfaces that failed before running
+        errors = {}
+        # interfaces that are done without running their ops
+        processed = set()
+
+        queue = list(ifacenames)
+        while queue:
+            ifacename = queue.pop(0)
+            if ifacename in graph:
+                continue
+            graph[ifacename] = []
+            parents.setdefault(ifacename, [])
+
+            ifaceobjs = ifupdownobj.get_ifaceobjs(ifacename)
+            if not ifaceobjs:
+                errors[ifacename] = '%s: not found' %ifacename
+                continue
+
+            if (cls._STATE_CHECK and
+                (ifaceobjs[0].state == final_state)):
+                ifupdownobj.logger.debug('%s: already processed' %ifacename)
+                processed.add(ifacename)
+                continue
+
+            for ifaceobj in ifaceobjs:
+                for d in cls._get_dependents(ifupdownobj, ifaceobj,
+                                             followdependents):
+                    if d == ifacename or d in graph[ifacename]:
+                        continue
+                    graph[ifacename].append(d)
+                    parents.setdefault(d, []).append(ifacename)
+                    parent_of.setdefault(d, ifacename)
+                    queue.append(d)
+
+        roots = set(ifacenames)
+        # number of dependents (POSTORDER) or parents (INORDER) not done yet
+        waiting = dict((i, len(graph[i] if postorder else parents[i]))
+                       for i in graph)
+        # error of a dependent, the interface won't be run
+        dependent_errors = {}
+        # INORDER: interfaces run by at least one of their parents
+        reached = set(roots)
+
+        def check(ifacename):
+            for ifaceobj in ifupdownobj.get_ifaceobjs(ifacename):
+                if not cls._check_upperifaces(ifupdownobj, ifaceobj, ops,
+                                              parent_of.get(ifacename),
+                                              followdependents):
+                    return False
+            return True
+
+        def run(ifacename):
+            if not check(ifacename):
+                return False
+            cls.run_iface_list_ops(ifupdownobj,
+                                   ifupdownobj.get_ifaceobjs(ifacename), ops)
+            return True
+
+        def fail(ifacename, error, exc=None):
+            """ propagate the error to the parents, like run_iface_list
+            does with continueonfailure=False """
+            if ifacename in roots:
+                if exc and ifupdownobj.logger.isEnabledFor(logging.DEBUG):
+                    traceback.print_tb(exc.__traceback__)
+                ifupdownobj.logger.error('%s : %s' %(ifacename, error))
+            error = '%s : (%s)' %(ifacename, error)
+            if ifupdownobj.ignore_error(error):
+                return
+            for p in parents[ifacename]:
+                if postorder:
+                    dependent_errors.setdefault(p, error)
+                elif p in reached:
+                    # the parent already ran: dont leave it marked as up
+                    for ifaceobj in ifupdownobj.get_ifaceobjs(p) or []:
+                        ifaceobj.set_state_n_status(ifaceState.NEW,
+                                                    ifaceStatus.ERROR)
+                    fail(p, error)
+
+        ready = [i for i in graph if not waiting[i]]
+        running = {}
+        executor = None
+        if not levels:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=njobs, thread_name_prefix='ifupdown2-sched')
+        try:
+            while ready or running:
+                # interfaces that are done without running are handled
+                # right away, the others are submitted to the workers
+                # or added to the level
+                level = []
+                while ready:
+                    ifacename = ready.pop(0)
+                    error = errors.get(ifacename)
+                    if not error and ifacename in dependent_errors:
+                        # Dont bring the iface up if children did not come up
+                        error = dependent_errors[ifacename]
+                        for ifaceobj in ifupdownobj.get_ifaceobjs(ifacename):
+                            ifaceobj.set_state_n_status(ifaceState.NEW,
+                                                        ifaceStatus.ERROR)
+                    skip = (ifacename in processed or
+                            (not postorder and ifacename not in reached))
+                    if error or skip:
+                        if error and not skip:
+                            fail(ifacename, error)
+                        ready.extend(cls._parallel_done(ifacename, graph,
+                                     parents, waiting, reached, postorder,
+                                     proceed=False))
+                        continue
+                    if not levels:
+                        running[executor.submit(run, ifacename)] = ifacename
+                    elif check(ifacename):
+                        level.append(ifacename)
+                    else:
+                        ready.extend(cls._parallel_done(ifacename, graph,
+                                     parents, waiting, reached, postorder,
+                                     proceed=False))
+
+                if level:
+                    ifupdownobj.logger.debug('running level %s' %str(level))
+                    proceed = False
+                    try:
+                        cls.run_iface_level_ops(ifupdownobj,
+                            [ifupdownobj.get_ifaceobjs(i) for i in level],
+                            ops)
+                        proceed = True
+                    except Exception as e:
+                        for ifacename in level:
+                            fail(ifacename, str(e), e)
+                    for ifacename in level:
+                        ready.extend(cls._parallel_done(ifacename, graph,
+                                     parents, waiting, reached, postorder,
+                                     proceed=proceed))
+                    continue
+
+                if not running:
+                    break
+
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    ifacename = running.pop(future)
+                    proceed = False
+                    try:
+                        proceed = future.result()
+                    except Exception as e:
+                        fail(ifacename, str(e), e)
+                    ready.extend(cls._parallel_done(ifacename, graph,
+                                 parents, waiting, reached, postorder,
+                                 proceed=proceed))
+        finally:
+            for future in running:
+                future.cancel()
+            if executor:
+                executor.shutdown(wait=True)
+
+    @classmethod
+    def _parallel_done(cls, ifacename, graph, parents, waiting, reached,
+                       postorder, proceed):
+        """ run_iface_list_parallel: ifacename is done, returns the list of
+        interfaces that are now ready """
+        ready = []
+        for n in (parents[ifacename] if postorder else graph[ifacename]):
+            if not postorder and proceed:
+                reached.add(n)
+            waiting[n] -= 1
+            if not waiting[n]:
+                ready.append(n)
+        return ready
+
     @classmethod
     def run_iface_graph_upper(cls, ifupdownobj, ifacename, ops, parent=None,
                         followdependents=True, skip_root=False):
@@ -401,6 +742,7 @@ class ifaceScheduler():
             - u will have to execute up on the bridge
               to enslave the port and apply bridge attributes to the port) """
 
+        index = cls._UPPER_INDEX
         upperifacenames = []
         for ifacename in ifacenames:
             # get upperifaces
@@ -416,7 +758,8 @@ class ifaceScheduler():
                 has_config = not (uifaceobj.priv_flags and
                                   uifaceobj.priv_flags.NOCONFIG)
                 if (((has_config and ifupdownobj.get_ifaceobjs_saved(u)) or
-                     not has_config) and (not ifupdownobj.link_exists(u)
+                     not has_config) and (not (index.upper_exists(u) if index
+                                               else ifupdownobj.link_exists(u))
                          # Do this always for a bridge. Note that this is
                          # not done for a vlan aware bridge because,
                          # in the vlan aware bridge case, the bridge module
@@ -496,11 +839,64 @@ class ifaceScheduler():
                             if ifacename in ifacenames]
         return ifacenames_sorted
 
+    @classmethod
+    def _build_upper_index(cls, ifupdownobj):
+        netlink = getattr(ifupdownobj, 'netlink', None)
+        if not netlink or not getattr(ifupdownobj, 'ifaceobjdict', None):
+            return None
+        try:
+            return ifaceUpperIndex(ifupdownobj, netlink.cache)
+        except Exception as e:
+            ifupdownobj.logger.debug('upperiface index: %s' %str(e))
+            return None
+
     @classmethod
     def sched_ifaces(cls, ifupdownobj, ifacenames, ops,
                 dependency_graph=None, indegrees=None,
                 order=ifaceSchedulerFlags.POSTORDER,
                 followdependents=True, skipupperifaces=False, sort=False):
+        """ runs interface configuration modules on interfaces passed as
+            argument (see _sched_ifaces).
+
+        The reverse dependency index (ifaceUpperIndex) is built once for
+        the run and kept up to date by the netlink cache, the upperiface
+        checks are then done without looking up every upperiface.
+
+        The iproute2 commands of the run go through one batch process per
+        tool (see IPRoute2.batch_session_start).
+        """
+        saved_index = cls._UPPER_INDEX
+        index = cls._build_upper_index(ifupdownobj)
+        if index:
+            cls._UPPER_INDEX = index
+        session = cls._start_iproute2_session(ifupdownobj)
+        try:
+            cls._sched_ifaces(ifupdownobj, ifacenames, ops,
+                              dependency_graph=dependency_graph,
+                              indegrees=indegrees, order=order,
+                              followdependents=followdependents,
+                              skipupperifaces=skipupperifaces, sort=sort)
+        finally:
+            if session:
+                IPRoute2.batch_session_stop()
+            if index:
+                index.close()
+            cls._UPPER_INDEX = saved_index
+
+    @classmethod
+    def _start_iproute2_session(cls, ifupdownobj):
+        netlink = getattr(ifupdownobj, 'netlink', None)
+        if (not netlink or ifupdownflags.flags.DRYRUN or
+                ifupdownobj.config.get('iproute2_batch_session', '1') != '1'):
+            return False
+        IPRoute2.batch_session_start(netlink.cache)
+        return True
+
+    @classmethod
+    def _sched_ifaces(cls, ifupdownobj, ifacenames, ops,
+                dependency_graph=None, indegrees=None,
+                order=ifaceSchedulerFlags.POSTORDER,
+                followdependents=True, skipupperifaces=False, sort=False):
         """ runs interface configuration modules on interfaces passed as
             argument. Runs topological sort on interface dependency graph.
 
@@ -592,9 +988,23 @@ class ifaceScheduler():
                 run_queue.reverse()
 
         # run interface list
-        cls.run_iface_list(ifupdownobj, run_queue, ops,
-                           parent=None, order=order,
-                           followdependents=followdependents)
+        if ifupdownobj.njobs > 1 and ('up' in ops[0] or 'down' in ops[0]):
+            ifupdownobj.logger.info('running interfaces with %d jobs'
+                                    %ifupdownobj.njobs)
+            cls.run_iface_list_parallel(ifupdownobj, run_queue, ops,
+                                        order=order,
+                                        followdependents=followdependents,
+                                        njobs=ifupdownobj.njobs)
+        elif (ifupdownobj.config.get('sched_level_batch', '0') == '1' and
+              ('up' in ops[0] or 'down' in ops[0])):
+            ifupdownobj.logger.info('running interfaces level by level')
+            cls.run_iface_list_levels(ifupdownobj, run_queue, ops,
+                                      order=order,
+                                      followdependents=followdependents)
+        else:
+            cls.run_iface_list(ifupdownobj, run_queue, ops,
+                               parent=None, order=order,
+                               followdependents=followdependents)
         if not cls.get_sched_status():
             return
 
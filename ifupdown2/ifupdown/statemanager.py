@@ -9,7 +9,9 @@
 
 import os
 import pickle
+import struct
 import logging
+import threading
 
 try:
     from ifupdown2.ifupdown.iface import *
@@ -53,13 +55,204 @@ class pickling():
                 except EOFError: break
                 except Exception: raise
 
+class stateStore():
+    """ indexed state file
+
+    The iface objects of each interface are pickled in their own record,
+    an index of the records (ifacename: offset, length) is stored at the
+    end of the file:
+
+        header: magic, version, index offset
+        records: pickled list of iface objects, one per interface
+        index: pickled list of (ifacename, offset, length, fingerprints)
+
+    Only the index is read when the state is loaded, the records are
+    unpickled on demand (see stateTable). The stanza fingerprints of the
+    iface objects of each record are kept in the index: checking if a
+    stanza changed doesn't require to load the record. The file is
+    written to a temporary file then renamed, the records that didn't
+    change are copied as is.
+    """
+
+    MAGIC = b'IFSTATE\0'
+    VERSION = 2
+
+    HEADER_PACK = '=8sIQ'
+    HEADER_LEN = struct.calcsize(HEADER_PACK)
+
+    def __init__(self, filename):
+        self.filename = filename
+        # ifacename: (offset, length) of the records in filename
+        self.index = OrderedDict()
+        # ifacename: stanza fingerprints of the record
+        self.fingerprints = {}
+        self.lock = threading.Lock()
+        self._f = None
+
+    def open(self):
+        """ reads the index, returns False if filename isn't an indexed
+        state file (i.e. the old sequential pickle stream) """
+        with open(self.filename, 'rb') as f:
+            header = f.read(self.HEADER_LEN)
+            if len(header) < self.HEADER_LEN:
+                return False
+            magic, version, index_offset = struct.unpack(self.HEADER_PACK,
+                                                         header)
+            if magic != self.MAGIC:
+                return False
+            if version not in (1, self.VERSION):
+                raise Exception('%s: unsupported state file version %s'
+                                %(self.filename, version))
+            f.seek(index_offset)
+            for entry in pickle.load(f):
+                # version 1 index entries don't have the fingerprints
+                self.index[entry[0]] = (entry[1], entry[2])
+                if len(entry) > 3:
+                    self.fingerprints[entry[0]] = entry[3]
+        return True
+
+    def close(self):
+        with self.lock:
+            if self._f:
+                self._f.close()
+                self._f = None
+
+    def read_raw(self, ifacename):
+        offset, length = self.index[ifacename]
+        with self.lock:
+            if not self._f:
+                self._f = open(self.filename, 'rb')
+            self._f.seek(offset)
+            return self._f.read(length)
+
+    def read(self, ifacename):
+        """ returns the iface objects of ifacename """
+        return pickle.loads(self.read_raw(ifacename))
+
+    def write(self, ifaceobjdict, changed=None):
+        """ writes the state atomically
+
+        Args:
+            ifaceobjdict (dict): ifacename: list of iface objects
+            changed (set): records to pickle again, the other records
+                           present in the current file are copied
+        """
+        tmp_filename = '%s.tmp' %self.filename
+        index = OrderedDict()
+        fingerprints = {}
+        try:
+            with open(tmp_filename, 'wb') as f:
+                f.write(struct.pack(self.HEADER_PACK, self.MAGIC,
+                                    self.VERSION, 0))
+                offset = self.HEADER_LEN
+                for ifacename in ifaceobjdict:
+                    if ((changed is None or ifacename in changed) or
+                            ifacename not in self.fingerprints):
+                        ifaceobjs = ifaceobjdict[ifacename]
+                        data = pickle.dumps(ifaceobjs,
+                                            pickle.HIGHEST_PROTOCOL)
+                        fingerprints[ifacename] = [
+                            o.get_config_fingerprint() for o in ifaceobjs]
+                    else:
+                        data = self.read_raw(ifacename)
+                        fingerprints[ifacename] = self.fingerprints[ifacename]
+                    f.write(data)
+                    index[ifacename] = (offset, len(data))
+                    offset += len(data)
+                pickle.dump([(ifacename, o, l, fingerprints[ifacename])
+                             for ifacename, (o, l) in index.items()], f,
+                            pickle.HIGHEST_PROTOCOL)
+                f.seek(0)
+                f.write(struct.pack(self.HEADER_PACK, self.MAGIC,
+                                    self.VERSION, offset))
+            self.close()
+            os.rename(tmp_filename, self.filename)
+        except Exception:
+            try:
+                os.unlink(tmp_filename)
+            except OSError:
+                pass
+            raise
+        self.index = index
+        self.fingerprints = fingerprints
+
+
+class stateTable(OrderedDict):
+    """ ifacename: [iface objects] dictionary of the saved state
+
+    The keys are read from the state file index, the iface objects of an
+    interface are only unpickled when accessed: ifup of a few interfaces
+    doesn't load the whole state. Iterating over the values (or items)
+    loads all the records.
+    """
+
+    _NOT_LOADED = None
+
+    def __init__(self, store=None):
+        OrderedDict.__init__(self)
+        self.store = store
+        if store:
+            for ifacename in store.index:
+                OrderedDict.__setitem__(self, ifacename, self._NOT_LOADED)
+
+    def __getitem__(self, ifacename):
+        ifaceobjs = OrderedDict.__getitem__(self, ifacename)
+        if ifaceobjs is self._NOT_LOADED:
+            ifaceobjs = self.store.read(ifacename)
+            OrderedDict.__setitem__(self, ifacename, ifaceobjs)
+        return ifaceobjs
+
+    def get(self, ifacename, default=None):
+        try:
+            return self[ifacename]
+        except KeyError:
+            return default
+
+    def setdefault(self, ifacename, default=None):
+        if ifacename in self:
+            return self[ifacename]
+        self[ifacename] = default
+        return default
+
+    def pop(self, ifacename, *default):
+        if ifacename in self:
+            self[ifacename]
+        return OrderedDict.pop(self, ifacename, *default)
+
+    def get_config_fingerprints(self, ifacename):
+        """ Returns the stanza fingerprints of the iface objects of
+        ifacename, read from the index if the record isn't loaded """
+        if ifacename not in self:
+            return []
+        ifaceobjs = OrderedDict.__getitem__(self, ifacename)
+        if ifaceobjs is self._NOT_LOADED:
+            fingerprints = self.store.fingerprints.get(ifacename)
+            if fingerprints is not None:
+                return fingerprints
+            ifaceobjs = self[ifacename]
+        return [o.get_config_fingerprint() for o in ifaceobjs or []]
+
+    def load_all(self):
+        for ifacename in list(self.keys()):
+            self[ifacename]
+
+    def values(self):
+        self.load_all()
+        return OrderedDict.values(self)
+
+    def items(self):
+        self.load_all()
+        return OrderedDict.items(self)
+
+
 class stateManager():
     """ state manager for managing ifupdown iface obj state
 
     ifupdown2 has to maitain old objects for down operation on
     interfaces. ie to down or delete old configuration.
 
-    This class uses pickle to store iface objects.
+    The iface objects are pickled in an indexed state file (see
+    stateStore), loaded on demand.
 
     """
 
@@ -82,6 +275,9 @@ class stateManager():
         self.state_dir = None
         self.state_file = None
         self.ifaceobjdict = OrderedDict()
+        self.store = None
+        # interfaces whose state changed since the state was read
+        self.changed_ifacenames = set()
         self.logger = logging.getLogger('ifupdown.' +
                     self.__class__.__name__)
 
@@ -133,12 +329,27 @@ class stateManager():
             pickle_filename = self.state_file
         if not os.path.exists(pickle_filename):
             return
+        store = stateStore(pickle_filename)
+        if store.open():
+            self.store = store
+            self.ifaceobjdict = stateTable(store)
+            return
+        # state file saved by an older version: sequential pickle stream,
+        # rewritten in the indexed format on next save
         for ifaceobj in pickling.load(pickle_filename):
             self.save_ifaceobj(ifaceobj)
 
     def get_ifaceobjs(self, ifacename):
         return self.ifaceobjdict.get(ifacename)
 
+    def get_config_fingerprints(self, ifacename):
+        """ Returns the stanza fingerprints of the saved iface objects of
+        ifacename (without loading them from the state file if possible) """
+        if isinstance(self.ifaceobjdict, stateTable):
+            return self.ifaceobjdict.get_config_fingerprints(ifacename)
+        return [o.get_config_fingerprint()
+                for o in self.ifaceobjdict.get(ifacename) or []]
+
     def ifaceobj_sync(self, ifaceobj, op):
         """This member function sync's new obj state to old statemanager state
 
@@ -149,14 +360,20 @@ class stateManager():
 
         self.logger.debug('%s: statemanager sync state %s'
                           %(ifaceobj.name, op))
+        if ('up' in op and ifaceobj.get_config_fingerprint() in
+                self.get_config_fingerprints(ifaceobj.name)):
+            # fast path: the stanza is already saved
+            return
         old_ifaceobjs = self.ifaceobjdict.get(ifaceobj.name)
         if 'up' in op:
             if not old_ifaceobjs:
                 self.ifaceobjdict[ifaceobj.name] = [ifaceobj]
+                self.changed_ifacenames.add(ifaceobj.name)
             else:
                 # If it matches any of the object, return
                 if any(o.compare(ifaceobj) for o in old_ifaceobjs):
                     return
+                self.changed_ifacenames.add(ifaceobj.name)
                 # If it does not match any of the objects, and if
                 # all objs in the list came from the pickled file,
                 # then reset the list and add this object as a fresh one,
@@ -181,23 +398,34 @@ class stateManager():
             oidx = 0
             for o in old_ifaceobjs:
                 if o.compare(ifaceobj):
+                    self.changed_ifacenames.add(ifaceobj.name)
                     old_ifaceobjs.pop(oidx)
                     if not len(old_ifaceobjs):
                         del self.ifaceobjdict[ifaceobj.name]
                     return
                 oidx += 1
 
+    def get_changed_ifacenames(self):
+        """ Returns the interfaces whose state record changed, None if the
+        whole state is rewritten (no indexed state file was read) """
+        if not self.store or self.store.filename != self.state_file:
+            return None
+        return self.changed_ifacenames
+
     def save_state(self):
         """ saves state (ifaceobjects) to persistent state file """
 
+        changed = self.get_changed_ifacenames()
         try:
-            with open(self.state_file, 'wb') as f:
-                if not len(self.ifaceobjdict):
-                    f.truncate(0)
-                    return
+            if changed is None:
+                self.store = stateStore(self.state_file)
+            if changed is None or changed:
                 self.logger.debug('saving state ..')
-                for ifaceobjs in list(self.ifaceobjdict.values()):
-                    [pickling.save_obj(f, i) for i in ifaceobjs]
+                self.store.write(self.ifaceobjdict, changed)
+            else:
+                self.logger.debug('state unchanged')
+            if not len(self.ifaceobjdict):
+                return
             open('%s/%s' %(self.state_rundir, self.state_runlockfile), 'w').close()
         except Exception:
             raise
@@ -7,6 +7,9 @@
 #    helper class to render templates
 #
 
+import hashlib
+import time
+
 try:
     from ifupdown2.ifupdown.utils import *
 except (ImportError, ModuleNotFoundError):
@@ -14,14 +17,35 @@ except (ImportError, ModuleNotFoundError):
 
 
 class templateEngine():
-    """ provides template rendering methods """
+    """ provides template rendering methods
+
+    If a cache directory is given, mako templates are compiled to python
+    modules in the cache directory (mako module_directory), keyed by the
+    template content and lookup path, and only compiled once. The output
+    of the templates that don't read anything from outside the template
+    (see _is_static) is saved there too, and reused as is.
+    """
+
+    # number of templates kept in the cache directory
+    CACHE_MAX_ENTRIES = 32
+
+    # template constructs that can read data from outside the template
+    # (python imports, files, other templates): the output of the
+    # templates using them is rendered on each run
+    _dynamic_regex = re.compile(r'<%!|<%(include|namespace|inherit)\b|'
+                                r'\b(import|open|eval|exec|__import__|'
+                                r'context|os|sys|subprocess)\b')
 
     def __init__(self, template_engine, template_enable='0',
-                 template_lookuppath=None):
+                 template_lookuppath=None, template_cache_dir=None):
         self.logger = logging.getLogger('ifupdown.' +
                     self.__class__.__name__)
         self.tclass = None
         self.tclassargs = {}
+        self.lookuppath = template_lookuppath
+        self.cache_dir = template_cache_dir
+        self.render_time = 0
+        """time spent rendering templates (seconds)"""
         self.render = self._render_default
         if template_enable == '0':
             return
@@ -60,6 +84,92 @@ class templateEngine():
         if not self.tclass:
             return textdata
         self.logger.info('template processing on interfaces file ...')
-        t = self.tclass(text=textdata, output_encoding='utf-8',
-                     lookup=self.tclassargs.get('lookup'))
-        return t.render()
+        start_time = time.time()
+        try:
+            if self.cache_dir:
+                try:
+                    return self._render_mako_cached(textdata)
+                except OSError as e:
+                    self.logger.debug('template cache: %s' %str(e))
+            t = self.tclass(text=textdata, output_encoding='utf-8',
+                         lookup=self.tclassargs.get('lookup'))
+            return t.render()
+        finally:
+            self.render_time += time.time() - start_time
+
+    def _is_static(self, textdata):
+        return not self._dynamic_regex.search(textdata)
+
+    def _render_mako_cached(self, textdata):
+        key = hashlib.sha1(repr((textdata, self.lookuppath)).encode()).hexdigest()
+        template_file = os.path.join(self.cache_dir, '%s.mako' %key)
+        output_file = '%s.out' %template_file
+        static = self._is_static(textdata)
+
+        if static and os.path.exists(output_file):
+            self.logger.debug('template cache: using rendered output %s'
+                              %output_file)
+            with open(output_file, 'rb') as f:
+                output = f.read()
+            self._touch(output_file)
+            return output
+
+        if not os.path.exists(template_file):
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            self._write_file(template_file, textdata.encode())
+            self._prune_cache()
+
+        # the module is compiled to <module_directory>/<uri>.py, and only
+        # compiled again if the template file is newer
+        t = self.tclass(filename=template_file,
+                        uri=os.path.basename(template_file),
+                        module_directory=self.cache_dir,
+                        output_encoding='utf-8',
+                        lookup=self.tclassargs.get('lookup'))
+        output = t.render()
+        if static:
+            self._write_file(output_file, output)
+        else:
+            # the template file mtime is left alone: mako would compile the
+            # template again if it was newer than the module
+            self._touch('%s.py' %template_file)
+        return output
+
+    @staticmethod
+    def _touch(filename):
+        """ marks a cache entry as recently used (see _prune_cache) """
+        try:
+            os.utime(filename)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _write_file(filename, data):
+        tmp_filename = '%s.tmp' %filename
+        with open(tmp_filename, 'wb') as f:
+            f.write(data)
+        os.rename(tmp_filename, filename)
+
+    def _prune_cache(self):
+        """ removes the least recently used templates (and their compiled
+        module and output): an entry was last used when its most recent
+        file (template, module or output) was written or touched """
+        def last_used(f):
+            mtime = 0
+            for suffix in ('', '.py', '.out'):
+                try:
+                    mtime = max(mtime, os.path.getmtime(
+                                    os.path.join(self.cache_dir, f + suffix)))
+                except OSError:
+                    pass
+            return mtime
+        templates = sorted((last_used(f), f)
+                           for f in os.listdir(self.cache_dir)
+                           if f.endswith('.mako'))
+        for _, f in templates[:-self.CACHE_MAX_ENTRIES]:
+            for suffix in ('', '.py', '.out'):
+                try:
+                    os.unlink(os.path.join(self.cache_dir, f + suffix))
+                except OSError:
+                    pass
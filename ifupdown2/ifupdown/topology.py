@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+#
+# Copyright 2014-2017 Cumulus Networks, Inc. All rights reserved.
+#
+# topologyCache --
+#    persisted interface dependency info
+#
+
+import os
+import pickle
+import hashlib
+import logging
+
+try:
+    import ifupdown2.ifupdown.config as config
+    import ifupdown2.ifupdown.policymanager as policymanager
+except (ImportError, ModuleNotFoundError):
+    import ifupdown.config as config
+    import ifupdown.policymanager as policymanager
+
+
+class topologyCache():
+    """ persisted answers of the addon modules dependency queries
+
+    populate_dependency_info asks every addon module for the lower and
+    upper interfaces of every stanza (get_dependent_ifacenames and
+    get_upper_ifacenames). For the modules whose answer only depends on
+    the stanza (modules with cacheable_dependency_info = True) the answer
+    and the changes made to the iface object while answering are recorded
+    with the stanza fingerprint, and saved next to the state file.
+
+    On the next run (and for the old config during ifreload) the recorded
+    answers are replayed for the stanzas that didn't change, only the
+    changed stanzas are queried again. Stanzas using 'regex' port
+    expressions depend on the interfaces present on the system and are
+    always queried.
+
+    The dependency graph itself (refcnt, roles, blacklisted interfaces...)
+    is still assembled by populate_dependency_info for each run.
+    """
+
+    VERSION = 1
+
+    state_filename = 'ifstatetopology'
+    """name of the topology file (in the state directory)"""
+
+    # iface attributes that can be updated by the dependency queries:
+    # modules or these bits into the existing value...
+    BIT_ATTRS = ('link_kind', 'link_privflags', 'role')
+    # ...and overwrite these ones
+    VALUE_ATTRS = ('link_type', 'dependency_type', 'priv_data')
+
+    def __init__(self, state_dir):
+        self.logger = logging.getLogger('ifupdown.' +
+                    self.__class__.__name__)
+        self.state_file = '%s/%s' %(state_dir, self.state_filename)
+        self.env = self._get_env()
+        # ifacename: {(stanza fingerprint, module name, query): answer}
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _get_env():
+        """ the recorded answers are only valid for the same ifupdown2
+        version and policy files """
+        return hashlib.sha1(repr((
+            config.__version__,
+            policymanager.policymanager_api.system_policy_array,
+            policymanager.policymanager_api.user_policy_array
+        )).encode()).hexdigest()
+
+    def load(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'rb') as f:
+                data = pickle.load(f)
+        except Exception as e:
+            self.logger.info('topology cache: %s: %s' %(self.state_file,
+                                                        str(e)))
+            return
+        if (not isinstance(data, dict) or
+                data.get('version') != self.VERSION or
+                data.get('env') != self.env):
+            self.logger.debug('topology cache: discarding stale file %s'
+                              %self.state_file)
+            return
+        self.entries = data.get('entries', {})
+
+    def save(self, ifaceobjdict, ifacenames=None):
+        """ saves the answers for the stanzas in ifaceobjdict (the saved
+        state). If ifacenames is set, only the answers of these interfaces
+        (the state records that changed) are checked against the saved
+        stanzas, the other state records aren't loaded """
+        entries = {}
+        for ifacename, answers in self.entries.items():
+            if not answers or ifacename not in ifaceobjdict:
+                continue
+            if ifacenames is not None and ifacename not in ifacenames:
+                entries[ifacename] = answers
+                continue
+            fingerprints = set(o.get_config_fingerprint()
+                               for o in ifaceobjdict[ifacename])
+            answers = dict((k, v) for k, v in answers.items()
+                           if k[0] in fingerprints)
+            if answers:
+                entries[ifacename] = answers
+
+        tmp_file = '%s.tmp' %self.state_file
+        try:
+            with open(tmp_file, 'wb') as f:
+                pickle.dump({'version': self.VERSION, 'env': self.env,
+                             'entries': entries}, f,
+                            pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_file, self.state_file)
+        except Exception as e:
+            self.logger.warning('error saving topology cache (%s)' %str(e))
+            try:
+                os.unlink(tmp_file)
+            except OSError:
+                pass
+        self.logger.debug('topology cache: %d hits, %d misses'
+                          %(self.hits, self.misses))
+
+    @staticmethod
+    def is_cacheable(ifaceobj):
+        return not any('regex' in v for values in ifaceobj.config.values()
+                       for v in values if v)
+
+    def _snapshot(self, ifaceobj):
+        return [getattr(ifaceobj, a) for a in self.BIT_ATTRS + self.VALUE_ATTRS]
+
+    def query(self, module, ifaceobj, query, func):
+        """ returns func() (the module answer to query) for ifaceobj,
+        replayed from the recorded answer if possible """
+        if (not getattr(module, 'cacheable_dependency_info', False) or
+                not self.is_cacheable(ifaceobj)):
+            return func()
+
+        key = (ifaceobj.get_config_fingerprint(), module.__class__.__name__,
+               query)
+        answer = self.entries.get(ifaceobj.name, {}).get(key)
+        if answer and self._replay(ifaceobj, answer):
+            self.hits += 1
+            result = answer[0]
+            return list(result) if result is not None else None
+
+        self.misses += 1
+        before = self._snapshot(ifaceobj)
+        result = func()
+        after = self._snapshot(ifaceobj)
+
+        nbits = len(self.BIT_ATTRS)
+        bits = [a & ~b for a, b in zip(after[:nbits], before[:nbits])]
+        values = dict((attr, (b, a)) for attr, b, a in
+                      zip(self.VALUE_ATTRS, before[nbits:], after[nbits:])
+                      if a != b)
+        self.entries.setdefault(ifaceobj.name, {})[key] = (
+            list(result) if result is not None else None, bits, values)
+        return result
+
+    def _replay(self, ifaceobj, answer):
+        _, bits, values = answer
+        # the overwritten attributes must start from the same value
+        for attr, (before, _) in values.items():
+            if getattr(ifaceobj, attr) != before:
+                return False
+        for attr, b in zip(self.BIT_ATTRS, bits):
+            if b:
+                setattr(ifaceobj, attr, getattr(ifaceobj, attr) | b)
+        for attr, (_, after) in values.items():
+            setattr(ifaceobj, attr,
+                    list(after) if isinstance(after, list) else after)
+        return True
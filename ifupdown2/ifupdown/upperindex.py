@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+#
+# Copyright 2014-2017 Cumulus Networks, Inc. All rights reserved.
+#
+# ifaceUpperIndex --
+#    reverse dependency (upperiface) index for the scheduler
+#
+
+import threading
+
+
+class ifaceUpperIndex():
+    """ reverse dependency index of the interfaces of a scheduler run
+
+    The index is built once per run from the upperifaces of the interface
+    objects:
+        - uppers: ifacename -> [upperifaces]
+        - lowers: upper ifacename -> [ifacenames it is an upperiface of]
+        - alive: ifacename -> number of its upperifaces that exist
+
+    The netlink cache notifies the index when a link is created or deleted
+    (see _NetlinkCache.register_link_watcher), the 'alive' refcounts are
+    updated incrementally so that the scheduler doesn't have to check every
+    upperiface with link_exists for each interface.
+    """
+
+    def __init__(self, ifupdownobj, cache):
+        self.cache = cache
+        self.uppers = {}
+        self.lowers = {}
+        self.alive = {}
+        self.existing = set()
+        self.lock = threading.Lock()
+
+        for ifacename, ifaceobjs in ifupdownobj.ifaceobjdict.items():
+            ulist = []
+            for ifaceobj in ifaceobjs:
+                for u in ifaceobj.upperifaces or []:
+                    if u != ifacename and u not in ulist:
+                        ulist.append(u)
+            if not ulist:
+                continue
+            self.uppers[ifacename] = ulist
+            for u in ulist:
+                self.lowers.setdefault(u, []).append(ifacename)
+
+        # register first: a link created or deleted while we are checking
+        # the existing links is then accounted for either way
+        cache.register_link_watcher(self.link_changed)
+        for u in list(self.lowers.keys()):
+            if cache.link_exists(u):
+                self.link_changed(u, True)
+
+    def close(self):
+        self.cache.unregister_link_watcher(self.link_changed)
+
+    def link_changed(self, ifname, exists):
+        """ netlink cache link watcher """
+        lowers = self.lowers.get(ifname)
+        if not lowers:
+            return
+        with self.lock:
+            if exists == (ifname in self.existing):
+                return
+            if exists:
+                self.existing.add(ifname)
+                delta = 1
+            else:
+                self.existing.remove(ifname)
+                delta = -1
+            for ifacename in lowers:
+                self.alive[ifacename] = self.alive.get(ifacename, 0) + delta
+
+    def get_upperifaces(self, ifacename):
+        return self.uppers.get(ifacename, [])
+
+    def upper_exists(self, ifacename):
+        """ Returns True if the upperiface ifacename exists """
+        if ifacename in self.lowers:
+            return ifacename in self.existing
+        return self.cache.link_exists(ifacename)
+
+    def get_alive_upperifaces(self, ifacename, skip=None):
+        """ Returns the upperifaces of ifacename (other than skip) that
+        exist """
+        alive = self.alive.get(ifacename, 0)
+        if alive and skip and skip in self.existing and \
+                skip in self.uppers.get(ifacename, []):
+            alive -= 1
+        if not alive:
+            return []
+        return [u for u in self.uppers[ifacename]
+                if u != skip and u in self.existing]
@@ -99,8 +99,6 @@ class utils():
     service_cmd     = '/usr/sbin/service'
     sysctl_cmd      = '/sbin/sysctl'
     modprobe_cmd    = '/sbin/modprobe'
-    pstree_cmd      = '/usr/bin/pstree'
-    ss_cmd          = '/bin/ss'
     vrrpd_cmd       = '/usr/sbin/vrrpd'
     ifplugd_cmd     = '/usr/sbin/ifplugd'
     mstpctl_cmd     = '/sbin/mstpctl'
@@ -116,8 +114,6 @@ class utils():
                 'service',
                 'sysctl',
                 'modprobe',
-                'pstree',
-                'ss',
                 'vrrpd',
                 'ifplugd',
                 'mstpctl',
@@ -221,6 +217,10 @@ class utils():
             return None
         return getattr(module, name)
 
+    # lockfile path: fd - kept so long-lived processes (ifupdown2d) can
+    # release the lock at the end of each request
+    _lockfile_fds = {}
+
     @classmethod
     def lockFile(cls, lockfile):
         try:
@@ -229,8 +229,21 @@ class utils():
             fcntl.fcntl(fp, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
         except IOError:
             return False
+        cls._lockfile_fds[lockfile] = fp
         return True
 
+    @classmethod
+    def unlockFile(cls, lockfile):
+        fp = cls._lockfile_fds.pop(lockfile, None)
+        if fp is None:
+            return
+        try:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+        except IOError:
+            pass
+        finally:
+            os.close(fp)
+
     @classmethod
     def parse_iface_range(cls, name):
         # eg: swp1.[2-100]
@@ -34,6 +34,12 @@ class moduleBase(object):
 
     Provides common infrastructure methods for all addon modules """
 
+    # set to True by modules whose get_dependent_ifacenames and
+    # get_upper_ifacenames answers only depend on the stanza and only
+    # update the iface object: the answers are then recorded and replayed
+    # for unchanged stanzas (see ifupdown.topology)
+    cacheable_dependency_info = False
+
     def __init__(self, *args, **kargs):
         self.modulename = self.__class__.__name__
         self.logger = logging.getLogger('ifupdown.' + self.modulename)
@@ -4,6 +4,8 @@
 # Author: Roopa Prabhu, roopa@cumulusnetworks.com
 #
 
+import threading
+
 try:
     from ifupdown2.ifupdown.iface import *
     from ifupdown2.ifupdown.utils import utils
@@ -60,11 +62,50 @@ class mstpctlutil(utilsBase):
     def __init__(self, *args, **kargs):
         utilsBase.__init__(self, *args, **kargs)
 
-        self.__batch = []
-        self.__batch_mode = False
+        # batch state is per thread: with -j several bridges can be
+        # configured concurrently (see ifaceScheduler.run_iface_list_parallel)
+        # each one in its own batch_start/batch_commit block
+        self.__batch_local = threading.local()
+
+    @property
+    def __batch(self):
+        return getattr(self.__batch_local, "batch", None)
+
+    @__batch.setter
+    def __batch(self, value):
+        self.__batch_local.batch = value
+
+    @property
+    def __batch_mode(self):
+        return getattr(self.__batch_local, "batch_mode", False)
+
+    @__batch_mode.setter
+    def __batch_mode(self, value):
+        self.__batch_local.batch_mode = value
+
+    @property
+    def __batch_depth(self):
+        # batch_start/batch_commit calls can be nested, only the outermost
+        # batch_commit executes the batch
+        return getattr(self.__batch_local, "batch_depth", 0)
+
+    @__batch_depth.setter
+    def __batch_depth(self, value):
+        self.__batch_local.batch_depth = value
+
+    @property
+    def __batch_owner(self):
+        # the batched commands are recorded with their owner (i.e. the
+        # ifaceobj being configured, see batch_set_owner) so that a failed
+        # batch can be replayed owner by owner
+        return getattr(self.__batch_local, "batch_owner", None)
+
+    @__batch_owner.setter
+    def __batch_owner(self, value):
+        self.__batch_local.batch_owner = value
 
     def __add_to_batch(self, cmd):
-        self.__batch.append(cmd)
+        self.__batch.append((self.__batch_owner, cmd))
 
     def __execute_or_batch(self, cmd):
         if self.__batch_mode:
@@ -84,24 +125,60 @@ class mstpctlutil(utilsBase):
             self.logger.info("DRY-RUN: executing: %s %s" % (utils.mstpctl_cmd, cmd))
 
     def batch_start(self):
+        self.__batch_depth += 1
         if not self.__batch_mode:
             self.__batch_mode = True
             self.__batch = []
 
-    def batch_commit(self):
+    def batch_set_owner(self, owner):
+        """ owner of the next batched commands (see batch_commit) """
+        self.__batch_owner = owner
+
+    @staticmethod
+    def __exec_batch(cmds):
+        utils.exec_command(
+            "%s batch -" % utils.mstpctl_cmd,
+            stdin="\n".join(cmds)
+        )
+
+    def batch_commit(self, on_error=None):
+        """
+        Executes the batch (if this is the outermost batch_commit call)
+
+        :param on_error: if the batch fails and on_error is set, the
+        commands are executed again owner by owner and on_error(owner, e)
+        is called for each owner whose commands failed, instead of raising
+        """
+        if self.__batch_depth > 1:
+            self.__batch_depth -= 1
+            return
+        self.__batch_depth = 0
         if not self.__batch_mode or not self.__batch:
+            self.__batch_mode = False
+            self.__batch = None
+            self.__batch_owner = None
             return
+        batch = self.__batch
+        self.__batch_mode = False
+        self.__batch = None
+        self.__batch_owner = None
         try:
-            utils.exec_command(
-                "%s batch -" % utils.mstpctl_cmd,
-                stdin="\n".join(self.__batch)
-            )
+            self.__exec_batch([cmd for _, cmd in batch])
         except Exception:
-            raise
-        finally:
-            self.__batch_mode = False
-            del self.__batch
-            self.__batch = None
+            if not on_error:
+                raise
+            owners = []
+            cmds = {}
+            for owner, cmd in batch:
+                if owner not in cmds:
+                    owners.append(owner)
+                    cmds[owner] = []
+                cmds[owner].append(cmd)
+            for owner in owners:
+                try:
+                    self.__exec_batch(cmds[owner])
+                except Exception as e:
+                    on_error(owner, e)
 
     ###############################################################################
     ###############################################################################
@@ -22,6 +22,8 @@
 # io -- all io (file) handlers
 #
 
+import os
+import re
 import json
 import struct
 import socket
@@ -86,6 +88,9 @@ class SocketIO(object):
         (first 4 bytes) then with the data. That way the the transfer is more
         reliable
         """
+        if isinstance(data, str):
+            data = data.encode()
+
         ready = select.select([], [_socket], [])
         if ready and ready[1] and ready[1][0] == _socket:
             frmt = "=%ds" % len(data)
@@ -121,6 +126,24 @@ class SocketIO(object):
 
         return None
 
+    def init_socket_cred_options(self):
+        """
+        Set SO_PASSCRED and SO_PEERCRED values for the running architecture
+        """
+        try:
+            self.SO_PASSCRED = socket.SO_PASSCRED
+            self.SO_PEERCRED = socket.SO_PEERCRED
+        except AttributeError:
+            # powerpc is the only non-generic we care about. alpha, mips,
+            # sparc, and parisc also have non-generic values.
+            machine = os.uname()[4]
+            if re.search(r"^(ppc|powerpc)", machine):
+                self.SO_PASSCRED = 20
+                self.SO_PEERCRED = 21
+            else:
+                self.SO_PASSCRED = 16
+                self.SO_PEERCRED = 17
+
     def get_socket_peer_cred(self, _socket):
         """
         Returns tuple of (pid, uid, gid) of connected AF_UNIX stream socket
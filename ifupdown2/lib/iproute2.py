@@ -24,10 +24,11 @@
 
 import re
 import shlex
+import logging
 import signal
 import ipaddress
+import threading
 import subprocess
-import json
 
 try:
     from ifupdown2.lib.sysfs import Sysfs
@@ -59,19 +60,153 @@ except Exception:
 ################################################################################
 
 
+class IPRoute2BatchProcess(object):
+    """
+    Long lived "ip -force -batch -" (or "bridge -force -batch -") process.
+
+    Commands are written to the process stdin followed by a sync line (an
+    unknown object). The process prints "Command failed -:<line>" on stderr
+    for every command that failed (preceded by the error message) so we
+    read stderr until the sync line fails, and map the errors back to the
+    commands (and their interface) with the line numbers.
+
+    iproute2 caches the ifindex of the devices it resolved, the process is
+    restarted when one of those devices is created or deleted.
+    """
+
+    SYNC = "ifupdown2-sync"
+    FAILED_REGEX = re.compile(r"^Command failed -:(\d+)$")
+    # devices resolved by a command ("link" is also the ip object name)
+    IFNAME_REGEX = re.compile(r"\s(?:dev|master|link)\s+(\S+)")
+    DEV_REGEX = re.compile(r"\sdev\s+(\S+)")
+
+    def __init__(self, prefix):
+        self.logger = logging.getLogger("ifupdown2.%s" % self.__class__.__name__)
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.process = None
+        self.lineno = 0
+        # devices resolved by the process
+        self.ifnames = set()
+        self.stale = False
+
+    def __start(self):
+        self.stop()
+        self.process = subprocess.Popen(
+            shlex.split("%s -force -batch -" % self.prefix),
+            stdin=subprocess.PIPE,
+            stdout=utils.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+        self.lineno = 0
+        self.ifnames = set()
+        self.stale = False
+
+    def stop(self):
+        process, self.process = self.process, None
+        if not process:
+            return
+        try:
+            process.stdin.close()
+            process.wait(timeout=5)
+        except Exception:
+            process.kill()
+            process.wait()
+
+    def link_changed(self, ifname, exists):
+        """ netlink cache link watcher """
+        if ifname in self.ifnames:
+            self.stale = True
+
+    def __write(self, data):
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except Exception:
+            pass
+
+    def run(self, commands):
+        """
+        Run commands in the batch process, raises an exception listing
+        the failed commands (by interface)
+        :param commands: list of commands
+        """
+        with self.lock:
+            if self.stale or not self.process or self.process.poll() is not None:
+                self.__start()
+
+            utils._log_command_exec("%s -force -batch -" % self.prefix, "\n".join(commands))
+
+            first_lineno = self.lineno + 1
+            self.lineno += len(commands) + 1
+            sync_lineno = self.lineno
+
+            for cmd in commands:
+                self.ifnames.update(self.IFNAME_REGEX.findall(cmd))
+
+            # the process might be writing errors while we are writing a
+            # large batch: write from another thread to avoid a deadlock
+            writer = threading.Thread(
+                target=self.__write,
+                args=(("\n".join(commands + [self.SYNC]) + "\n").encode(),)
+            )
+            writer.start()
+
+            errors = []
+            output = []
+            try:
+                while True:
+                    line = self.process.stderr.readline()
+                    if not line:
+                        raise Exception("batch process exited (%s)" % " ".join(output))
+                    line = line.decode().rstrip("\n")
+                    match = self.FAILED_REGEX.match(line)
+                    if not match:
+                        output.append(line)
+                        continue
+                    lineno = int(match.group(1))
+                    if lineno == sync_lineno:
+                        break
+                    if lineno >= first_lineno:
+                        errors.append((commands[lineno - first_lineno], " ".join(output)))
+                    output = []
+            except Exception as e:
+                self.stop()
+                raise Exception("cmd '%s -force -batch -' failed: %s" % (self.prefix, str(e)))
+            finally:
+                writer.join()
+
+        if errors:
+            raise Exception("; ".join(
+                "%s: cmd '%s %s' failed (%s)" % (
+                    (self.DEV_REGEX.findall(cmd) or ["?"])[0],
+                    self.prefix,
+                    cmd,
+                    output
+                ) for cmd, output in errors
+            ))
+
+
 class IPRoute2(Cache, Requirements):
 
     VXLAN_UDP_PORT = 4789
     VXLAN_PEER_REGEX_PATTERN = re.compile("\s+dst\s+(\d+.\d+.\d+.\d+)\s+")
 
+    # run-scoped batch processes (see batch_session_start), shared by all
+    # the IPRoute2 objects (one per addon)
+    __session = None
+    __session_refcnt = 0
+    __session_lock = threading.Lock()
+
     def __init__(self):
         Cache.__init__(self)
         Requirements.__init__(self)
 
         self.sysfs = Sysfs
 
-        self.__batch = {}
-        self.__batch_mode = False
+        # batch state is per thread: the same addon can configure several
+        # interfaces concurrently (see ifaceScheduler.run_iface_list_parallel)
+        self.__batch_local = threading.local()
 
         # if bridge utils is not installed overrrides specific functions to
         # avoid constantly checking bridge_utils_is_installed
@@ -131,6 +266,22 @@ class IPRoute2(Cache, Requirements):
     # BATCH
     ############################################################################
 
+    @property
+    def __batch(self):
+        return getattr(self.__batch_local, "batch", None)
+
+    @__batch.setter
+    def __batch(self, value):
+        self.__batch_local.batch = value
+
+    @property
+    def __batch_mode(self):
+        return getattr(self.__batch_local, "batch_mode", False)
+
+    @__batch_mode.setter
+    def __batch_mode(self, value):
+        self.__batch_local.batch_mode = value
+
     def __add_to_batch(self, prefix, cmd):
         if prefix in self.__batch:
             self.__batch[prefix].append(cmd)
@@ -140,7 +291,7 @@ class IPRoute2(Cache, Requirements):
     def __execute_or_batch(self, prefix, cmd):
         if self.__batch_mode:
             self.__add_to_batch(prefix, cmd)
-        else:
+        elif not self.__session_run(prefix, [cmd]):
             utils.exec_command("%s %s" % (prefix, cmd))
 
     def __execute_or_batch_dry_run(self, prefix, cmd):
@@ -164,6 +315,8 @@ class IPRoute2(Cache, Requirements):
             if not self.__batch_mode or not self.__batch:
                 return
             for prefix, commands in self.__batch.items():
+                if self.__session_run(prefix, commands):
+                    continue
                 utils.exec_command(
                     "%s -force -batch -" % prefix,
                     stdin="\n".join(commands)
@@ -172,9 +325,53 @@ class IPRoute2(Cache, Requirements):
             raise
         finally:
             self.__batch_mode = False
-            del self.__batch
             self.__batch = None
 
+    @classmethod
+    def batch_session_start(cls, cache):
+        """
+        Start a batch session: until batch_session_stop, the iproute2
+        commands (single commands and batches) of all the addons are run by
+        one long lived batch process per tool (ip, bridge) instead of
+        forking a new process for each command or batch.
+        Sessions can be nested, the processes are stopped with the last one.
+        """
+        with cls.__session_lock:
+            cls.__session_refcnt += 1
+            if cls.__session is None:
+                cls.__session = (cache, {})
+
+    @classmethod
+    def batch_session_stop(cls):
+        with cls.__session_lock:
+            cls.__session_refcnt -= 1
+            if cls.__session_refcnt > 0 or cls.__session is None:
+                return
+            cache, processes = cls.__session
+            cls.__session = None
+        for process in processes.values():
+            cache.unregister_link_watcher(process.link_changed)
+            process.stop()
+
+    @classmethod
+    def __session_run(cls, prefix, commands):
+        """ runs commands in the session process, returns False if there
+        is no session """
+        with cls.__session_lock:
+            if cls.__session is None:
+                return False
+            cache, processes = cls.__session
+            process = processes.get(prefix)
+            if not process:
+                process = processes[prefix] = IPRoute2BatchProcess(prefix)
+                cache.register_link_watcher(process.link_changed)
+        try:
+            process.run(commands)
+        except OSError:
+            # unable to start the process
+            return False
+        return True
+
     ############################################################################
     # LINK
     ############################################################################
@@ -741,57 +938,6 @@ class IPRoute2(Cache, Requirements):
                 "vlan del vid %s dev %s %s" % (v, ifname, target)
             )
 
-    def bridge_vlan_del_vlan_tunnel_info(self, ifname, vids, vnis):
-        self.__execute_or_batch(
-            utils.bridge_cmd,
-            "vlan del dev %s vid %s tunnel_info id %s" % (
-                ifname, vids, vnis
-            )
-        )
-
-    def bridge_vlan_add_vlan_tunnel_info(self, ifname, vids, vnis):
-        try:
-            self.__execute_or_batch(
-                utils.bridge_cmd,
-                "vlan add dev %s vid %s tunnel_info id %s" % (
-                    ifname, vids, vnis
-                )
-            )
-        except Exception as e:
-            if "exists" not in str(e).lower():
-                self.logger.error(e)
-
-    def bridge_vlan_tunnel_show(self, ifname):
-        tunnel_info = {}
-        try:
-            for entry in utils.exec_command("%s vlan tunnel dev %s" % (utils.bridge_cmd, ifname)).splitlines()[1:]:
-
-                if not entry:
-                    continue
-
-                entry_list = entry.split()
-                length = len(entry_list)
-
-                if length > 2:
-                    # if len == 3, we need to remove the ifname from the list
-                    # $ bridge vlan tunnel show dev vxlan42
-                    # port    vlan ids        tunnel id
-                    # vxlan42   1042    1542
-                    entry_list = entry_list[1:]
-
-                if length < 2:
-                    continue
-
-                vnis = utils.ranges_to_ints([entry_list[0]])
-                tunnel_ids = utils.ranges_to_ints([entry_list[1]])
-
-                for vni, tunnel_id in zip(vnis, tunnel_ids):
-                    tunnel_info[int(vni)] = int(tunnel_id)
-
-        except Exception as e:
-            self.logger.debug("iproute2: bridge vlan tunnel dev %s: %s" % (ifname, str(e)))
-        return tunnel_info
-
     @staticmethod
     def bridge_vlan_add_vid_list(ifname, vids):
         for v in vids:
@@ -962,126 +1108,6 @@ class IPRoute2(Cache, Requirements):
             self.logger.debug("ip_route_get_dev: failed .. %s" % str(e))
         return None
 
-    def bridge_vni_update(self, vxlandev, vnisd):
-        for vr, g in vnisd.items():
-            cmd_args = "vni add dev %s vni %s" % (vxlandev, vr)
-            if g:
-                cmd_args += ' group %s' %(g)
-            self.__execute_or_batch(utils.bridge_cmd, cmd_args)
-
-    def bridge_vni_add(self, vxlan_device, vni):
-        # bridge vni add understands ranges:
-        # bridge vni add dev vx0 vni 10,11,20-30
-        self.__execute_or_batch(
-            utils.bridge_cmd,
-            "vni add dev %s vni %s" % (vxlan_device, ','.join(vni.split()))
-        )
-
-    def bridge_vni_int_set_del(self, vxlan_device, vni):
-        # bridge vni del understands ranges:
-        # bridge vni del dev vx0 vni 10,11,20-30
-        self.__execute_or_batch(
-            utils.bridge_cmd,
-            "vni del dev %s vni %s" % (vxlan_device, ','.join([str(x) for x in vni]))
-        )
-
-    def bridge_vni_del_list(self, vxlandev, vnis):
-        cmd_args = "vni del dev %s vni %s" % (vxlandev, ','.join(vnis))
-        self.__execute_or_batch(utils.bridge_cmd, cmd_args)
-
-    def compress_vnifilter_into_ranges(self, vnis_ints, vnisd):
-        vbegin = 0
-        vend = 0
-        vnisd_ranges = {}
-        for v, g in vnisd.items():
-            if v not in vnis_ints:
-                continue
-            if vbegin == 0:
-                vbegin = v
-                vend = v
-                lastg = g
-                continue
-            elif ((v - vend) == 1 and g == lastg):
-                vend = v
-                continue
-            else:
-                if vend > vbegin:
-                    range = '%d-%d' %(vbegin, vend)
-                    vnisd_ranges[range] = lastg
-                else:
-                    vnisd_ranges['%s' %vbegin] = lastg
-            vbegin = v
-            vend = v
-            lastg = g
-
-        if vbegin:
-                if vend > vbegin:
-                    range = '%d-%d' %(vbegin, vend)
-                    vnisd_ranges[range] = lastg
-                else:
-                    vnisd_ranges['%s' %vbegin] = lastg
-        return vnisd_ranges
-
     def print_data(self, lprefix, data):
         self.logger.info(lprefix)
         self.logger.info(data)
-
-    def bridge_link_update_vni_filter(self, vxlandev, vnisd):
-        try:
-            rvnisd = {}
-            cmd = 'bridge -j -p vni show dev %s' %( vxlandev )
-            output = utils.exec_command(cmd)
-            if output:
-                vnishow = json.loads(output.strip("\n"))
-            self.logger.debug(vnishow)
-            for s in vnishow:
-                vlist = s.get('vnis')
-                for v in vlist:
-                    vstart = v.get('vni')
-                    vend = v.get('vniEnd')
-                    group = v.get('group')
-                    if vend:
-                        for tv in range(int(vstart), int(vend)+1):
-                            if group:
-                                rvnisd[tv] = group
-                            else:
-                                rvnisd[tv] = None
-                    else:
-                        if group:
-                            rvnisd[int(vstart)] = group
-                        else:
-                            rvnisd[int(vstart)] = None
-            vnis_int = vnisd.keys()
-            rvnis_int = rvnisd.keys()
-
-            (vnis_to_del, vnis_to_add) = utils.diff_ids(vnis_int,
-                                                        rvnis_int)
-            self.batch_start()
-            if vnis_to_del:
-                self.bridge_vni_del_list(vxlandev,
-                        utils.compress_into_ranges(vnis_to_del))
-            if vnis_to_add:
-                self.bridge_vni_update(vxlandev,
-                        self.compress_vnifilter_into_ranges(vnis_to_add, vnisd))
-
-            # Do any vnis need group update ?
-            # check remaining vnis
-            vnis_rem = set(vnis_int)
-            if vnis_to_add:
-                vnis_rem = vnis_rem.difference(set(vnis_to_add))
-            if vnis_to_del:
-                vnis_rem = vnis_rem.difference(set(vnis_to_del))
-            vnis_rem = list(vnis_rem)
-            vnis_to_update = []
-            if vnis_rem:
-                for v in vnis_rem:
-                    # check if group is not same
-                    if vnisd.get(v) != rvnisd.get(v):
-                        vnis_to_update.append(v)
-            if vnis_to_update:
-                self.bridge_vni_update(vxlandev,
-                       self.compress_vnifilter_into_ranges(vnis_to_update, vnisd))
-            self.batch_commit()
-        except Exception as e:
-            self.logger.error("bridge vni show failed .. %s" % str(e))
-        return None
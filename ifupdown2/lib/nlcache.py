@@ -29,6 +29,7 @@ import socket
 import struct
 import signal
 import inspect
+import contextlib
 import logging
 import ipaddress
 import threading
@@ -114,6 +115,7 @@ class NetlinkListenerWithCacheErrorNotInitialized(Exception):
 
 class NetlinkError(Exception):
     def __init__(self, exception, prefix=None, ifname=None):
+        self.ifname = ifname
         netlink_exception_message = ['netlink']
 
         if ifname:
@@ -126,6 +128,17 @@ class NetlinkError(Exception):
         super(NetlinkError, self).__init__(": ".join(netlink_exception_message))
 
 
+class NetlinkPipelineError(Exception):
+    """
+    Raised when leaving NetlinkListenerWithCache.pipeline() if some of the
+    pipelined requests failed. .errors is the list of NetlinkError (one per
+    failed request, in TX order).
+    """
+    def __init__(self, errors):
+        self.errors = errors
+        super(NetlinkPipelineError, self).__init__("\n".join(str(e) for e in errors))
+
+
 class NetlinkCacheError(Exception):
     pass
 
@@ -138,9 +151,272 @@ class NetlinkCacheIfindexNotFoundError(NetlinkCacheError):
     pass
 
 
+def _dump_table(table, attr):
+    """
+    The cache dictionaries filled by a netlink dump are wrapped in a property
+    so that the first lookup blocks until the dump of that table is complete
+    (see NetlinkListenerWithCache.start). Once the dump is done the overhead
+    is a simple flag check.
+    """
+    def getter(self):
+        if not self._dump_ready[table]:
+            self.wait_dump(table)
+        return getattr(self, attr)
+
+    def setter(self, value):
+        setattr(self, attr, value)
+
+    return property(getter, setter)
+
+
+class _LazyTable(dict):
+    """
+    Cache table used in lazy mode (see _NetlinkCache.lazy_mode): a lookup
+    miss fetches the missing entry from the kernel, iterating over the
+    table requires the full table to be fetched first.
+    """
+
+    def __init__(self, cache, table, items):
+        dict.__init__(self, items)
+        self.cache = cache
+        self.table = table
+
+    def __missing__(self, key):
+        # dict.__getitem__ calls __missing__ again if the key is still missing
+        if self.cache.lazy_fetch(self.table, key) and dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or (self.cache.lazy_fetch(self.table, key) and dict.__contains__(self, key))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        self.cache.lazy_fetch_all(self.table)
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self.cache.lazy_fetch_all(self.table)
+        return dict.__len__(self)
+
+    def keys(self):
+        self.cache.lazy_fetch_all(self.table)
+        return dict.keys(self)
+
+    def values(self):
+        self.cache.lazy_fetch_all(self.table)
+        return dict.values(self)
+
+    def items(self):
+        self.cache.lazy_fetch_all(self.table)
+        return dict.items(self)
+
+
+class _CachedAttribute:
+    """
+    Decoded value of a cached netlink attribute: unlike nlpacket.Attribute it
+    doesn't keep the raw bytes, the logger and the encoding/decoding state.
+    """
+    __slots__ = ("value", "raw")
+
+    def __init__(self, value, raw=None):
+        self.value = value
+        self.raw = raw
+
+    def get_pretty_value(self, obj=None):
+        if obj and callable(obj):
+            return obj(self.value)
+        return self.value
+
+
+class _CachedPacket:
+    """
+    Compact cache record built from a decoded NetlinkPacket: only the service
+    header fields and the attributes (in ATTRIBUTES) queried by ifupdown2 are
+    kept. It provides the subset of the NetlinkPacket API used on cached
+    objects (attributes[attr].value, get_attribute_value, flags, ifindex...)
+    """
+    __slots__ = ("msgtype", "family", "flags", "ifindex", "priv_flags", "attributes")
+
+    ATTRIBUTES = ()
+
+    def __init__(self, packet):
+        self.msgtype = packet.msgtype
+        self.family = packet.family
+        self.flags = getattr(packet, "flags", 0)
+        # ifindex can be None for request packets cached on ACK
+        self.ifindex = getattr(packet, "ifindex", None)
+        self.priv_flags = packet.priv_flags
+        self.attributes = {
+            attr_type: _CachedAttribute(attr.value, attr.raw)
+            for attr_type, attr in packet.attributes.items()
+            if attr_type in self.ATTRIBUTES
+        }
+
+    def get_attribute_value(self, attr_type, default=None):
+        if attr_type not in self.attributes:
+            return default
+
+        return self.attributes[attr_type].value
+
+    def dump(self):
+        log.debug("%s: family %s, ifindex %s, flags 0x%x, priv_flags 0x%x, attributes %s" % (
+            NetlinkPacket.type_to_string.get(self.msgtype, self.msgtype), self.family, self.ifindex,
+            self.flags or 0, self.priv_flags, {attr_type: attr.value for attr_type, attr in self.attributes.items()}
+        ))
+
+
+class _CachedLink(_CachedPacket):
+    """ RTM_NEWLINK (AF_UNSPEC) cache record """
+    __slots__ = ()
+
+    ATTRIBUTES = frozenset((
+        Link.IFLA_ADDRESS,
+        Link.IFLA_IFNAME,
+        Link.IFLA_MTU,
+        Link.IFLA_LINK,
+        Link.IFLA_MASTER,
+        Link.IFLA_IFALIAS,
+        Link.IFLA_LINKMODE,
+        Link.IFLA_LINKINFO,
+        Link.IFLA_AF_SPEC,
+        Link.IFLA_PROTO_DOWN,
+    ))
+
+
+class _CachedAddress(_CachedPacket):
+    """ RTM_NEWADDR cache record """
+    __slots__ = ("prefixlen", "scope")
+
+    ATTRIBUTES = frozenset((
+        Address.IFA_ADDRESS,
+        Address.IFA_LOCAL,
+        Address.IFA_LABEL,
+        Address.IFA_BROADCAST,
+        Address.IFA_ANYCAST,
+        Address.IFA_MULTICAST,
+    ))
+
+    def __init__(self, packet):
+        _CachedPacket.__init__(self, packet)
+        self.prefixlen = getattr(packet, "prefixlen", None)
+        self.scope = getattr(packet, "scope", None)
+
+
+class FibRule:
+    """
+    Hashable fib rule (ip rule) record: two rules are equal if they have the
+    same selectors, priority, action and table, so the configured rules can
+    be diffed against the running rules with set operations.
+    """
+    __slots__ = ("family", "priority", "table", "action", "iifname", "oifname", "l3mdev", "src", "dst", "fwmark")
+
+    RT_TABLE_NAMES = {
+        253: "default",
+        254: "main",
+        255: "local",
+    }
+
+    def __init__(self, family, priority, table=0, action=None, iifname=None, oifname=None,
+                 l3mdev=0, src=None, dst=None, fwmark=None):
+        self.family = family
+        self.priority = priority
+        self.table = table
+        # default action: lookup table
+        self.action = action or nlpacket.Rule.FR_ACT_TO_TBL
+        self.iifname = iifname
+        self.oifname = oifname
+        self.l3mdev = l3mdev
+        self.src = src
+        self.dst = dst
+        self.fwmark = fwmark
+
+    @classmethod
+    def from_packet(cls, packet):
+        """ build a FibRule from a decoded RTM_NEWRULE packet """
+        return cls(
+            packet.family,
+            packet.get_attribute_value(nlpacket.Rule.FRA_PRIORITY, 0),
+            table=packet.get_table(),
+            action=packet.action,
+            iifname=packet.get_attribute_value(nlpacket.Rule.FRA_IIFNAME),
+            oifname=packet.get_attribute_value(nlpacket.Rule.FRA_OIFNAME),
+            l3mdev=packet.get_attribute_value(nlpacket.Rule.FRA_L3MDEV, 0),
+            src=packet.get_attribute_value(nlpacket.Rule.FRA_SRC),
+            dst=packet.get_attribute_value(nlpacket.Rule.FRA_DST),
+            fwmark=packet.get_attribute_value(nlpacket.Rule.FRA_FWMARK),
+        )
+
+    def __key(self):
+        return (
+            self.family, self.priority, self.table, self.action, self.iifname, self.oifname, self.l3mdev,
+            str(self.src) if self.src is not None else None,
+            str(self.dst) if self.dst is not None else None,
+            self.fwmark
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, FibRule) and self.__key() == other.__key()
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.__key())
+
+    def __repr__(self):
+        return "FibRule(%s)" % self
+
+    def __str__(self):
+        """ ip rule show format: "200: from all oif blue lookup 1001" """
+        rule = ["%s:" % self.priority, "from %s" % (self.src or "all")]
+
+        if self.dst is not None:
+            rule.append("to %s" % self.dst)
+        if self.fwmark is not None:
+            rule.append("fwmark 0x%x" % self.fwmark)
+        if self.iifname:
+            rule.append("iif %s" % self.iifname)
+        if self.oifname:
+            rule.append("oif %s" % self.oifname)
+
+        if self.l3mdev:
+            rule.append("lookup [l3mdev-table]")
+        elif self.action == nlpacket.Rule.FR_ACT_TO_TBL:
+            rule.append("lookup %s" % self.RT_TABLE_NAMES.get(self.table, self.table))
+        else:
+            rule.append(nlpacket.Rule.action_to_string.get(self.action, str(self.action)))
+
+        return " ".join(rule)
+
+
 class _NetlinkCache:
     """ Netlink Cache Class """
 
+    # cache tables filled by the netlink dumps sent when the cache starts
+    LINK_TABLE = "link"
+    BRIDGE_VLAN_TABLE = "bridge-vlan"
+    ADDRESS_TABLE = "address"
+    NETCONF_TABLE = "netconf"
+
+    # max amount of time (in seconds) to wait for a table dump to complete
+    DUMP_TIMEOUT = 60
+
+    _link_cache = _dump_table(LINK_TABLE, "_link_cache_table")
+    _ifname_by_ifindex = _dump_table(LINK_TABLE, "_ifname_by_ifindex_table")
+    _ifindex_by_ifname = _dump_table(LINK_TABLE, "_ifindex_by_ifname_table")
+    _masters_and_slaves = _dump_table(LINK_TABLE, "_masters_and_slaves_table")
+    _slaves_master = _dump_table(LINK_TABLE, "_slaves_master_table")
+    _bridge_vlan_cache = _dump_table(BRIDGE_VLAN_TABLE, "_bridge_vlan_cache_table")
+    _bridge_vlan_vni_cache = _dump_table(BRIDGE_VLAN_TABLE, "_bridge_vlan_vni_cache_table")
+    _addr_cache = _dump_table(ADDRESS_TABLE, "_addr_cache_table")
+    _netconf_cache = _dump_table(NETCONF_TABLE, "_netconf_cache_table")
+
     # we need to store these attributes in a static list to be able to iterate
     # through it when comparing Address objects in add_address()
     # we ignore IFA_CACHEINFO and IFA_FLAGS
@@ -160,11 +436,70 @@ class _NetlinkCache:
         self.__sysfs = Sysfs
         self.__sysfs.cache = self
 
+        # One flag per table, True when the table is fully dumped. They are
+        # cleared by dump_pending() and set by dump_done(), while a dump is in
+        # progress lookups on the table block (except from the dump_worker
+        # thread: the thread servicing the netlinkq and filling the cache)
+        self._dump_ready = {
+            self.LINK_TABLE: True,
+            self.BRIDGE_VLAN_TABLE: True,
+            self.ADDRESS_TABLE: True,
+            self.NETCONF_TABLE: True,
+        }
+        self.dump_worker = None
+
+        # Resync (see resync_start): one generation counter per table, cache
+        # entries are stamped with the generation of their table each time
+        # they are added or updated (by a dump or a notification). Once the
+        # resync dump is done, entries with an older stamp were deleted while
+        # notifications were lost and are purged from the cache.
+        #   _resync_generation: {table: generation} resync in progress
+        #   _resync_pending: {table: int} resync dumps in progress
+        self._generation = dict.fromkeys(self._dump_ready, 0)
+        self._resync_generation = {}
+        self._resync_pending = {}
+        self._link_generation = {}          # ifname: generation
+        self._addr_generation = {}          # ifname: {IFA_ADDRESS: generation}
+        self._bridge_vlan_generation = {}   # ifname: generation
+        self._netconf_generation = {}       # (family, ifindex): generation
+
+        # AF_BRIDGE messages can only be cached once their master is known,
+        # while the link dump is in progress we hold them back in this list
+        self._bridge_vlan_deferred = []
+        self._bridge_vlan_dump_done = False
+
+        # lazy mode (see lazy_mode()):
+        # _lazy_fetch: fetch(table, key) callback, key is None for a full dump
+        # _lazy_fetched: {table: set(keys)} keys successfully fetched
+        # _lazy_dumps: tables to dump on first lookup
+        self._lazy = False
+        self._lazy_fetch = None
+        self._lazy_fetched = {}
+        self._lazy_dumps = set()
+        self._lazy_fetch_thread = None
+
+        # callables notified when a link appears in or disappears from
+        # the cache: callback(ifname, exists) (see register_link_watcher)
+        self._link_watchers = []
+
         self._link_cache = {}
         self._addr_cache = {}
         self._bridge_vlan_cache = {}
         self._bridge_vlan_vni_cache = {}
 
+        # vxlan vni filter (single vxlan device): {ifname: {vni: group}}
+        # we don't listen to the tunnel notifications, this table is filled
+        # on demand (see NetlinkListenerWithCache.get_vxlan_vni_filter),
+        # updated when our own requests are ACKed and flushed at the start
+        # of each run (see vxlan_vni_filter_flush_cache)
+        self._vni_filter_cache = {}
+
+        # fib rules: {family: set(FibRule)}
+        # filled on demand (see NetlinkListenerWithCache.get_rules), updated
+        # when our own requests are ACKed and flushed at the start of each
+        # run (see rules_flush_cache)
+        self._rule_cache = {}
+
         # helper dictionaries
         # ifindex: ifname
         # ifname: ifindex
@@ -194,12 +529,22 @@ class _NetlinkCache:
             AF_MPLS: {}
         }
         # custom lock mechanism for netconf cache
-        self._netconf_cache_lock = threading.Lock()
+        self._netconf_cache_lock = threading.RLock()
 
         # RLock is needed because we don't want to have separate handling in
         # get_ifname, get_ifindex and all the API function
         self._cache_lock = threading.RLock()
 
+        # Lookups usually wait for a table dump with the table's lock held
+        # (the lock the dump_worker needs to fill the table), waiting on a
+        # condition releases the lock until the dump is done.
+        self._dump_condition = {
+            self.LINK_TABLE: threading.Condition(self._cache_lock),
+            self.BRIDGE_VLAN_TABLE: threading.Condition(self._cache_lock),
+            self.ADDRESS_TABLE: threading.Condition(self._cache_lock),
+            self.NETCONF_TABLE: threading.Condition(self._netconf_cache_lock),
+        }
+
         # After sending a RTM_DELLINK request (ip link del DEV) we don't
         # automatically receive an RTM_DELLINK notification but instead we
         # have 3 to 5 RTM_NEWLINK notifications (first the device goes
@@ -256,8 +601,242 @@ class _NetlinkCache:
         # following API:
         #   tx_nlpacket_get_response_with_error_and_wait_for_cache(ifname, nl_packet)
         # to handle both packet transmission, error handling and cache event
-        self._wait_event = None
-        self._wait_event_alarm = threading.Event()
+        # With -j several worker threads can wait at the same time, each
+        # thread has its own slot: {thread ident: ((ifname, msgtype), alarm)}
+        self._wait_events = {}
+
+    def dump_pending(self, table):
+        """
+        Register a dump in progress for 'table', lookups on this table will
+        block until dump_done(table) is called
+        """
+        with self._dump_condition[table]:
+            if table == self.BRIDGE_VLAN_TABLE:
+                self._bridge_vlan_dump_done = False
+            self._dump_ready[table] = False
+
+    def resync_start(self, table):
+        """
+        Register a resync dump for 'table' (after lost notifications): the
+        table's generation is bumped and the table goes in dump pending mode.
+        The existing entries are kept, the dump updates them in place and
+        dump_done() purges the ones the dump didn't refresh.
+        :return: boolean: False if the table doesn't need a resync
+        """
+        with self._dump_condition[table]:
+            if table in self._lazy_dumps:
+                # lazy mode: nothing cached yet, the first lookup dumps the table
+                return False
+            self._generation[table] += 1
+            self._resync_generation[table] = self._generation[table]
+            self._resync_pending[table] = self._resync_pending.get(table, 0) + 1
+            self.dump_pending(table)
+            return True
+
+    def __resync_done_nolock(self, table):
+        """
+        WARNING: LOCK SHOULD BE ACQUIRED BEFORE CALLING THIS FUNCTION
+
+        Every entry still present in the kernel was stamped by the resync dump
+        (or by a more recent notification), purge the older entries.
+        """
+        generation = self._resync_generation.pop(table)
+        del self._resync_pending[table]
+        stale = 0
+
+        if table == self.LINK_TABLE:
+            for ifname in [ifname for ifname in self._link_cache_table if self._link_generation.get(ifname, 0) < generation]:
+                self.remove_link(None, link_ifname=ifname, link_ifindex=self._ifindex_by_ifname_table.get(ifname))
+                stale += 1
+
+        elif table == self.BRIDGE_VLAN_TABLE:
+            for ifname in set(self._bridge_vlan_cache_table) | set(self._bridge_vlan_vni_cache_table):
+                if self._bridge_vlan_generation.get(ifname, 0) < generation:
+                    self._bridge_vlan_cache_table.pop(ifname, None)
+                    self._bridge_vlan_vni_cache_table.pop(ifname, None)
+                    self._bridge_vlan_generation.pop(ifname, None)
+                    stale += 1
+
+        elif table == self.ADDRESS_TABLE:
+            for ifname, addresses in self._addr_cache_table.items():
+                stamps = self._addr_generation.get(ifname, {})
+
+                for address_list in addresses.values():
+                    fresh = [addr for addr in address_list if stamps.get(addr.get_attribute_value(Address.IFA_ADDRESS), 0) >= generation]
+                    stale += len(address_list) - len(fresh)
+                    address_list[:] = fresh
+
+        else:
+            for family, netconf in self._netconf_cache_table.items():
+                for ifindex in [ifindex for ifindex in netconf if self._netconf_generation.get((family, ifindex), 0) < generation]:
+                    del netconf[ifindex]
+                    self._netconf_generation.pop((family, ifindex), None)
+                    stale += 1
+
+        log.info("nlcache: resync: %s: %s stale entries removed (generation %s)" % (table, stale, generation))
+
+    def __set_dump_ready(self, table):
+        with self._dump_condition[table]:
+            if table in self._resync_pending:
+                self._resync_pending[table] -= 1
+
+                if self._resync_pending[table]:
+                    # a more recent resync dump of this table is still in progress
+                    return
+
+                self.__resync_done_nolock(table)
+
+            self._dump_ready[table] = True
+            self._dump_condition[table].notify_all()
+
+    def dump_done(self, table):
+        """
+        Called (from the dump_worker thread) once all the messages of a table
+        dump are cached - wake up any thread waiting on this table
+        """
+        if table == self.BRIDGE_VLAN_TABLE:
+            with self._cache_lock:
+                if not self._dump_ready[self.LINK_TABLE]:
+                    # the deferred AF_BRIDGE messages are still waiting for the
+                    # link dump, the table will be ready once they are processed
+                    self._bridge_vlan_dump_done = True
+                    return
+
+        if table == self.LINK_TABLE:
+            with self._cache_lock:
+                self.__set_dump_ready(table)
+                deferred, self._bridge_vlan_deferred = self._bridge_vlan_deferred, []
+
+                for msg in deferred:
+                    self.add_bridge_vlan(msg)
+
+                if self._bridge_vlan_dump_done:
+                    self._bridge_vlan_dump_done = False
+                    self.__set_dump_ready(self.BRIDGE_VLAN_TABLE)
+            return
+
+        self.__set_dump_ready(table)
+
+    def wait_dump(self, table):
+        """
+        Block until 'table' is fully dumped (see dump_pending and dump_done)
+        """
+        # the dump_worker (or a lazy fetch) fills the cache, it can't wait on itself
+        if threading.current_thread() in (self.dump_worker, self._lazy_fetch_thread):
+            return
+
+        if table in self._lazy_dumps:
+            # lazy mode: this is the first lookup on this table, it is
+            # dumped and cached right now, by the calling thread.
+            with self._cache_lock:
+                if table in self._lazy_dumps:
+                    self._lazy_dumps.discard(table)
+                    self.__lazy_fetch_nolock(table, None)
+                    self.__set_dump_ready(table)
+            return
+
+        with self._dump_condition[table]:
+            if not self._dump_condition[table].wait_for(lambda: self._dump_ready[table], self.DUMP_TIMEOUT):
+                log.error("nlcache: %s dump didn't complete after %s seconds" % (table, self.DUMP_TIMEOUT))
+                # don't make every following lookup wait for the same timeout
+                self._dump_ready[table] = True
+
+    def lazy_mode(self, fetch):
+        """
+        Lazy cache mode, for targeted requests (i.e. ifup swp1): instead of
+        dumping every table when the cache starts, entries are requested
+        from the kernel on the first lookup miss:
+            - links and addresses are fetched one device at a time
+            - bridge vlans and netconf are dumped on their first lookup
+            - full link or address dumps happen when a caller needs all
+            entries (iteration, list of slaves...)
+
+        fetch(table, key) requests and caches 'key' (or the full table if
+        key is None). It is executed by the thread doing the lookup, with
+        the cache lock held, so it must cache the results itself (add_link,
+        add_address...) without going through the netlinkq.
+        """
+        with self._cache_lock:
+            self._lazy = True
+            self._lazy_fetch = fetch
+            self._lazy_fetched = {self.LINK_TABLE: set(), self.ADDRESS_TABLE: set()}
+
+            self._link_cache = _LazyTable(self, self.LINK_TABLE, self._link_cache_table)
+            self._slaves_master = _LazyTable(self, self.LINK_TABLE, self._slaves_master_table)
+            self._addr_cache = _LazyTable(self, self.ADDRESS_TABLE, self._addr_cache_table)
+
+            for table in (self.BRIDGE_VLAN_TABLE, self.NETCONF_TABLE):
+                self._lazy_dumps.add(table)
+                self.dump_pending(table)
+
+    def __lazy_fetch_allowed(self, table, key):
+        # The dump_worker services the netlinkq and updates the cache from the
+        # kernel notifications, it shouldn't trigger any request. While a
+        # fetch is in progress the cache is updated with its results.
+        return (
+            table in self._lazy_fetched
+            and self._lazy_fetch_thread is None
+            and key not in self._lazy_fetched[table]
+            and threading.current_thread() is not self.dump_worker
+        )
+
+    def __lazy_fetch_nolock(self, table, key):
+        """
+        :return: boolean: True if the request succeeded
+        """
+        self._lazy_fetch_thread = threading.current_thread()
+        try:
+            self._lazy_fetch(table, key)
+            return True
+        except Exception as e:
+            log.debug("nlcache: lazy mode: %s %s: %s" % (table, key or "dump", str(e)))
+            return False
+        finally:
+            self._lazy_fetch_thread = None
+
+    def lazy_fetch(self, table, key):
+        """
+        Lazy mode: request 'key' from the kernel. The key is only marked as
+        fetched (and never requested again) if the request succeeded and,
+        for links, the device exists: a failed or empty lookup is retried
+        on the next miss.
+        :return: boolean: True if the key was requested
+        """
+        with self._cache_lock:
+            if not self.__lazy_fetch_allowed(table, key):
+                return False
+            if self.__lazy_fetch_nolock(table, key) and (
+                table != self.LINK_TABLE or dict.__contains__(self._link_cache_table, key)
+            ):
+                self._lazy_fetched[table].add(key)
+            return True
+
+    def lazy_fetch_all(self, table):
+        """
+        Lazy mode: dump the entire table, the table then goes back to a
+        regular dictionary.
+        """
+        with self._cache_lock:
+            if not self.__lazy_fetch_allowed(table, None):
+                return
+            if not self.__lazy_fetch_nolock(table, None):
+                # the table stays lazy, the dump is retried on the next call
+                return
+            del self._lazy_fetched[table]
+
+            if table == self.LINK_TABLE:
+                self._link_cache = dict(self._link_cache_table)
+                self._slaves_master = dict(self._slaves_master_table)
+            else:
+                self._addr_cache = dict(self._addr_cache_table)
+
+    def lazy_is_fetched(self, table, key):
+        """
+        Lazy mode: check if 'key' is tracked in 'table' (i.e. was fetched or
+        the full table was dumped)
+        """
+        with self._cache_lock:
+            return table not in self._lazy_fetched or key in self._lazy_fetched[table]
 
     def __handle_type_error(self, func_name, data, exception, return_value):
         """
@@ -348,18 +927,17 @@ class _NetlinkCache:
         Register a cache "wait event" for device named 'ifname' and packet
         type msgtype
 
-        We only one wait_event to be registered. Currently we don't support
-        multi-threaded application so we need to had a strict check. In the
-        future we could have a wait_event queue for multiple thread could
-        register wait event.
+        Each thread can register one wait_event at a time (worker threads
+        of the -j scheduler each get their own slot).
         :param ifname: target device
         :param msgtype: netlink message type (RTM_NEWLINK, RTM_DELLINK etc.)
         :return: boolean: did we successfully register a wait_event?
         """
+        ident = threading.get_ident()
         with self._cache_lock:
-            if self._wait_event:
+            if ident in self._wait_events:
                 return False
-            self._wait_event = (ifname, msgtype)
+            self._wait_events[ident] = ((ifname, msgtype), threading.Event())
         return True
 
     def wait_event(self):
@@ -370,21 +948,31 @@ class _NetlinkCache:
         We set an arbitrary timeout at 1sec in case the kernel doesn't send
         out a notification for the event we want to wait for.
         """
-        if not self._wait_event_alarm.wait(1):
+        ident = threading.get_ident()
+        with self._cache_lock:
+            wait_event = self._wait_events.get(ident)
+        if not wait_event:
+            return
+        (ifname, msgtype), alarm = wait_event
+        if not alarm.wait(1):
             log.debug('nlcache: wait event alarm timeout expired for device "%s" and netlink packet type: %s'
-                      % (self._wait_event[0], NetlinkPacket.type_to_string.get(self._wait_event[1], str(self._wait_event[1]))))
+                      % (ifname, NetlinkPacket.type_to_string.get(msgtype, str(msgtype))))
         with self._cache_lock:
-            self._wait_event = None
-            self._wait_event_alarm.clear()
+            self._wait_events.pop(ident, None)
 
     def unregister_wait_event(self):
         """
-        Clear current wait event (cache can only handle one at once)
+        Clear the calling thread's wait event
         :return:
         """
         with self._cache_lock:
-            self._wait_event = None
-            self._wait_event_alarm.clear()
+            self._wait_events.pop(threading.get_ident(), None)
+
+    def _set_wait_events(self, ifname, msgtype):
+        """ Wake up the threads waiting for (ifname, msgtype), _cache_lock must be held """
+        for event, alarm in self._wait_events.values():
+            if event == (ifname, msgtype):
+                alarm.set()
 
     def override_link_flag(self, ifname, flags):
         # TODO: dont override all the flags just turn on/off IFF_UP
@@ -424,8 +1012,8 @@ class _NetlinkCache:
 
     def DEBUG_IFNAME(self, ifname, with_addresses=False):
         """
-        A very useful function to use while debugging, it dumps the netlink
-        packet with debug and color output.
+        A very useful function to use while debugging, it dumps the cached
+        netlink record.
         """
         import logging
         root = logging.getLogger()
@@ -441,11 +1029,7 @@ class _NetlinkCache:
             nlpacket.log.setLevel(DEBUG)
             nlmanager.log.setLevel(DEBUG)
             with self._cache_lock:
-                obj = self._link_cache[ifname]
-                save_debug = obj.debug
-                obj.debug = True
-                obj.dump()
-                obj.debug = save_debug
+                self._link_cache[ifname].dump()
 
                 #if with_addresses:
                 #    addrs = self._addr_cache.get(ifname, [])
@@ -572,6 +1156,31 @@ class _NetlinkCache:
                 # we raise a custom exception
                 raise NetlinkCacheIfindexNotFoundError('ifindex %s not present in cache' % ifindex)
 
+    def register_link_watcher(self, callback):
+        """
+        Register callback(ifname, exists) to be notified when a link is
+        added to (exists=True) or removed from (exists=False) the cache.
+        The callback is called with the cache lock held: it must be quick
+        and it can't query the cache.
+        """
+        with self._cache_lock:
+            if callback not in self._link_watchers:
+                self._link_watchers.append(callback)
+
+    def unregister_link_watcher(self, callback):
+        with self._cache_lock:
+            try:
+                self._link_watchers.remove(callback)
+            except ValueError:
+                pass
+
+    def __notify_link_watchers_nolock(self, ifname, exists):
+        for callback in self._link_watchers:
+            try:
+                callback(ifname, exists)
+            except Exception as e:
+                log.debug("nlcache: link watcher: %s: %s" % (ifname, str(e)))
+
     def link_exists(self, ifname):
         """
         Check if we have a cache entry for device 'ifname'
@@ -827,6 +1436,9 @@ class _NetlinkCache:
         :param master:
         :return: list of string
         """
+        if self._lazy:
+            # we can only list slaves if we know about every link
+            self.lazy_fetch_all(self.LINK_TABLE)
         try:
             with self._cache_lock:
                 return list(self._masters_and_slaves[master])
@@ -1034,6 +1646,148 @@ class _NetlinkCache:
         with self._cache_lock:
             return self._bridge_vlan_vni_cache.get(ifname)
 
+    def get_vlan_vni_map(self, ifname):
+        """
+        :return: {vlan: vni} uncompressed vlan tunnel mapping of ifname
+        """
+        vlan_vni_map = {}
+        range_begin = None
+
+        with self._cache_lock:
+            for tunnel_id, tunnel_vid, tunnel_flags in self._bridge_vlan_vni_cache.get(ifname) or []:
+                if tunnel_flags & Link.BRIDGE_VLAN_INFO_RANGE_BEGIN:
+                    range_begin = (tunnel_vid, tunnel_id)
+                    continue
+
+                if tunnel_flags & Link.BRIDGE_VLAN_INFO_RANGE_END and range_begin:
+                    vid_start, vni_start = range_begin
+                else:
+                    vid_start, vni_start = tunnel_vid, tunnel_id
+
+                range_begin = None
+
+                for offset in range(tunnel_vid - vid_start + 1):
+                    vlan_vni_map[vid_start + offset] = vni_start + offset
+
+        return vlan_vni_map
+
+    def update_bridge_vlan_tunnels(self, ifname, tunnel_infos, delete=False):
+        """
+        Apply an ACKed vlan tunnel mapping add (or delete) request to the
+        cached tunnel info of ifname (compressed like the kernel does: vlans
+        and vnis both consecutive)
+
+        :param ifname:
+        :param tunnel_infos: list of (vlan_id_start, vlan_id_end, vni_start)
+        :param delete: mappings were deleted
+        """
+        with self._cache_lock:
+            if ifname not in self._bridge_vlan_vni_cache and ifname not in self._bridge_vlan_cache:
+                # the port isn't cached yet, wait for the kernel notification
+                return
+
+            vlan_vni_map = self.get_vlan_vni_map(ifname)
+
+            for vid_start, vid_end, vni_start in tunnel_infos:
+                for offset in range(vid_end - vid_start + 1):
+                    if delete:
+                        vlan_vni_map.pop(vid_start + offset, None)
+                    else:
+                        vlan_vni_map[vid_start + offset] = vni_start + offset
+
+            tunnels = []
+            vlan_ids = sorted(vlan_vni_map.keys())
+            i = 0
+            while i < len(vlan_ids):
+                start = end = vlan_ids[i]
+                while (i + 1 < len(vlan_ids) and vlan_ids[i + 1] == end + 1 and
+                       vlan_vni_map[vlan_ids[i + 1]] == vlan_vni_map[end] + 1):
+                    i += 1
+                    end = vlan_ids[i]
+                if start == end:
+                    tunnels.append((vlan_vni_map[start], start, 0))
+                else:
+                    tunnels.append((vlan_vni_map[start], start, Link.BRIDGE_VLAN_INFO_RANGE_BEGIN))
+                    tunnels.append((vlan_vni_map[end], end, Link.BRIDGE_VLAN_INFO_RANGE_END))
+                i += 1
+
+            self._bridge_vlan_vni_cache[ifname] = tunnels
+
+    def get_vni_filter(self, ifname):
+        """
+        :return: {vni: group} or None if the vni filter of ifname isn't cached
+        """
+        with self._cache_lock:
+            vnis = self._vni_filter_cache.get(ifname)
+            return dict(vnis) if vnis is not None else None
+
+    def set_vni_filter(self, ifname, vni_ranges):
+        """
+        Cache the dumped vni filter of ifname
+
+        :param ifname:
+        :param vni_ranges: list of (vni_start, vni_end, group)
+        """
+        with self._cache_lock:
+            self._vni_filter_cache[ifname] = {}
+        self.update_vni_filter(ifname, vni_ranges)
+
+    def flush_vni_filter(self):
+        """ drop the cached vni filters, they are dumped again on next use """
+        with self._cache_lock:
+            self._vni_filter_cache.clear()
+
+    def update_vni_filter(self, ifname, vni_ranges, delete=False):
+        """
+        Apply an ACKed vni filter add (or delete) request to the cached vni
+        filter of ifname (if cached)
+
+        :param ifname:
+        :param vni_ranges: list of (vni_start, vni_end, group)
+        :param delete: vnis were deleted
+        """
+        with self._cache_lock:
+            vnis = self._vni_filter_cache.get(ifname)
+
+            if vnis is None:
+                return
+
+            for vni_start, vni_end, group in vni_ranges:
+                for vni in range(vni_start, vni_end + 1):
+                    if delete:
+                        vnis.pop(vni, None)
+                    else:
+                        vnis[vni] = str(group) if group else None
+
+    def get_rules(self, family):
+        """
+        :return: frozenset of FibRule or None if the rules of family aren't cached
+        """
+        with self._cache_lock:
+            rules = self._rule_cache.get(family)
+            return frozenset(rules) if rules is not None else None
+
+    def set_rules(self, family, rules):
+        """ cache the dumped rules of family (None invalidates the cache) """
+        with self._cache_lock:
+            if rules is None:
+                self._rule_cache.pop(family, None)
+            else:
+                self._rule_cache[family] = set(rules)
+
+    def update_rule(self, rule, delete=False):
+        """ apply an ACKed rule add (or delete) request to the cached rules """
+        with self._cache_lock:
+            rules = self._rule_cache.get(rule.family)
+
+            if rules is None:
+                return
+
+            if delete:
+                rules.discard(rule)
+            else:
+                rules.add(rule)
+
     def get_pvid_and_vids(self, ifname):
         """
         vlan-identifiers are stored in:
@@ -1109,6 +1863,76 @@ class _NetlinkCache:
             log.exception("get_pvid")
         return pvid
 
+    def update_bridge_vlans(self, ifname, vlan_infos, delete=False):
+        """
+        Apply an ACKed bridge vlan add (or delete) request to the cached
+        vlans of ifname, we don't have to wait for the AF_BRIDGE RTM_NEWLINK
+        notification (that will override this entry anyway).
+
+        The cached vlans are uncompressed, updated then compressed again
+        like the kernel does (pvid never in a range).
+
+        :param ifname:
+        :param vlan_infos: list of (flags, vlan_id_start, vlan_id_end)
+        :param delete: vlans were deleted
+        """
+        range_flags = Link.BRIDGE_VLAN_INFO_RANGE_BEGIN | Link.BRIDGE_VLAN_INFO_RANGE_END
+        port_flags = Link.BRIDGE_VLAN_INFO_PVID | Link.BRIDGE_VLAN_INFO_UNTAGGED
+
+        with self._cache_lock:
+            bridge_vlans_tuples = self._bridge_vlan_cache.get(ifname)
+
+            if bridge_vlans_tuples is None:
+                # no entry yet (i.e. the port was just enslaved and still
+                # has the default vlan) wait for the kernel notification
+                return
+
+            vlans = {}
+            range_begin_vlan_id = None
+
+            for (vlan_id, vlan_flag) in sorted(bridge_vlans_tuples):
+                if vlan_flag & Link.BRIDGE_VLAN_INFO_RANGE_BEGIN:
+                    range_begin_vlan_id = vlan_id
+                    continue
+                start = vlan_id
+                if vlan_flag & Link.BRIDGE_VLAN_INFO_RANGE_END and range_begin_vlan_id:
+                    start = range_begin_vlan_id
+                range_begin_vlan_id = None
+                for x in range(start, vlan_id + 1):
+                    vlans[x] = vlan_flag & ~range_flags
+
+            for vlan_flag, start, end in vlan_infos:
+                for x in range(start, end + 1):
+                    if delete:
+                        vlans.pop(x, None)
+                        continue
+                    if vlan_flag & Link.BRIDGE_VLAN_INFO_PVID:
+                        for vlan_id, flags in vlans.items():
+                            vlans[vlan_id] = flags & ~Link.BRIDGE_VLAN_INFO_PVID
+                    vlans[x] = (vlans.get(x, 0) & ~port_flags) | (vlan_flag & port_flags)
+
+            vlans_list = []
+            vlan_ids = sorted(vlans.keys())
+            i = 0
+            while i < len(vlan_ids):
+                start = vlan_ids[i]
+                flags = vlans[start]
+                end = start
+                if not flags & Link.BRIDGE_VLAN_INFO_PVID:
+                    while (i + 1 < len(vlan_ids) and vlan_ids[i + 1] == end + 1 and
+                           vlans[vlan_ids[i + 1]] == flags):
+                        i += 1
+                        end = vlan_ids[i]
+                if start == end:
+                    vlans_list.append((start, flags))
+                else:
+                    vlans_list.append((start, flags | Link.BRIDGE_VLAN_INFO_RANGE_BEGIN))
+                    vlans_list.append((end, flags | Link.BRIDGE_VLAN_INFO_RANGE_END))
+                i += 1
+
+            self._bridge_vlan_cache[ifname] = vlans_list
+            self._bridge_vlan_generation[ifname] = self._generation[self.BRIDGE_VLAN_TABLE]
+
     def bridge_exists(self, ifname):
         """
         Check if cached device is a bridge
@@ -1214,6 +2038,9 @@ class _NetlinkCache:
                 except Exception:
                     self._rtm_newlink_nomasterq.remove(ifname)
 
+        # only the compact record is cached, not the decoded packet
+        cached_link = _CachedLink(link)
+
         # we need to check if the device was previously enslaved
         # so we can update the _masters_and_slaves and _slaves_master
         # dictionaries if the master has changed or was un-enslaved.
@@ -1221,9 +2048,9 @@ class _NetlinkCache:
 
         with self._cache_lock:
 
-            # do we have a wait event registered for RTM_NEWLINK this ifname
-            if self._wait_event and self._wait_event == (ifname, RTM_NEWLINK):
-                self._wait_event_alarm.set()
+            # do we have wait events registered for RTM_NEWLINK this ifname
+            if self._wait_events:
+                self._set_wait_events(ifname, RTM_NEWLINK)
 
             try:
                 ifla_master_attr = self._link_cache[ifname].attributes.get(Link.IFLA_MASTER)
@@ -1240,7 +2067,12 @@ class _NetlinkCache:
                 # here just in case?
                 pass
 
-            self._link_cache[ifname] = link
+            # (dict.__contains__: in lazy mode a miss shouldn't trigger a fetch)
+            if self._link_watchers and not dict.__contains__(self._link_cache, ifname):
+                self.__notify_link_watchers_nolock(ifname, True)
+
+            self._link_cache[ifname] = cached_link
+            self._link_generation[ifname] = self._generation[self.LINK_TABLE]
 
             ######################################################
             # update helper dictionaries and handle link renamed #
@@ -1275,6 +2107,7 @@ class _NetlinkCache:
                                   % (old_ifname_entry_for_ifindex, old_ifname_entry_for_ifindex))
                     try:
                         del self._link_cache[old_ifname_entry_for_ifindex]
+                        self.__notify_link_watchers_nolock(old_ifname_entry_for_ifindex, False)
                     except KeyError:
                         log.debug('update_helper_dicts: del _link_cache[%s]: KeyError ifname: %s'
                                   % (old_ifname_entry_for_ifindex, old_ifname_entry_for_ifindex))
@@ -1376,6 +2209,11 @@ class _NetlinkCache:
 
         # Todo: acquire the lock only when really needed
         with self._cache_lock:
+            if not self._dump_ready[self.LINK_TABLE]:
+                # replayed by dump_done(LINK_TABLE) once the masters are cached
+                self._bridge_vlan_deferred.append(msg)
+                return
+
             ifla_af_spec = msg.get_attribute_value(Link.IFLA_AF_SPEC)
             ifname = msg.get_attribute_value(Link.IFLA_IFNAME)
 
@@ -1388,7 +2226,18 @@ class _NetlinkCache:
                 # those notifications should be ignored.
                 ifla_master = msg.get_attribute_value(Link.IFLA_MASTER)
 
-                if not ifla_master or not ifla_master in self._ifname_by_ifindex:
+                if not ifla_master:
+                    return
+
+                if self._lazy:
+                    # in lazy mode the master might not be cached, but
+                    # get_ifname falls back on sysfs if needed
+                    try:
+                        self.get_ifname(ifla_master)
+                    except NetlinkCacheIfindexNotFoundError:
+                        return
+
+                elif not ifla_master in self._ifname_by_ifindex:
                     return
             except Exception:
                 pass
@@ -1412,6 +2261,7 @@ class _NetlinkCache:
                     self._bridge_vlan_vni_cache.update({ifname: x_value})
 
             self._bridge_vlan_cache.update({ifname: vlans_list})
+            self._bridge_vlan_generation[ifname] = self._generation[self.BRIDGE_VLAN_TABLE]
 
     def force_add_slave(self, master, slave):
         """
@@ -1528,6 +2378,7 @@ class _NetlinkCache:
                     pass
                 finally:
                     del self._link_cache[ifname]
+                    self.__notify_link_watchers_nolock(ifname, False)
             except KeyError:
                 # KeyError means that the link doesn't exists in the cache
                 log.debug('del _link_cache: KeyError ifname: %s' % ifname)
@@ -1550,6 +2401,8 @@ class _NetlinkCache:
             except Exception:
                 pass
 
+            self._vni_filter_cache.pop(ifname, None)
+
             try:
                 del self._ifname_by_ifindex[ifindex]
             except KeyError:
@@ -1565,6 +2418,10 @@ class _NetlinkCache:
             except KeyError:
                 log.debug('del _addr_cache: KeyError ifname: %s' % ifname)
 
+            self._link_generation.pop(ifname, None)
+            self._addr_generation.pop(ifname, None)
+            self._bridge_vlan_generation.pop(ifname, None)
+
             try:
                 del self._masters_and_slaves[ifname]
             except KeyError:
@@ -1622,9 +2479,18 @@ class _NetlinkCache:
             log.debug('nlcache: add_address: cannot cache addr for ifindex %s' % ifindex)
             return
 
-        ip_version = addr.get_attribute_value(Address.IFA_ADDRESS).version
+        if self._lazy and threading.current_thread() is self.dump_worker and not self.lazy_is_fetched(self.ADDRESS_TABLE, ifname):
+            # lazy mode: notification for a device we haven't fetched yet, we
+            # don't know its other addresses, caching this one would make the
+            # entry look complete
+            return
+
+        addr = _CachedAddress(addr)
+        ip_with_prefix = addr.get_attribute_value(Address.IFA_ADDRESS)
+        ip_version = ip_with_prefix.version
 
         with self._cache_lock:
+            self._addr_generation.setdefault(ifname, {})[ip_with_prefix] = self._generation[self.ADDRESS_TABLE]
 
             if ifname in self._addr_cache:
                 address_list = self._addr_cache[ifname][ip_version]
@@ -1769,7 +2635,9 @@ class _NetlinkCache:
         """
         try:
             with self._netconf_cache_lock:
-                self._netconf_cache[msg.family][msg.get_attribute_value(msg.NETCONFA_IFINDEX)] = msg
+                ifindex = msg.get_attribute_value(msg.NETCONFA_IFINDEX)
+                self._netconf_cache[msg.family][ifindex] = msg
+                self._netconf_generation[(msg.family, ifindex)] = self._generation[self.NETCONF_TABLE]
         except Exception:
             pass
 
@@ -1779,7 +2647,9 @@ class _NetlinkCache:
         """
         try:
             with self._netconf_cache_lock:
-                del self._netconf_cache[msg.family][msg.get_attribute_value(msg.NETCONFA_IFINDEX)]
+                ifindex = msg.get_attribute_value(msg.NETCONFA_IFINDEX)
+                self._netconf_generation.pop((msg.family, ifindex), None)
+                del self._netconf_cache[msg.family][ifindex]
         except Exception:
             pass
 
@@ -1788,8 +2658,11 @@ class _NetlinkCache:
         Return netconf device forwarding value
         """
         try:
+            # get_ifindex might wait for the link dump, it shouldn't hold the
+            # netconf lock meanwhile (the worker needs it to cache netconfs)
+            ifindex = self.get_ifindex(ifname)
             with self._netconf_cache_lock:
-                return self._netconf_cache[family][self.get_ifindex(ifname)].get_attribute_value(Netconf.NETCONFA_FORWARDING)
+                return self._netconf_cache[family][ifindex].get_attribute_value(Netconf.NETCONFA_FORWARDING)
         except Exception:
             # if KeyError and family == AF_INET6: ipv6 is probably disabled on this device
             return None
@@ -1799,8 +2672,9 @@ class _NetlinkCache:
         Return netconf device MPLS input value
         """
         try:
+            ifindex = self.get_ifindex(ifname)
             with self._netconf_cache_lock:
-                return self._netconf_cache[AF_MPLS][self.get_ifindex(ifname)].get_attribute_value(Netconf.NETCONFA_INPUT)
+                return self._netconf_cache[AF_MPLS][ifindex].get_attribute_value(Netconf.NETCONFA_INPUT)
         except Exception:
             return None
 
@@ -1963,6 +2837,27 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
     __instance = None
     VXLAN_UDP_PORT = 4789
 
+    # maximum number of requests in flight in a pipeline (see .pipeline())
+    PIPELINE_WINDOW = 64
+
+    CACHE_TABLES = (
+        _NetlinkCache.LINK_TABLE,
+        _NetlinkCache.BRIDGE_VLAN_TABLE,
+        _NetlinkCache.ADDRESS_TABLE,
+        _NetlinkCache.NETCONF_TABLE,
+    )
+
+    # tables to resync when notifications of a given type were lost
+    # (AF_BRIDGE vlan notifications are RTM_NEWLINK/RTM_DELLINK messages)
+    MSGTYPE_TO_CACHE_TABLES = {
+        nlpacket.RTM_NEWLINK: (_NetlinkCache.LINK_TABLE, _NetlinkCache.BRIDGE_VLAN_TABLE),
+        nlpacket.RTM_DELLINK: (_NetlinkCache.LINK_TABLE, _NetlinkCache.BRIDGE_VLAN_TABLE),
+        nlpacket.RTM_NEWADDR: (_NetlinkCache.ADDRESS_TABLE,),
+        nlpacket.RTM_DELADDR: (_NetlinkCache.ADDRESS_TABLE,),
+        nlpacket.RTM_NEWNETCONF: (_NetlinkCache.NETCONF_TABLE,),
+        nlpacket.RTM_DELNETCONF: (_NetlinkCache.NETCONF_TABLE,),
+    }
+
     @staticmethod
     def init(log_level):
         """
@@ -2039,10 +2934,11 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
             self.WORKQ_SERVICE_NETLINK_QUEUE: self.service_netlinkq,
         }
 
-        # NetlinkListenerWithCache first dumps links and addresses then start
-        # a worker thread before returning. The worker thread processes the
-        # workq mainly to service (process) the netlinkq which contains our
-        # netlink packet (notification coming from the Kernel).
+        # NetlinkListenerWithCache starts a worker thread then requests the
+        # links, addresses (...) dumps before returning. The worker thread
+        # processes the workq mainly to service (process) the netlinkq which
+        # contains our netlink packet (dumps and notifications coming from
+        # the Kernel).
         # When the main thread is making netlin requests (i.e. bridge add etc
         # ...) the main thread will sleep (thread.event.wait) until we notify
         # it when receiving an ack associated with the request. The request
@@ -2055,10 +2951,13 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
         #     User must check the return value of it's netlink requests and
         #     catch any exceptions, for that purpose please use API:
         #        - tx_nlpacket_get_response_with_error
-        self.errorq = list()
+        self.errorq = OrderedDict()
         self.errorq_lock = threading.Lock()
         self.errorq_enabled = True
 
+        # per-thread list of the requests in flight (see .pipeline())
+        self.pipeline_local = threading.local()
+
         # when ifupdown2 starts, we need to fill the netlink cache
         # GET_LINK/ADDR request are asynchronous, we need to block
         # and wait for the cache to be filled. We are using this one
@@ -2070,13 +2969,23 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
 
         self.worker = None
 
+        # private (synchronous) netlink manager used in lazy mode
+        self.lazy_manager = None
+
+        # private (synchronous) netlink manager for the on demand requests
+        # that aren't part of the cache dumps (see __get_sync_manager)
+        self.sync_manager = None
+        self.sync_manager_lock = threading.Lock()
+
     def __str__(self):
         return "NetlinkListenerWithCache"
 
-    def start(self):
+    def start(self, lazy=False):
         """
         Start NetlinkListener -
         cache all links, bridges, addresses and netconfs
+        :param lazy: only cache devices when they are looked up (see
+        _NetlinkCache.lazy_mode), for requests targeting a few devices
         :return:
         """
         self.restart_listener()
@@ -2108,15 +3017,6 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
             nlpacket.NLMSG_DONE  # should be in supported_messages ?
         )
 
-        # get all links and wait for the cache to be filled
-        self.get_all_links_wait_netlinkq()
-
-        # get all addresses and wait for cache to be filled
-        self.get_all_addresses_wait_netlinkq()
-
-        # get a netconf dump and wait for the cached to be filled
-        self.get_all_netconf_wait_netlinkq()
-
         # TODO: on ifquery we shoudn't start any thread (including listener in NetlinkListener)
         # only for standalone code.
         #import sys
@@ -2125,18 +3025,178 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
         #        self.worker = None
         #        return
 
-        # start the netlinkq worker thread
+        # start the netlinkq worker thread, it decodes and caches the
+        # dumps (requested below) as they arrive
         self.worker = threading.Thread(target=self.main, name='NetlinkListenerWithCache')
+        self.cache.dump_worker = self.worker
         self.worker.start()
         self.is_ready.wait()
 
+        if lazy:
+            self.logger.info("netlink cache: lazy mode")
+            # the lazy requests are synchronous, the calling thread reads the
+            # replies on its own socket (not watched by the listener thread)
+            self.lazy_manager = nlmanager.NetlinkManager(pid_offset=2, use_color=self.use_color)
+            self.lazy_manager.debug = self.debug
+            self.lazy_manager.tx_socket_allocate()
+            self.cache.lazy_mode(self.lazy_fetch)
+            return
+
+        # links, bridge vlans, addresses and netconf are dumped in parallel,
+        # we don't wait for the dumps to complete: the first cache lookup on
+        # a table blocks until that table is filled.
+        self.dump_all_async()
+
+    def lazy_fetch(self, table, key):
+        """
+        Lazy mode: request device 'key' (or the full table if key is None)
+        and cache the result, see _NetlinkCache.lazy_mode
+        """
+        if table == _NetlinkCache.LINK_TABLE:
+            self.logger.debug("nlcache: lazy mode: requesting link %s" % (key or "dump"))
+
+            for link in self.lazy_manager.link_dump(key) or []:
+                if link.family == socket.AF_UNSPEC:
+                    self.cache.add_link(link)
+
+        elif table == _NetlinkCache.ADDRESS_TABLE:
+            self.logger.debug("nlcache: lazy mode: requesting %s addresses" % (key or "all"))
+
+            if key:
+                ifindex = self.cache.get_ifindex(key)
+                strict_check = self.lazy_manager.tx_socket_set_strict_check(True)
+                try:
+                    addresses = self.lazy_manager.addr_dump(ifindex)
+                finally:
+                    if strict_check:
+                        self.lazy_manager.tx_socket_set_strict_check(False)
+            else:
+                addresses = self.lazy_manager.addr_dump()
+
+            for addr in addresses or []:
+                self.cache.add_address(addr)
+
+        elif table == _NetlinkCache.BRIDGE_VLAN_TABLE:
+            self.logger.debug("nlcache: lazy mode: requesting bridge vlan dump")
+
+            br_link = Link(nlpacket.RTM_GETLINK, nlpacket.RTM_GETLINK in self.debug, use_color=self.use_color)
+            br_link.flags = NLM_F_REQUEST | nlpacket.NLM_F_DUMP
+            br_link.body = struct.pack('Bxxxiii', socket.AF_BRIDGE, 0, 0, 0)
+            br_link.add_attribute(Link.IFLA_EXT_MASK, Link.RTEXT_FILTER_BRVLAN_COMPRESSED)
+            br_link.build_message(next(self.lazy_manager.sequence), self.lazy_manager.pid)
+
+            for link in self.lazy_manager.tx_nlpacket_get_response(br_link) or []:
+                if link.family == socket.AF_BRIDGE:
+                    self.cache.add_bridge_vlan(link)
+
+        elif table == _NetlinkCache.NETCONF_TABLE:
+            self.logger.debug("nlcache: lazy mode: requesting netconf dump")
+
+            for msg in self.lazy_manager.netconf_dump() or []:
+                self.cache.add_netconf(msg)
+
+    def dump_all_async(self):
+        """
+        Request a dump of all the cached tables, each dump is sent on its own
+        netlink socket (see NetlinkManagerWithListener.tx_nlpacket_dump_async)
+        so the kernel processes them concurrently.
+        """
+        self.logger.info("requesting link, bridge vlan, address and netconf dumps")
+
+        for table in self.CACHE_TABLES:
+            self.__dump_table_async(table, self.__dump_request(table))
+
+    def __dump_request(self, table):
+        if table == _NetlinkCache.LINK_TABLE:
+            link = Link(nlpacket.RTM_GETLINK, nlpacket.RTM_GETLINK in self.debug, use_color=self.use_color)
+            link.flags = NLM_F_REQUEST | nlpacket.NLM_F_DUMP
+            link.body = struct.pack('Bxxxiii', socket.AF_UNSPEC, 0, 0, 0)
+            return link
+
+        elif table == _NetlinkCache.BRIDGE_VLAN_TABLE:
+            br_link = Link(nlpacket.RTM_GETLINK, nlpacket.RTM_GETLINK in self.debug, use_color=self.use_color)
+            br_link.flags = NLM_F_REQUEST | nlpacket.NLM_F_DUMP
+            br_link.body = struct.pack('Bxxxiii', socket.AF_BRIDGE, 0, 0, 0)
+            br_link.add_attribute(Link.IFLA_EXT_MASK, Link.RTEXT_FILTER_BRVLAN_COMPRESSED)
+            return br_link
+
+        elif table == _NetlinkCache.ADDRESS_TABLE:
+            addr = Address(nlpacket.RTM_GETADDR, nlpacket.RTM_GETADDR in self.debug, use_color=self.use_color)
+            addr.flags = NLM_F_REQUEST | nlpacket.NLM_F_DUMP
+            addr.body = struct.pack('Bxxxi', socket.AF_UNSPEC, 0)
+            return addr
+
+        else:
+            netconf = Netconf(nlpacket.RTM_GETNETCONF, nlpacket.RTM_GETNETCONF in self.debug, use_color=self.use_color)
+            netconf.flags = NLM_F_REQUEST | nlpacket.NLM_F_DUMP
+            netconf.body = struct.pack('Bxxxiii', socket.AF_UNSPEC, 0, 0, 0)
+            return netconf
+
+    def resync_after_error(self, error):
+        """
+        Called by the worker thread on WORKQ_SERVICE_ERROR: notifications
+        were lost, the cache might be stale.
+            - OVERFLOW (ENOBUFS): we don't know which messages the kernel
+            dropped, all the tables are dumped again.
+            - DROPPED: the netlinkq was full, only the tables associated
+            with the dropped message types are dumped again.
+        The cache lookups on those tables block until the dumps are done.
+        The dumps are reconciled with the existing entries: updated in place,
+        the entries missing from the dump are purged (see resync_start).
+        """
+        if error == self.WORKQ_ERROR_DROPPED:
+            tables = set()
+
+            # complete the dumps whose NLMSG_DONE was dropped first, so their
+            # tables don't stay pending. If messages of these dumps were also
+            # dropped their msgtypes are listed below: the tables are resynced
+            self.netlinkq_complete_dropped_dumps()
+
+            for msgtype in self.netlinkq_pop_dropped_msgtypes():
+                tables.update(self.MSGTYPE_TO_CACHE_TABLES.get(msgtype, ()))
+        else:
+            tables = set(self.CACHE_TABLES)
+
+        self.netlinkq_counters["resync"] += 1
+
+        for table in self.CACHE_TABLES:
+            if table in tables and self.cache.resync_start(table):
+                self.logger.info("nlcache: resync: requesting %s dump" % table)
+                self.__dump_table_async(table, self.__dump_request(table), resync=True)
+
+    def __dump_table_async(self, table, nl_packet, resync=False):
+        if not resync:
+            self.cache.dump_pending(table)
+        try:
+            self.tx_nlpacket_dump_async(nl_packet, lambda seq, pid: self.__dump_table_done(table, seq, pid))
+        except Exception as e:
+            # we can't leave the table in pending state, lookups would block
+            self.logger.error("nlcache: %s dump: %s" % (table, str(e)))
+            self.cache.dump_done(table)
+
+    def __dump_table_done(self, table, seq, pid):
+        self.logger.debug("nlcache: %s dump complete (seq %s, pid %s)" % (table, seq, pid))
+        self.cache.dump_done(table)
+
     def cleanup(self):
         if not self.__instance:
             return
 
+        self.logger.debug("nlcache: errorq: %s" % self.__errorq_stats_str())
+        self.logger.debug("nlcache: messages per listener wakeup: %s" % self.rx_histogram_str())
+        self.logger.debug("nlcache: netlinkq: %s" % ", ".join("%s %s" % (k, v) for k, v in self.netlinkq_counters.items()))
+
         # passing 0, 0 to the handler so it doesn't log.info
         self.signal_term_handler(0, 0)
 
+        if self.lazy_manager and self.lazy_manager.tx_socket:
+            self.lazy_manager.tx_socket.close()
+            self.lazy_manager.tx_socket = None
+
+        if self.sync_manager and self.sync_manager.tx_socket:
+            self.sync_manager.tx_socket.close()
+            self.sync_manager.tx_socket = None
+
         if self.worker:
             self.worker.join()
 
@@ -2169,7 +3229,8 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
                     if event == self.WORKQ_SERVICE_NETLINK_QUEUE:
                         self.service_netlinkq(self.netlinkq_notify_event)
                     elif event == self.WORKQ_SERVICE_ERROR:
-                        self.logger.error('NetlinkListenerWithCache: WORKQ_SERVICE_ERROR')
+                        self.logger.error('NetlinkListenerWithCache: WORKQ_SERVICE_ERROR (%s)' % options)
+                        self.resync_after_error(options)
                     else:
                         raise Exception("Unsupported workq event %s" % event)
         except Exception:
@@ -2181,9 +3242,18 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
             self.listener.join()
 
     def reset_errorq(self):
-        with self.errorq_lock:
-            self.logger.debug("nlcache: reset errorq")
-            self.errorq = []
+        self.logger.debug("nlcache: reset errorq (%s)" % self.__errorq_stats_str())
+        self.errorq_reset()
+
+    def __errorq_stats_str(self):
+        stats = self.errorq_stats()
+        return (
+            "depth %d, max depth %d, queued %d, claimed %d, expired %d, "
+            "%d lookups in %.6fs (max %.6fs)" % (
+                stats["depth"], stats["max_depth"], stats["queued"], stats["claimed"], stats["expired"],
+                stats["lookups"], stats["lookup_time"], stats["max_lookup_time"]
+            )
+        )
 
     def rx_rtm_newaddr(self, rxed_addr_packet):
         super(NetlinkListenerWithCache, self).rx_rtm_newaddr(rxed_addr_packet)
@@ -2226,40 +3296,21 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
         super(NetlinkListenerWithCache, self).rx_rtm_delnetconf(msg)
         self.cache.remove_netconf(msg)
 
-    def tx_nlpacket_get_response_with_error(self, nl_packet):
+    def __get_error_str(self, nl_packet):
         """
-            After getting an ACK we need to check if this ACK was in fact an
-            error (NLMSG_ERROR). This function go through the .errorq list to
-            find the error packet associated with our request.
-            If found, we process it and raise an exception with the appropriate
-            information/message.
-
-        :param nl_packet:
-        :return:
+        :return: None if nl_packet was ACKed or the error string if the
+        kernel replied with a NLMSG_ERROR
         """
-        self.tx_nlpacket_get_response(nl_packet)
-
-        error_packet = None
-        index = 0
-
-        with self.errorq_lock:
-            for error in self.errorq:
-                if error.seq == nl_packet.seq and error.pid == nl_packet.pid:
-                    error_packet = error
-                    break
-                index += 1
-
-            if error_packet:
-                del self.errorq[index]
+        error_packet = self.errorq_pop(nl_packet.seq, nl_packet.pid)
 
         if not error_packet:
-            return True
+            return None
 
         error_code = abs(error_packet.negative_errno)
 
         if error_packet.msgtype == NLMSG_DONE or not error_code:
             # code NLE_SUCCESS...this is an ACK
-            return True
+            return None
 
         if self.debug:
             error_packet.dump()
@@ -2269,20 +3320,126 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
             strerror = os.strerror(error_code)
 
             if strerror:
-                error_str = "operation failed with '%s' (%s)" % (strerror, error_code)
+                return "operation failed with '%s' (%s)" % (strerror, error_code)
             else:
-                error_str = "operation failed with code %s" % error_code
+                return "operation failed with code %s" % error_code
 
         except ValueError:
-            error_str = "operation failed with code %s" % error_code
+            return "operation failed with code %s" % error_code
+
+    def __tx_nlpacket_get_response_with_error_sync(self, nl_packet):
+        self.tx_nlpacket_get_response(nl_packet)
+
+        error_str = self.__get_error_str(nl_packet)
+
+        if error_str:
+            raise Exception(error_str)
+
+        return True
+
+    def tx_nlpacket_get_response_with_error(self, nl_packet, on_ack=None, error_prefix=None, ifname=None):
+        """
+            After getting an ACK we need to check if this ACK was in fact an
+            error (NLMSG_ERROR). This function looks up the .errorq (indexed by
+            seq and pid) to find the error packet associated with our request.
+            If found, we process it and raise an exception with the appropriate
+            information/message.
+
+            If a pipeline is active (see .pipeline()) the request is only
+            TXed, the ACK is checked when the pipeline is flushed. on_ack is
+            called once the request is ACKed (without error), in pipeline
+            mode error_prefix and ifname are used to build the NetlinkError.
 
-        raise Exception(error_str)
+        :param nl_packet:
+        :return:
+        """
+        pipeline = getattr(self.pipeline_local, "requests", None)
+
+        if pipeline is None:
+            self.__tx_nlpacket_get_response_with_error_sync(nl_packet)
+            if on_ack:
+                on_ack()
+            return True
+
+        if len(pipeline) >= self.PIPELINE_WINDOW:
+            # don't let too many requests in flight, wait for the oldest
+            self.__pipeline_reap(pipeline.pop(0))
+
+        pipeline.append((nl_packet, self.tx_nlpacket_async(nl_packet), on_ack, error_prefix, ifname))
+        return True
+
+    def __pipeline_reap(self, request):
+        nl_packet, ack_event, on_ack, error_prefix, ifname = request
+
+        ack_event.wait()
+        error_str = self.__get_error_str(nl_packet)
+
+        if error_str:
+            self.pipeline_local.errors.append(NetlinkError(Exception(error_str), error_prefix, ifname=ifname))
+        elif on_ack:
+            on_ack()
+
+    @contextlib.contextmanager
+    def pipeline(self):
+        """
+        Pipeline the netlink requests TXed in this context: requests are sent
+        back to back without waiting for the kernel ACK (up to PIPELINE_WINDOW
+        requests in flight), so N requests cost a handful of round trips
+        instead of N. The kernel processes the requests of a socket in order.
+
+            with netlink.pipeline():
+                for port in ports:
+                    netlink.link_set_master(port, bridge)
+
+        All ACKs are collected when leaving the context, the cache updates
+        done on ACK are deferred until then. The errors are routed by (seq,
+        pid) and raised together as NetlinkPipelineError. Nested pipelines
+        are folded in the outer one. Requests that need an immediate answer
+        (link_del, link creation...) still wait for their own ACK.
+
+        Since the cache is only updated on ACK, a cache read inside the
+        context doesn't see the requests still in flight (i.e. a link
+        enslaved in the pipeline is still cached without master). Do the
+        cache lookups before entering the context, or call pipeline_flush()
+        first. This includes the cache checks done by the request methods
+        themselves (i.e. addr_add skips the addresses already cached).
+        """
+        if getattr(self.pipeline_local, "requests", None) is not None:
+            yield
+            return
+
+        self.pipeline_local.requests = []
+        self.pipeline_local.errors = []
+        try:
+            yield
+        finally:
+            requests = self.pipeline_local.requests
+            try:
+                while requests:
+                    self.__pipeline_reap(requests.pop(0))
+            finally:
+                errors = self.pipeline_local.errors
+                self.pipeline_local.requests = None
+                self.pipeline_local.errors = None
+
+        if errors:
+            raise NetlinkPipelineError(errors)
+
+    def pipeline_flush(self):
+        """
+        Wait for the ACKs of the requests in flight in the current pipeline
+        (and run their cache updates) so the cache can be read. Errors are
+        still raised when leaving the pipeline context.
+        """
+        requests = getattr(self.pipeline_local, "requests", None)
+        while requests:
+            self.__pipeline_reap(requests.pop(0))
 
     def tx_nlpacket_get_response_with_error_and_cache_on_ack(self, packet, ifname=None):
         """
             TX packet and manually cache the object
         """
-        self.tx_nlpacket_get_response_with_error(packet)
+        self.__tx_nlpacket_get_response_with_error_sync(packet)
         # When creating a new link via netlink, we don't always wait for the kernel
         # NEWLINK notification to be cached to continue. If our request is ACKed by
         # the OS we assume that the link was successfully created. Since we aren't
@@ -2347,10 +3504,11 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
         wait_event_registered = self.cache.register_wait_event(ifname, nl_packet.msgtype)
 
         try:
-            result = self.tx_nlpacket_get_response_with_error(nl_packet)
+            result = self.__tx_nlpacket_get_response_with_error_sync(nl_packet)
         except Exception:
             # an error was caught, we need to unregister the event and raise again
-            self.cache.unregister_wait_event()
+            if wait_event_registered:
+                self.cache.unregister_wait_event()
             raise
 
         if wait_event_registered:
@@ -2520,9 +3678,8 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
             link.body = struct.pack("=BxxxiLL", socket.AF_UNSPEC, 0, flags, Link.IFF_UP)
             link.add_attribute(Link.IFLA_IFNAME, ifname)
             link.build_message(next(self.sequence), self.pid)
-            result = self.tx_nlpacket_get_response_with_error(link)
-            # if we reach this code it means the operation went through
-            # without exception we can update the cache value this is
+            # once the request is ACKed (i.e. the operation went through
+            # without exception) we can update the cache value this is
             # needed for the following case (and probably others):
             #
             # ifdown bond0 ; ip link set dev bond_slave down
@@ -2535,8 +3692,12 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
             #           so the cache has a stale value and we try to enslave
             #           a port, that is admin up, to a bond resulting
             #           in an unexpected failure
-            self.cache.override_link_flag(ifname, flags)
-            return result
+            return self.tx_nlpacket_get_response_with_error(
+                link,
+                on_ack=lambda: self.cache.override_link_flag(ifname, flags),
+                error_prefix="ip link set dev %s %s" % (ifname, "up" if flags == Link.IFF_UP else "down"),
+                ifname=ifname
+            )
         except Exception as e:
             raise NetlinkError(e, "ip link set dev %s %s" % (ifname, "up" if flags == Link.IFF_UP else "down"), ifname=ifname)
 
@@ -2641,7 +3802,9 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
                 # RTM_DELLINK notification
                 self.cache.append_to_ignore_rtm_newlinkq(ifname)
 
-                result = self.tx_nlpacket_get_response_with_error(link)
+                # the ignore_rtm_newlinkq needs to be cleaned up on error
+                # this request can't be pipelined
+                result = self.__tx_nlpacket_get_response_with_error_sync(link)
 
                 # Manually purge the cache entry for ifname to make sure we don't have
                 # any stale value in our cache
@@ -2668,21 +3831,28 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
         link.add_attribute(Link.IFLA_IFNAME, ifname)
         link.add_attribute(Link.IFLA_MASTER, master_ifindex)
         link.build_message(next(self.sequence), self.pid)
-        result = self.tx_nlpacket_get_response_with_error(link)
         # opti:
-        # if we reach this code it means the slave/unslave opreation went through
-        # we can manually update our cache to reflect the change without having
-        # to wait for the netlink notification
+        # once the slave/unslave opreation is ACKed we can manually update our
+        # cache to reflect the change without having to wait for the netlink
+        # notification
         if master_ifindex:
-            self.cache.force_add_slave(master_ifname, ifname)
+            return self.tx_nlpacket_get_response_with_error(
+                link,
+                on_ack=lambda: self.cache.force_add_slave(master_ifname, ifname),
+                error_prefix="cannot enslave link %s to %s" % (ifname, master_ifname),
+                ifname=ifname
+            )
         else:
+            # the rtm_newlink_nomasterq needs to be cleaned up on error
+            # this request can't be pipelined
+            result = self.__tx_nlpacket_get_response_with_error_sync(link)
             self.cache.override_cache_unslave_link(slave=ifname, master=master_ifname)
-        return result
+            return result
 
     def link_set_master(self, ifname, master_ifname):
         self.logger.info("%s: netlink: ip link set dev %s master %s" % (ifname, ifname, master_ifname))
         try:
-            self.__link_set_master(ifname, self.cache.get_ifindex(master_ifname), master_ifname=master_ifname)
+            return self.__link_set_master(ifname, self.cache.get_ifindex(master_ifname), master_ifname=master_ifname)
         except Exception as e:
             raise NetlinkError(e, "cannot enslave link %s to %s" % (ifname, master_ifname), ifname=ifname)
 
@@ -2724,13 +3894,15 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
             link.add_attribute(Link.IFLA_ADDRESS, hw_address)
 
             link.build_message(next(self.sequence), self.pid)
-            result = self.tx_nlpacket_get_response_with_error(link)
-
-            # if we reach that code it means we got an ACK from the kernel, we can pro-actively
-            # update our local cache to reflect the change until the notificate arrives
-            self.cache.update_link_ifla_address(ifname, hw_address, hw_address_int)
 
-            return result
+            # once we get an ACK from the kernel, we can pro-actively update
+            # our local cache to reflect the change until the notificate arrives
+            return self.tx_nlpacket_get_response_with_error(
+                link,
+                on_ack=lambda: self.cache.update_link_ifla_address(ifname, hw_address, hw_address_int),
+                error_prefix="cannot set dev %s address %s" % (ifname, hw_address),
+                ifname=ifname
+            )
         except Exception as e:
             raise NetlinkError(e, "cannot set dev %s address %s" % (ifname, hw_address), ifname=ifname)
         finally:
@@ -2861,11 +4033,12 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
                 Link.IFLA_INFO_DATA: ifla_info_data
             })
             link.build_message(next(self.sequence), self.pid)
-            result = self.tx_nlpacket_get_response_with_error(link)
-
-            self.cache.update_link_info_data(ifname, ifla_info_data)
-
-            return result
+            return self.tx_nlpacket_get_response_with_error(
+                link,
+                on_ack=lambda: self.cache.update_link_info_data(ifname, ifla_info_data),
+                error_prefix="cannot create bridge or set attributes",
+                ifname=ifname
+            )
         except Exception as e:
             raise Exception("%s: netlink: cannot create bridge or set attributes: %s" % (ifname, str(e)))
 
@@ -2904,6 +4077,644 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
     def link_del_bridge_vlan_dry_run(self, ifname, vlan_id):
         self.log_info_ifname_dry_run(ifname, "netlink: bridge vlan del vid %s dev %s" % (vlan_id, ifname))
 
+    @staticmethod
+    def __bridge_vlan_infos(vids, pvid):
+        """
+        :param vids: vlan ids (int) or ranges (str: "10" or "10-20")
+        :param pvid: pvid (int) or None
+        :return: list of (flags, vlan_id_start, vlan_id_end), the vids are
+                 compressed into ranges and the pvid comes last (as a single
+                 untagged pvid vlan)
+        """
+        vlan_ids = set()
+
+        for vid in vids or []:
+            if isinstance(vid, int):
+                vlan_ids.add(vid)
+            else:
+                start, _, end = str(vid).partition("-")
+                vlan_ids.update(range(int(start), int(end or start) + 1))
+
+        vlan_infos = []
+
+        for vlan_id in sorted(vlan_ids):
+            if vlan_infos and vlan_infos[-1][2] == vlan_id - 1:
+                vlan_infos[-1][2] = vlan_id
+            else:
+                vlan_infos.append([0, vlan_id, vlan_id])
+
+        if pvid:
+            vlan_infos.append([Link.BRIDGE_VLAN_INFO_PVID | Link.BRIDGE_VLAN_INFO_UNTAGGED, int(pvid), int(pvid)])
+
+        return [tuple(info) for info in vlan_infos]
+
+    def __bridge_vlans_modify(self, msgtype, ifname, vlan_infos, bridge_self):
+        """
+        iproute2 bridge/vlan.c vlan_modify() with all the vlan ranges packed in
+        a single message. The cache is updated when the request is ACKed.
+        """
+        for flags, start, end in vlan_infos:
+            if not 1 <= start <= end <= 4094:
+                raise NetlinkError(Exception("invalid vlan range %s-%s" % (start, end)), "cannot modify bridge vlans", ifname=ifname)
+
+        link = Link(msgtype, msgtype in self.debug, use_color=self.use_color)
+        link.flags = NLM_F_REQUEST | NLM_F_ACK
+        link.body = struct.pack('Bxxxiii', socket.AF_BRIDGE, self.cache.get_ifindex(ifname), 0, 0)
+
+        ifla_af_spec = OrderedDict()
+
+        if bridge_self:
+            ifla_af_spec[Link.IFLA_BRIDGE_FLAGS] = Link.BRIDGE_FLAGS_SELF
+
+        ifla_af_spec[Link.IFLA_BRIDGE_VLAN_INFO] = []
+
+        for flags, start, end in vlan_infos:
+            if start == end:
+                ifla_af_spec[Link.IFLA_BRIDGE_VLAN_INFO].append((flags, start))
+            else:
+                ifla_af_spec[Link.IFLA_BRIDGE_VLAN_INFO].append((flags | Link.BRIDGE_VLAN_INFO_RANGE_BEGIN, start))
+                ifla_af_spec[Link.IFLA_BRIDGE_VLAN_INFO].append((flags | Link.BRIDGE_VLAN_INFO_RANGE_END, end))
+
+        link.add_attribute(Link.IFLA_AF_SPEC, ifla_af_spec)
+        link.build_message(next(self.sequence), self.pid)
+
+        cmd = "bridge vlan %s vid %s dev %s%s" % (
+            "del" if msgtype == RTM_DELLINK else "add",
+            ",".join(self.__format_bridge_vlan_info(info) for info in vlan_infos),
+            ifname,
+            " self" if bridge_self else ""
+        )
+        self.logger.info("%s: netlink: %s" % (ifname, cmd))
+
+        return self.tx_nlpacket_get_response_with_error(
+            link,
+            on_ack=lambda: self.cache.update_bridge_vlans(ifname, vlan_infos, delete=msgtype == RTM_DELLINK),
+            error_prefix=cmd,
+            ifname=ifname
+        )
+
+    @staticmethod
+    def __format_bridge_vlan_info(vlan_info):
+        flags, start, end = vlan_info
+        vlan = str(start) if start == end else "%s-%s" % (start, end)
+        if flags & Link.BRIDGE_VLAN_INFO_PVID:
+            vlan += " pvid untagged"
+        return vlan
+
+    def link_add_bridge_vlans(self, ifname, vids=None, pvid=None, bridge_self=False):
+        """
+        Add vlans and/or the untagged pvid to a bridge port (or to the bridge
+        itself with bridge_self) with a single RTM_SETLINK message:
+            bridge vlan add vid <vids> dev <ifname> [self]
+            bridge vlan add vid <pvid> untagged pvid dev <ifname> [self]
+
+        :param vids: vlan ids (int) or ranges (str: "10" or "10-20")
+        :param pvid:
+        :param bridge_self:
+        """
+        vlan_infos = self.__bridge_vlan_infos(vids, pvid)
+
+        if not vlan_infos:
+            return
+        try:
+            self.__bridge_vlans_modify(RTM_SETLINK, ifname, vlan_infos, bridge_self)
+        except NetlinkError:
+            raise
+        except Exception as e:
+            raise NetlinkError(e, "cannot add bridge vlans", ifname=ifname)
+
+    def link_del_bridge_vlans(self, ifname, vids=None, pvid=None, bridge_self=False):
+        """
+        Delete vlans and/or the pvid from a bridge port (or from the bridge
+        itself with bridge_self) with a single RTM_DELLINK message
+
+        :param vids: vlan ids (int) or ranges (str: "10" or "10-20")
+        :param pvid:
+        :param bridge_self:
+        """
+        vlan_infos = self.__bridge_vlan_infos(vids, pvid)
+
+        if not vlan_infos:
+            return
+        try:
+            self.__bridge_vlans_modify(RTM_DELLINK, ifname, vlan_infos, bridge_self)
+        except NetlinkError:
+            raise
+        except Exception as e:
+            raise NetlinkError(e, "cannot remove bridge vlans", ifname=ifname)
+
+    def link_add_bridge_vlans_dry_run(self, ifname, vids=None, pvid=None, bridge_self=False):
+        self.log_info_ifname_dry_run(ifname, "netlink: bridge vlan add vid %s dev %s%s" % (
+            ",".join(self.__format_bridge_vlan_info(info) for info in self.__bridge_vlan_infos(vids, pvid)),
+            ifname,
+            " self" if bridge_self else ""
+        ))
+
+    def link_del_bridge_vlans_dry_run(self, ifname, vids=None, pvid=None, bridge_self=False):
+        self.log_info_ifname_dry_run(ifname, "netlink: bridge vlan del vid %s dev %s%s" % (
+            ",".join(self.__format_bridge_vlan_info(info) for info in self.__bridge_vlan_infos(vids, pvid)),
+            ifname,
+            " self" if bridge_self else ""
+        ))
+
+    ###
+
+    # the IFLA_AF_SPEC nest length is 16 bits (one vlan tunnel range takes up
+    # to 72 bytes), and very large messages could exceed the socket buffer:
+    # bigger requests are split in several pipelined messages
+    BRIDGE_VLAN_TUNNELS_PER_MSG = 512
+    VNI_FILTER_RANGES_PER_MSG = 1024
+
+    @staticmethod
+    def __bridge_vlan_tunnel_infos(vlan_vni_map):
+        """
+        :param vlan_vni_map: {vlan: vni}
+        :return: list of (vlan_id_start, vlan_id_end, vni_start), vlans and
+                 vnis are compressed into ranges when both are consecutive
+        """
+        tunnel_infos = []
+
+        for vlan in sorted(vlan_vni_map.keys()):
+            vni = vlan_vni_map[vlan]
+
+            if tunnel_infos and tunnel_infos[-1][1] == vlan - 1 and \
+                    tunnel_infos[-1][2] + (vlan - tunnel_infos[-1][0]) == vni:
+                tunnel_infos[-1][1] = vlan
+            else:
+                tunnel_infos.append([vlan, vlan, vni])
+
+        return [tuple(info) for info in tunnel_infos]
+
+    @staticmethod
+    def __format_bridge_vlan_tunnel_info(tunnel_info):
+        vid_start, vid_end, vni_start = tunnel_info
+
+        if vid_start == vid_end:
+            return "vid %s tunnel_info id %s" % (vid_start, vni_start)
+
+        return "vid %s-%s tunnel_info id %s-%s" % (vid_start, vid_end, vni_start, vni_start + vid_end - vid_start)
+
+    def __bridge_vlan_tunnels_modify(self, msgtype, ifname, tunnel_infos):
+        """
+        iproute2 bridge/vlan.c vlan_modify() with tunnel_info, for all the
+        vlan ranges and their tunnel mapping in a single message:
+            bridge vlan add dev <ifname> vid <vids>
+            bridge vlan add dev <ifname> vid <vids> tunnel_info id <vnis>
+
+        The mapping is removed before the vlans (the kernel can't find the
+        tunnel of a deleted vlan) and added after them.
+        """
+        for vid_start, vid_end, vni_start in tunnel_infos:
+            if not 1 <= vid_start <= vid_end <= 4094:
+                raise NetlinkError(Exception("invalid vlan range %s-%s" % (vid_start, vid_end)), "cannot modify bridge vlan tunnels", ifname=ifname)
+
+        link = Link(msgtype, msgtype in self.debug, use_color=self.use_color)
+        link.flags = NLM_F_REQUEST | NLM_F_ACK
+        link.body = struct.pack('Bxxxiii', socket.AF_BRIDGE, self.cache.get_ifindex(ifname), 0, 0)
+
+        vlan_info = []
+        vlan_tunnel_info = []
+
+        for vid_start, vid_end, vni_start in tunnel_infos:
+            if vid_start == vid_end:
+                vlan_info.append((0, vid_start))
+                vlan_tunnel_info.append((vni_start, vid_start, 0))
+            else:
+                vlan_info.append((Link.BRIDGE_VLAN_INFO_RANGE_BEGIN, vid_start))
+                vlan_info.append((Link.BRIDGE_VLAN_INFO_RANGE_END, vid_end))
+                vlan_tunnel_info.append((vni_start, vid_start, Link.BRIDGE_VLAN_INFO_RANGE_BEGIN))
+                vlan_tunnel_info.append((vni_start + vid_end - vid_start, vid_end, Link.BRIDGE_VLAN_INFO_RANGE_END))
+
+        ifla_af_spec = OrderedDict()
+
+        if msgtype == RTM_DELLINK:
+            ifla_af_spec[Link.IFLA_BRIDGE_VLAN_TUNNEL_INFO] = vlan_tunnel_info
+            ifla_af_spec[Link.IFLA_BRIDGE_VLAN_INFO] = vlan_info
+        else:
+            ifla_af_spec[Link.IFLA_BRIDGE_VLAN_INFO] = vlan_info
+            ifla_af_spec[Link.IFLA_BRIDGE_VLAN_TUNNEL_INFO] = vlan_tunnel_info
+
+        link.add_attribute(Link.IFLA_AF_SPEC, ifla_af_spec)
+        link.build_message(next(self.sequence), self.pid)
+
+        cmd = "bridge vlan %s dev %s %s" % (
+            "del" if msgtype == RTM_DELLINK else "add",
+            ifname,
+            ", ".join(self.__format_bridge_vlan_tunnel_info(info) for info in tunnel_infos)
+        )
+        self.logger.info("%s: netlink: %s" % (ifname, cmd))
+
+        vlan_infos = [(0, vid_start, vid_end) for vid_start, vid_end, _ in tunnel_infos]
+
+        def on_ack():
+            self.cache.update_bridge_vlan_tunnels(ifname, tunnel_infos, delete=msgtype == RTM_DELLINK)
+            self.cache.update_bridge_vlans(ifname, vlan_infos, delete=msgtype == RTM_DELLINK)
+
+        return self.tx_nlpacket_get_response_with_error(
+            link,
+            on_ack=on_ack,
+            error_prefix=cmd,
+            ifname=ifname
+        )
+
+    def __bridge_vlan_tunnels_modify_all(self, msgtype, ifname, vlan_vni_map):
+        tunnel_infos = self.__bridge_vlan_tunnel_infos(vlan_vni_map)
+
+        with self.pipeline():
+            for i in range(0, len(tunnel_infos), self.BRIDGE_VLAN_TUNNELS_PER_MSG):
+                self.__bridge_vlan_tunnels_modify(msgtype, ifname, tunnel_infos[i:i + self.BRIDGE_VLAN_TUNNELS_PER_MSG])
+
+    def link_add_bridge_vlan_tunnels(self, ifname, vlan_vni_map):
+        """
+        Add vlans and their vni (vlan tunnel mapping) to a bridge port
+        (vxlan device with vlan_tunnel on)
+
+        :param ifname:
+        :param vlan_vni_map: {vlan: vni}
+        """
+        if not vlan_vni_map:
+            return
+        try:
+            self.__bridge_vlan_tunnels_modify_all(RTM_SETLINK, ifname, vlan_vni_map)
+        except (NetlinkError, NetlinkPipelineError):
+            raise
+        except Exception as e:
+            raise NetlinkError(e, "cannot add bridge vlan tunnel info", ifname=ifname)
+
+    def link_del_bridge_vlan_tunnels(self, ifname, vlan_vni_map):
+        """
+        Remove vlans and their vlan tunnel mapping from a bridge port
+
+        :param ifname:
+        :param vlan_vni_map: {vlan: vni}
+        """
+        if not vlan_vni_map:
+            return
+        try:
+            self.__bridge_vlan_tunnels_modify_all(RTM_DELLINK, ifname, vlan_vni_map)
+        except (NetlinkError, NetlinkPipelineError):
+            raise
+        except Exception as e:
+            raise NetlinkError(e, "cannot remove bridge vlan tunnel info", ifname=ifname)
+
+    def link_add_bridge_vlan_tunnels_dry_run(self, ifname, vlan_vni_map):
+        for tunnel_info in self.__bridge_vlan_tunnel_infos(vlan_vni_map):
+            self.log_info_ifname_dry_run(ifname, "netlink: bridge vlan add dev %s %s" % (
+                ifname, self.__format_bridge_vlan_tunnel_info(tunnel_info)
+            ))
+
+    def link_del_bridge_vlan_tunnels_dry_run(self, ifname, vlan_vni_map):
+        for tunnel_info in self.__bridge_vlan_tunnel_infos(vlan_vni_map):
+            self.log_info_ifname_dry_run(ifname, "netlink: bridge vlan del dev %s %s" % (
+                ifname, self.__format_bridge_vlan_tunnel_info(tunnel_info)
+            ))
+
+    ###
+
+    def __get_sync_manager(self):
+        """
+        The requests that aren't part of the cache dumps (i.e. the vni filter,
+        the fib rules) are sent on a private socket, not serviced by the listener thread, and
+        their replies are read synchronously. The caller must hold
+        sync_manager_lock.
+        """
+        if not self.sync_manager:
+            self.sync_manager = nlmanager.NetlinkManager(pid_offset=3, use_color=self.use_color)
+            self.sync_manager.debug = self.debug
+            self.sync_manager.tx_socket_allocate()
+        return self.sync_manager
+
+    def get_vxlan_vni_filter(self, ifname):
+        """
+        bridge vni show dev <ifname>
+
+        The vni filter is dumped on first use then cached (and updated by our
+        own requests)
+
+        :return: {vni: group}, group is a string or None
+        """
+        vnis = self.cache.get_vni_filter(ifname)
+
+        if vnis is not None:
+            return vnis
+
+        ifindex = self.cache.get_ifindex(ifname)
+        vni_ranges = []
+
+        with self.sync_manager_lock:
+            for msg in self.__get_sync_manager().vni_filter_dump(ifindex) or []:
+                if msg.ifindex == ifindex:
+                    vni_ranges.extend(msg.get_vnis())
+
+        self.cache.set_vni_filter(ifname, vni_ranges)
+        return self.cache.get_vni_filter(ifname) or {}
+
+    def vxlan_vni_filter_flush_cache(self):
+        """
+        The vni filter can be modified by other processes (i.e. FRR) and we
+        don't listen to the tunnel notifications: drop the cached vni filters
+        so that they are dumped again on next use. Called at the start of
+        each run (ifupdown2d keeps the cache across requests).
+        """
+        self.cache.flush_vni_filter()
+
+    @staticmethod
+    def __vni_filter_ranges(vnis):
+        """
+        :param vnis: {vni: group}
+        :return: list of (vni_start, vni_end, group), consecutive vnis with the
+                 same group are compressed into ranges
+        """
+        vni_ranges = []
+
+        for vni in sorted(vnis.keys()):
+            group = vnis[vni]
+
+            if vni_ranges and vni_ranges[-1][1] == vni - 1 and vni_ranges[-1][2] == group:
+                vni_ranges[-1][1] = vni
+            else:
+                vni_ranges.append([vni, vni, group])
+
+        return [tuple(vni_range) for vni_range in vni_ranges]
+
+    @staticmethod
+    def __format_vni_filter_ranges(vni_ranges):
+        vnis = []
+
+        for vni_start, vni_end, group in vni_ranges:
+            vni = str(vni_start) if vni_start == vni_end else "%s-%s" % (vni_start, vni_end)
+            vnis.append("%s group %s" % (vni, group) if group else vni)
+
+        return ", ".join(vnis)
+
+    def __vni_filter_modify(self, msgtype, ifname, vni_ranges):
+        """
+        iproute2 bridge/vni.c vni_modify() with all the vni ranges packed in
+        a single RTM_NEWTUNNEL (or RTM_DELTUNNEL) message
+        """
+        for vni_start, vni_end, group in vni_ranges:
+            if not 1 <= vni_start <= vni_end <= 16777215:
+                raise NetlinkError(Exception("invalid vni range %s-%s" % (vni_start, vni_end)), "cannot modify vni filter", ifname=ifname)
+
+        tunnel = nlpacket.Tunnel(msgtype, msgtype in self.debug, use_color=self.use_color)
+        tunnel.flags = NLM_F_REQUEST | NLM_F_ACK
+        tunnel.body = struct.pack('=BBHI', socket.AF_BRIDGE, 0, 0, self.cache.get_ifindex(ifname))
+        tunnel.add_attribute(nlpacket.Tunnel.VXLAN_VNIFILTER_ENTRY, vni_ranges)
+        tunnel.build_message(next(self.sequence), self.pid)
+
+        cmd = "bridge vni %s dev %s vni %s" % (
+            "del" if msgtype == nlpacket.RTM_DELTUNNEL else "add",
+            ifname,
+            self.__format_vni_filter_ranges(vni_ranges)
+        )
+        self.logger.info("%s: netlink: %s" % (ifname, cmd))
+
+        return self.tx_nlpacket_get_response_with_error(
+            tunnel,
+            on_ack=lambda: self.cache.update_vni_filter(ifname, vni_ranges, delete=msgtype == nlpacket.RTM_DELTUNNEL),
+            error_prefix=cmd,
+            ifname=ifname
+        )
+
+    def __vni_filter_modify_all(self, msgtype, ifname, vnis):
+        vni_ranges = self.__vni_filter_ranges(vnis)
+
+        with self.pipeline():
+            for i in range(0, len(vni_ranges), self.VNI_FILTER_RANGES_PER_MSG):
+                self.__vni_filter_modify(msgtype, ifname, vni_ranges[i:i + self.VNI_FILTER_RANGES_PER_MSG])
+
+    def vxlan_vni_filter_add(self, ifname, vnis):
+        """
+        bridge vni add dev <ifname> vni <vnis> [group <group>]
+        (also updates the group of existing vnis)
+
+        :param ifname:
+        :param vnis: {vni: group}, group can be None
+        """
+        if not vnis:
+            return
+        try:
+            self.__vni_filter_modify_all(nlpacket.RTM_NEWTUNNEL, ifname, vnis)
+        except (NetlinkError, NetlinkPipelineError):
+            raise
+        except Exception as e:
+            raise NetlinkError(e, "cannot add vnis", ifname=ifname)
+
+    def vxlan_vni_filter_del(self, ifname, vnis):
+        """
+        bridge vni del dev <ifname> vni <vnis>
+
+        :param ifname:
+        :param vnis: iterable of vnis (int)
+        """
+        if not vnis:
+            return
+        try:
+            self.__vni_filter_modify_all(nlpacket.RTM_DELTUNNEL, ifname, dict.fromkeys(vnis))
+        except (NetlinkError, NetlinkPipelineError):
+            raise
+        except Exception as e:
+            raise NetlinkError(e, "cannot remove vnis", ifname=ifname)
+
+    def vxlan_vni_filter_update(self, ifname, vnis):
+        """
+        Diff the running vni filter of ifname against vnis and apply the
+        difference: one delete for the vnis that are not configured anymore,
+        one add for the new vnis and the vnis with a new group.
+
+        :param ifname:
+        :param vnis: {vni: group}, group is a string or None
+        """
+        running_vnis = self.get_vxlan_vni_filter(ifname)
+
+        self.vxlan_vni_filter_del(ifname, [vni for vni in running_vnis if vni not in vnis])
+        self.vxlan_vni_filter_add(ifname, dict(
+            (vni, group) for vni, group in vnis.items()
+            if vni not in running_vnis or running_vnis[vni] != group
+        ))
+
+    def vxlan_vni_filter_add_dry_run(self, ifname, vnis):
+        self.log_info_ifname_dry_run(ifname, "netlink: bridge vni add dev %s vni %s" % (
+            ifname, self.__format_vni_filter_ranges(self.__vni_filter_ranges(vnis or {}))
+        ))
+
+    def vxlan_vni_filter_update_dry_run(self, ifname, vnis):
+        self.vxlan_vni_filter_add_dry_run(ifname, vnis)
+
+    def vxlan_vni_filter_del_dry_run(self, ifname, vnis):
+        self.log_info_ifname_dry_run(ifname, "netlink: bridge vni del dev %s vni %s" % (
+            ifname, self.__format_vni_filter_ranges(self.__vni_filter_ranges(dict.fromkeys(vnis or [])))
+        ))
+
+    ###
+
+    def get_rules(self, family):
+        """
+        ip [-4|-6] rule show
+
+        The rules are dumped on first use then cached (and updated by our own
+        requests)
+
+        :param family: socket.AF_INET or socket.AF_INET6
+        :return: frozenset of FibRule
+        """
+        rules = self.cache.get_rules(family)
+
+        if rules is not None:
+            return rules
+
+        with self.sync_manager_lock:
+            rules = [
+                FibRule.from_packet(msg)
+                for msg in self.__get_sync_manager().rules_dump(family) or []
+                if msg.family == family
+            ]
+
+        self.cache.set_rules(family, rules)
+        return self.cache.get_rules(family) or frozenset()
+
+    def rules_flush_cache(self, family=None):
+        """
+        The kernel can add rules on its own (i.e. the l3mdev rule is added
+        when the first vrf device is created) and we don't listen to the rule
+        notifications, drop the cached rules so that they are dumped again on
+        next use. Also called at the start of each run (ifupdown2d keeps the
+        cache across requests, the rules might be modified between requests).
+        """
+        for rule_family in (socket.AF_INET, socket.AF_INET6) if family is None else (family,):
+            self.cache.set_rules(rule_family, None)
+
+    @staticmethod
+    def __format_rule(rule):
+        """ ip rule arguments: "pref 200 oif blue table 1001" """
+        args = ["pref %s" % rule.priority]
+
+        if rule.src is not None:
+            args.append("from %s" % rule.src)
+        if rule.dst is not None:
+            args.append("to %s" % rule.dst)
+        if rule.fwmark is not None:
+            args.append("fwmark 0x%x" % rule.fwmark)
+        if rule.iifname:
+            args.append("iif %s" % rule.iifname)
+        if rule.oifname:
+            args.append("oif %s" % rule.oifname)
+
+        if rule.l3mdev:
+            args.append("l3mdev")
+        elif rule.action == nlpacket.Rule.FR_ACT_TO_TBL:
+            args.append("table %s" % FibRule.RT_TABLE_NAMES.get(rule.table, rule.table))
+        else:
+            args.append(nlpacket.Rule.action_to_string.get(rule.action, str(rule.action)))
+
+        return " ".join(args)
+
+    def __rule_modify(self, msgtype, rule):
+        """
+        iproute2 ip/iprule.c iprule_modify()
+        """
+        packet = nlpacket.Rule(msgtype, msgtype in self.debug, use_color=self.use_color)
+        packet.flags = NLM_F_REQUEST | NLM_F_ACK
+
+        if msgtype == nlpacket.RTM_NEWRULE:
+            packet.flags |= NLM_F_CREATE | nlpacket.NLM_F_EXCL
+
+        # the table id is only stored in the header if it fits in a byte
+        packet.body = struct.pack(
+            '=8BI',
+            rule.family,
+            rule.dst.prefixlen if rule.dst is not None else 0,
+            rule.src.prefixlen if rule.src is not None else 0,
+            0,
+            rule.table if rule.table < 256 else Route.RT_TABLE_UNSPEC,
+            0,
+            0,
+            rule.action,
+            0
+        )
+        packet.family = rule.family
+        packet.add_attribute(nlpacket.Rule.FRA_PRIORITY, rule.priority)
+
+        if rule.table:
+            packet.add_attribute(nlpacket.Rule.FRA_TABLE, rule.table)
+        if rule.iifname:
+            packet.add_attribute(nlpacket.Rule.FRA_IIFNAME, rule.iifname)
+        if rule.oifname:
+            packet.add_attribute(nlpacket.Rule.FRA_OIFNAME, rule.oifname)
+        if rule.l3mdev:
+            packet.add_attribute(nlpacket.Rule.FRA_L3MDEV, rule.l3mdev)
+        if rule.fwmark is not None:
+            packet.add_attribute(nlpacket.Rule.FRA_FWMARK, rule.fwmark)
+        if rule.src is not None:
+            packet.add_attribute(nlpacket.Rule.FRA_SRC, rule.src)
+        if rule.dst is not None:
+            packet.add_attribute(nlpacket.Rule.FRA_DST, rule.dst)
+
+        packet.build_message(next(self.sequence), self.pid)
+
+        cmd = "ip %srule %s %s" % (
+            "-6 " if rule.family == socket.AF_INET6 else "",
+            "del" if msgtype == nlpacket.RTM_DELRULE else "add",
+            self.__format_rule(rule)
+        )
+        ifname = rule.iifname or rule.oifname
+        self.logger.info("%snetlink: %s" % ("%s: " % ifname if ifname else "", cmd))
+
+        return self.tx_nlpacket_get_response_with_error(
+            packet,
+            on_ack=lambda: self.cache.update_rule(rule, delete=msgtype == nlpacket.RTM_DELRULE),
+            error_prefix=cmd,
+            ifname=ifname
+        )
+
+    def __rules_modify_all(self, msgtype, rules):
+        # the kernel only takes one rule per message, pipeline them
+        with self.pipeline():
+            for rule in sorted(rules, key=lambda r: (r.family, r.priority, str(r))):
+                self.__rule_modify(msgtype, rule)
+
+    def rules_add(self, rules):
+        """
+        ip [-6] rule add ... for each rule
+
+        :param rules: iterable of FibRule
+        """
+        if not rules:
+            return
+        try:
+            self.__rules_modify_all(nlpacket.RTM_NEWRULE, rules)
+        except (NetlinkError, NetlinkPipelineError):
+            raise
+        except Exception as e:
+            raise NetlinkError(e, "cannot add rules")
+
+    def rules_del(self, rules):
+        """
+        ip [-6] rule del ... for each rule
+
+        :param rules: iterable of FibRule
+        """
+        if not rules:
+            return
+        try:
+            self.__rules_modify_all(nlpacket.RTM_DELRULE, rules)
+        except (NetlinkError, NetlinkPipelineError):
+            raise
+        except Exception as e:
+            raise NetlinkError(e, "cannot remove rules")
+
+    def rules_add_dry_run(self, rules):
+        for rule in rules or []:
+            self.log_info_dry_run("netlink: ip %srule add %s" % (
+                "-6 " if rule.family == socket.AF_INET6 else "", self.__format_rule(rule)
+            ))
+
+    def rules_del_dry_run(self, rules):
+        for rule in rules or []:
+            self.log_info_dry_run("netlink: ip %srule del %s" % (
+                "-6 " if rule.family == socket.AF_INET6 else "", self.__format_rule(rule)
+            ))
+
     ###
 
     def link_add_vlan(self, vlan_raw_device, ifname, vlan_id, vlan_protocol=None, bridge_binding=None):
@@ -3228,7 +5039,11 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
 
             packet.body = struct.pack("=4Bi", packet.family, packet_prefixlen, 0, scope_value, self.cache.get_ifindex(ifname))
             packet.build_message(next(self.sequence), self.pid)
-            return self.tx_nlpacket_get_response_with_error(packet)
+            return self.tx_nlpacket_get_response_with_error(
+                packet,
+                error_prefix="cannot add address %s dev %s" % (addr, ifname),
+                ifname=ifname
+            )
         except Exception as e:
             if not log_msg_displayed:
                 # just in case we get an exception before we reach the log.info
@@ -3256,13 +5071,15 @@ class NetlinkListenerWithCache(nllistener.NetlinkManagerWithListener, BaseObject
             packet.add_attribute(Address.IFA_LOCAL, addr)
 
             packet.build_message(next(self.sequence), self.pid)
-            result = self.tx_nlpacket_get_response_with_error(packet)
 
-            # RTM_DELADDR successful, we need to update our cache
+            # once RTM_DELADDR is successful, we need to update our cache
             # to make sure we don't have any stale ip addr cached
-            self.cache.force_remove_addr(ifname, addr)
-
-            return result
+            return self.tx_nlpacket_get_response_with_error(
+                packet,
+                on_ack=lambda: self.cache.force_remove_addr(ifname, addr),
+                error_prefix="cannot delete address %s dev %s" % (addr, ifname),
+                ifname=ifname
+            )
         except Exception as e:
             raise NetlinkError(e, "cannot delete address %s dev %s" % (addr, ifname), ifname=ifname)
 
@@ -29,13 +29,15 @@ from .nlpacket import *
 from .nlmanager import NetlinkManager
 from select import select
 from struct import pack, unpack, calcsize
-from threading import Thread, Event, Lock
+from threading import Thread, Event, Lock, Condition
+from collections import deque
 from queue import Queue
 import logging
 import signal
 import socket
 import errno
 import os
+import time
 
 log = logging.getLogger(__name__)
 
@@ -154,12 +156,11 @@ class NetlinkListener(Thread):
                 if not manager.tx_socket:
                     manager.tx_socket_allocate()
 
-            my_sockets = (manager.tx_socket, self.rx_socket)
-
             socket_string = {
                 manager.tx_socket: "TX",
                 self.rx_socket: "RX"
             }
+            dump_prev_seq = {}
         except Exception as e:
             if self.rx_socket:
                 self.rx_socket.close()
@@ -183,12 +184,25 @@ class NetlinkListener(Thread):
         manager.listener_ready = True
         manager.listener_event_ready.set()
 
+        # the sockets are read (recv_into) in this preallocated buffer, the
+        # messages are then walked with memoryview slices (no copy) and only
+        # the messages we keep are copied out of the buffer
+        recv_buffer = bytearray(self.RECV_BUFFER)
+        recv_view = memoryview(recv_buffer)
+
         while True:
 
             if self.shutdown_event.is_set():
                 log.info("%s: shutting down" % self)
                 break
 
+            # dump sockets (see tx_nlpacket_dump_async) come and go, they are
+            # added to the list of sockets we listen to until their dump is done
+            with manager.dump_sockets_lock:
+                dump_sockets = dict(manager.dump_sockets)
+
+            my_sockets = (manager.tx_socket, self.rx_socket, manager.dump_sockets_wakeup[0]) + tuple(dump_sockets)
+
             # Only block for 1 second so we can wake up to see if shutdown_event is set
             try:
                 (readable, writeable, exceptional) = select(my_sockets, [], my_sockets, 0.1)
@@ -202,132 +216,258 @@ class NetlinkListener(Thread):
 
             set_alarm = False
             set_overrun = False
-            set_tx_socket_rxed_ack_alarm = False
+            rxed_acks = []
+            rx_batch = []
+            rx_msgs = 0
+            rx_drain_max = max(1, manager.rx_drain_max)
 
             for s in readable:
                 data = []
 
-                try:
-                    data = s.recv(self.RECV_BUFFER)
-                except socket.error as e:
-                    log.error('recv() error: ' + str(e))
-                    data = []
-                    if e.errno is errno.ENOBUFS and self.error_notification:
-                        set_overrun = True
-                except Exception as e:
-                    log.error('recv() error: ' + str(e))
-                    data = []
-
-                total_length = len(data)
-                while data:
-
-                    # Extract the length, etc from the header
-                    (length, msgtype, flags, seq, pid) = unpack(header_PACK, data[:header_LEN])
-
-                    msgtype_str = NetlinkPacket.type_to_string.get(msgtype)
-
-                    if not msgtype_str:
-                        data = data[length:]
-                        log.debug('%s %s: RXed unknown/unsupported msg type %s skipping netlink message...' % (self, socket_string[s], msgtype))
-                        continue
-
-                    log.debug('%s %s: RXed %s seq %d, pid %d, %d bytes (%d total)' %
-                              (self, socket_string[s], msgtype_str,
-                               seq, pid, length, total_length))
-                    possible_ack = False
-
-                    if msgtype == NLMSG_DONE:
-                        possible_ack = True
-
-                    elif msgtype == NLMSG_ERROR:
-                        possible_ack = True
-
-                        # The error code is a signed negative number.
-                        error_code = abs(unpack('=i', data[header_LEN:header_LEN+4])[0])
-                        msg = Error(msgtype, True)
-                        msg.decode_packet(length, flags, seq, pid, data)
-
-                        if error_code:
-                            log.debug("%s %s: RXed NLMSG_ERROR code %s (%d): %s" % (self, socket_string[s], msg.error_to_string.get(error_code), error_code, msg.error_to_human_readable_string.get(error_code)))
-                        else:
-                            log.debug("%s %s: RXed NLMSG_ERROR code %s (%d): %s... this is an ACK" % (self, socket_string[s], msg.error_to_string.get(error_code), error_code, msg.error_to_human_readable_string.get(error_code)))
-
-                        if manager.errorq_enabled:
-                            with manager.errorq_lock:
-                                manager.errorq.append(msg)
-
-                    if possible_ack and seq == manager.target_seq and pid == manager.target_pid:
-                        log.debug("%s %s: Setting RXed ACK alarm for seq %d, pid %d" %
-                                  (self, socket_string[s], seq, pid))
-                        set_tx_socket_rxed_ack_alarm = True
-
-                    # Put the message on the manager's netlinkq
-                    if msgtype in self.supported_messages:
-                        set_alarm = True
-                        manager.netlinkq.append((msgtype, length, flags, seq, pid, data[0:length]))
-
-                    # There are certain message types we do not care about
-                    # (RTM_GETs for example)
-                    elif msgtype in self.ignore_messages:
+                if s == manager.dump_sockets_wakeup[0]:
+                    # a new dump socket was registered, it will be part of
+                    # our next select() call
+                    try:
+                        os.read(s, 4096)
+                    except OSError:
                         pass
-
-                    # And there are certain message types we have not added
-                    # support for yet (QDISC). Log an error for these just
-                    # as a reminder to add support for them.
-                    else:
-                        if msgtype in NetlinkPacket.type_to_string:
-                            log.warning('%s %s: RXed unsupported message %s (type %d)' %
-                                        (self, socket_string[s], NetlinkPacket.type_to_string[msgtype], msgtype))
+                    continue
+
+                dump_request = dump_sockets.get(s)
+
+                # drain mode: read the socket until EAGAIN (or until we hit
+                # rx_drain_max reads) so a burst of notifications is handled
+                # in a single wakeup and posted as a single workq item
+                reads = 0
+                socket_closed = False
+
+                while not socket_closed and reads < rx_drain_max:
+                    try:
+                        data = recv_view[:s.recv_into(recv_buffer, 0, socket.MSG_DONTWAIT)]
+                    except BlockingIOError:
+                        # EAGAIN: the socket is drained
+                        break
+                    except socket.error as e:
+                        log.error('recv() error: ' + str(e))
+                        data = []
+                        if e.errno is errno.ENOBUFS and self.error_notification:
+                            set_overrun = True
+                    except Exception as e:
+                        log.error('recv() error: ' + str(e))
+                        data = []
+
+                    if not data:
+                        break
+
+                    reads += 1
+
+                    total_length = len(data)
+                    while data:
+
+                        # Extract the length, etc from the header
+                        (length, msgtype, flags, seq, pid) = unpack(header_PACK, data[:header_LEN])
+                        rx_msgs += 1
+
+                        msgtype_str = NetlinkPacket.type_to_string.get(msgtype)
+
+                        if not msgtype_str:
+                            data = data[length:]
+                            log.debug('%s %s: RXed unknown/unsupported msg type %s skipping netlink message...' % (self, socket_string.get(s, "DUMP"), msgtype))
+                            continue
+
+                        log.debug('%s %s: RXed %s seq %d, pid %d, %d bytes (%d total)' %
+                                  (self, socket_string.get(s, "DUMP"), msgtype_str,
+                                   seq, pid, length, total_length))
+
+                        if dump_request:
+                            if msgtype in (NLMSG_DONE, NLMSG_ERROR) and (seq, pid) == dump_request:
+                                if msgtype == NLMSG_ERROR:
+                                    error_code = abs(unpack('=i', data[header_LEN:header_LEN+4])[0])
+                                    if error_code:
+                                        log.warning("%s DUMP: seq %d, pid %d: dump failed with error code %d" % (self, seq, pid, error_code))
+
+                                    # a failed dump must still complete, we queue
+                                    # a NLMSG_DONE in place of the NLMSG_ERROR
+                                    length = header_LEN + 4
+                                    data = pack(header_PACK + 'i', length, NLMSG_DONE, 0, seq, pid, -error_code)
+
+                                # the NLMSG_DONE goes through the netlinkq, after all the
+                                # messages of the dump, so the manager knows when the dump
+                                # is fully processed.
+                                rx_batch.append((NLMSG_DONE, length, flags, seq, pid, bytes(data[0:length])))
+                                set_alarm = True
+
+                                with manager.dump_sockets_lock:
+                                    del manager.dump_sockets[s]
+                                s.close()
+                                socket_closed = True
+                                break
+
+                            if msgtype in self.supported_messages:
+                                set_alarm = True
+                                rx_batch.append((msgtype, length, flags, seq, pid, bytes(data[0:length])))
+
+                            if pid in dump_prev_seq and dump_prev_seq[pid] != seq:
+                                log.debug('%s DUMP: went from seq %d to %d' % (self, dump_prev_seq[pid], seq))
+                            dump_prev_seq[pid] = seq
+
+                            data = data[length:]
+                            continue
+                        possible_ack = False
+
+                        if msgtype == NLMSG_DONE:
+                            possible_ack = True
+
+                        elif msgtype == NLMSG_ERROR:
+                            possible_ack = True
+
+                            # The error code is a signed negative number.
+                            error_code = abs(unpack('=i', data[header_LEN:header_LEN+4])[0])
+                            msg = Error(msgtype, True)
+                            msg.decode_packet(length, flags, seq, pid, bytes(data[0:length]))
+
+                            if error_code:
+                                log.debug("%s %s: RXed NLMSG_ERROR code %s (%d): %s" % (self, socket_string[s], msg.error_to_string.get(error_code), error_code, msg.error_to_human_readable_string.get(error_code)))
+                            else:
+                                log.debug("%s %s: RXed NLMSG_ERROR code %s (%d): %s... this is an ACK" % (self, socket_string[s], msg.error_to_string.get(error_code), error_code, msg.error_to_human_readable_string.get(error_code)))
+
+                            # plain ACKs (code 0) don't need to be claimed, only
+                            # the errors are queued on the errorq
+                            if manager.errorq_enabled and error_code:
+                                manager.errorq_put(msg)
+
+                        if possible_ack:
+                            with manager.target_lock:
+                                ack_event = manager.tx_pending_acks.pop((seq, pid), None)
+
+                            if ack_event:
+                                log.debug("%s %s: Setting RXed ACK alarm for seq %d, pid %d" %
+                                          (self, socket_string[s], seq, pid))
+                                rxed_acks.append(ack_event)
+
+                        # Put the message on the manager's netlinkq
+                        if msgtype in self.supported_messages:
+                            set_alarm = True
+                            rx_batch.append((msgtype, length, flags, seq, pid, bytes(data[0:length])))
+
+                        # There are certain message types we do not care about
+                        # (RTM_GETs for example)
+                        elif msgtype in self.ignore_messages:
+                            pass
+
+                        # And there are certain message types we have not added
+                        # support for yet (QDISC). Log an error for these just
+                        # as a reminder to add support for them.
                         else:
-                            log.warning('%s %s: RXed unknown message type %d' %
-                                        (self, socket_string[s], msgtype))
+                            if msgtype in NetlinkPacket.type_to_string:
+                                log.warning('%s %s: RXed unsupported message %s (type %d)' %
+                                            (self, socket_string[s], NetlinkPacket.type_to_string[msgtype], msgtype))
+                            else:
+                                log.warning('%s %s: RXed unknown message type %d' %
+                                            (self, socket_string[s], msgtype))
+
+                        # Track the previous PID sequence number for RX and TX sockets
+                        if s == self.rx_socket:
+                            prev_seq = self.rx_socket_prev_seq
+                        elif s == manager.tx_socket:
+                            prev_seq = manager.tx_socket_prev_seq
+
+                        if pid in prev_seq and prev_seq[pid] and prev_seq[pid] != seq and (prev_seq[pid]+1 != seq):
+                            log.debug('%s %s: went from seq %d to %d' % (self, socket_string[s], prev_seq[pid], seq))
+                        prev_seq[pid] = seq
 
-                    # Track the previous PID sequence number for RX and TX sockets
-                    if s == self.rx_socket:
-                        prev_seq = self.rx_socket_prev_seq
-                    elif s == manager.tx_socket:
-                        prev_seq = manager.tx_socket_prev_seq
+                        data = data[length:]
 
-                    if pid in prev_seq and prev_seq[pid] and prev_seq[pid] != seq and (prev_seq[pid]+1 != seq):
-                        log.debug('%s %s: went from seq %d to %d' % (self, socket_string[s], prev_seq[pid], seq))
-                    prev_seq[pid] = seq
+            manager.rx_histogram_add(rx_msgs)
 
-                    data = data[length:]
+            if set_overrun:
+                manager.netlinkq_counters["overrun"] += 1
+
+            # the batch is handed to the manager in one go (see netlinkq_put)
+            # before we notify the threads waiting for ACKs, so the messages
+            # RXed before an ACK are serviced first
+            if rx_batch and not manager.netlinkq_put(rx_batch, self.shutdown_event):
+                set_alarm = False
+                manager.workq.put((manager.WORKQ_SERVICE_ERROR, manager.WORKQ_ERROR_DROPPED))
+                manager.alarm.set()
 
-            if set_tx_socket_rxed_ack_alarm:
-                with manager.target_lock:
-                    manager.target_seq = None
-                    manager.target_pid = None
-                manager.tx_socket_rxed_ack.set()
+            # the errors were already queued on the errorq, we can now
+            # notify the threads waiting for those ACKs
+            for ack_event in rxed_acks:
+                ack_event.set()
 
             if set_alarm:
                 manager.workq.put((manager.WORKQ_SERVICE_NETLINK_QUEUE, None))
 
             if set_overrun:
-                manager.workq.put((manager.WORKQ_SERVICE_ERROR, "OVERFLOW"))
+                manager.workq.put((manager.WORKQ_SERVICE_ERROR, manager.WORKQ_ERROR_OVERFLOW))
 
             if set_alarm or set_overrun:
                 manager.alarm.set()
 
         self.rx_socket.close()
 
+        # don't leave threads waiting for an ACK that will never come
+        with manager.target_lock:
+            pending_acks = list(manager.tx_pending_acks.values())
+            manager.tx_pending_acks.clear()
+
+        for ack_event in pending_acks:
+            ack_event.set()
+
 
 class NetlinkManagerWithListener(NetlinkManager):
 
     WORKQ_SERVICE_NETLINK_QUEUE = 1
     WORKQ_SERVICE_ERROR         = 2
 
-    def __init__(self, groups, start_listener=True, use_color=True, pid_offset=0, error_notification=False, rcvbuf_sz=10000000, bpf_filter=None):
+    # WORKQ_SERVICE_ERROR options:
+    # OVERFLOW: the kernel couldn't queue messages on our socket (ENOBUFS)
+    # DROPPED: the netlinkq was full, messages were dropped (see netlinkq_put)
+    WORKQ_ERROR_OVERFLOW = "OVERFLOW"
+    WORKQ_ERROR_DROPPED = "DROPPED"
+
+    # netlinkq backpressure: when NETLINKQ_MAX messages are waiting to be
+    # serviced the listener stops reading the sockets (the kernel socket
+    # buffers absorb the burst) for up to NETLINKQ_FULL_TIMEOUT seconds,
+    # then the new messages are dropped
+    NETLINKQ_MAX = 100000
+    NETLINKQ_FULL_TIMEOUT = 5
+
+    # NLMSG_ERRORs that nobody claimed after ERRORQ_EXPIRY seconds are dropped
+    ERRORQ_EXPIRY = 60
+
+    # messages per wakeup histogram: 1, 2-3, 4-7, ..., 1024+
+    RX_HISTOGRAM_BUCKETS = 11
+
+    def __init__(self, groups, start_listener=True, use_color=True, pid_offset=0, error_notification=False, rcvbuf_sz=10000000, bpf_filter=None, rx_drain_max=64):
         NetlinkManager.__init__(self, use_color=use_color, pid_offset=pid_offset)
         self.groups = groups
         self.workq = Queue()
-        self.netlinkq = []
+
+        # netlinkq: messages RXed by the listener, waiting to be serviced
+        # the listener extends it (one batch per wakeup) and service_netlinkq
+        # swaps it for an empty deque, both under netlinkq_lock
+        self.netlinkq = deque()
+        self.netlinkq_lock = Lock()
+        self.netlinkq_not_full = Condition(self.netlinkq_lock)
+        self.netlinkq_dropped_msgtypes = set()
+        # (seq, pid) of the async dumps whose NLMSG_DONE was dropped
+        self.netlinkq_dropped_dumps = []
+        self.netlinkq_counters = {
+            "queued": 0,
+            "serviced": 0,
+            "max_depth": 0,
+            "backpressure": 0,
+            "dropped": 0,
+            "overrun": 0,
+            "resync": 0,
+        }
         self.alarm = Event()
         self.shutdown_event = Event()
-        self.tx_socket_rxed_ack = Event()
-        self.tx_socket_rxed_ack.clear()
-        self.target_seq = None
-        self.target_pid = None
+        # requests waiting for an ACK: {(seq, pid): threading.Event}
+        # the NetlinkListener sets the event when the ACK (or error) is RXed
+        self.tx_pending_acks = {}
         self.target_seq_pid_debug = False
         self.target_lock = Lock()
         self.tx_socket_prev_seq = {}
@@ -341,9 +481,34 @@ class NetlinkManagerWithListener(NetlinkManager):
         self.pid_offset = pid_offset
         self.bpf_filter = bpf_filter
 
+        # errorq: OrderedDict {(seq, pid): (rx_time, Error)} in RX order
         self.errorq = None
         self.errorq_lock = None
         self.errorq_enabled = False
+        # the listener reads each readable socket up to rx_drain_max times
+        # per wakeup (until EAGAIN), rx_histogram counts the number of
+        # messages RXed per wakeup: rx_histogram[n] is the number of wakeups
+        # with 2^n to 2^(n+1)-1 messages (the last bucket is open-ended)
+        self.rx_drain_max = rx_drain_max
+        self.rx_histogram = [0] * self.RX_HISTOGRAM_BUCKETS
+
+        self.errorq_counters = {
+            "queued": 0,
+            "claimed": 0,
+            "expired": 0,
+            "max_depth": 0,
+            "lookups": 0,
+            "lookup_time": 0.0,
+            "max_lookup_time": 0.0,
+        }
+
+        # dump requests sent with tx_nlpacket_dump_async:
+        # dump_sockets: {socket: (seq, pid)} - watched by the listener thread
+        # dump_callbacks: {(seq, pid): callback} - called on NLMSG_DONE
+        self.dump_sockets = {}
+        self.dump_sockets_lock = Lock()
+        self.dump_sockets_wakeup = os.pipe()
+        self.dump_callbacks = {}
 
         self.listener_event_ready = None
         self.listener_ready = None
@@ -396,21 +561,185 @@ class NetlinkManagerWithListener(NetlinkManager):
         self.shutdown_event.set()
         self.alarm.set()
 
-    def tx_nlpacket_get_response(self, nlpacket):
-        # WARNING: having multiple threads waiting for ACKs might result in
-        # undefined behavior. To make this work we should probably have a
-        # (thread-safe) list of all the target SEQs and PIDs along side a
-        # reference to their alarms (thead.Event) to notify the right thread
-        # of the RXed ACK.
+    def netlinkq_put(self, batch, shutdown_event):
         """
-        TX the message and wait for an ack
+        Called by the listener thread to queue a batch of messages. If the
+        netlinkq is full we wait for the worker to catch up (backpressure),
+        after NETLINKQ_FULL_TIMEOUT seconds the batch is dropped.
+
+        :return: False if the batch was dropped
+        """
+        with self.netlinkq_lock:
+            if len(self.netlinkq) >= self.NETLINKQ_MAX:
+                self.netlinkq_counters["backpressure"] += 1
+                log.debug("%s: netlinkq is full (%d messages), waiting..." % (self, len(self.netlinkq)))
+
+                timeout = time.monotonic() + self.NETLINKQ_FULL_TIMEOUT
+
+                while len(self.netlinkq) >= self.NETLINKQ_MAX and not shutdown_event.is_set():
+                    remaining = timeout - time.monotonic()
+
+                    if remaining <= 0:
+                        self.netlinkq_counters["dropped"] += len(batch)
+                        self.netlinkq_dropped_msgtypes.update(msg[0] for msg in batch)
+                        self.netlinkq_dropped_dumps.extend((msg[3], msg[4]) for msg in batch if msg[0] == NLMSG_DONE)
+                        log.warning("%s: netlinkq is full, dropping %d messages" % (self, len(batch)))
+                        return False
+
+                    self.netlinkq_not_full.wait(min(remaining, 0.1))
+
+            self.netlinkq.extend(batch)
+            self.netlinkq_counters["queued"] += len(batch)
+
+            if len(self.netlinkq) > self.netlinkq_counters["max_depth"]:
+                self.netlinkq_counters["max_depth"] = len(self.netlinkq)
+
+        return True
+
+    def netlinkq_get(self):
+        """
+        Swap the netlinkq for an empty one
+        :return: deque of the messages to service
+        """
+        with self.netlinkq_lock:
+            netlinkq, self.netlinkq = self.netlinkq, deque()
+            self.netlinkq_counters["serviced"] += len(netlinkq)
+            self.netlinkq_not_full.notify_all()
+
+        return netlinkq
+
+    def netlinkq_pop_dropped_msgtypes(self):
         """
+        :return: set of the msgtypes dropped since the last call
+        """
+        with self.netlinkq_lock:
+            msgtypes, self.netlinkq_dropped_msgtypes = self.netlinkq_dropped_msgtypes, set()
+
+        return msgtypes
+
+    def netlinkq_complete_dropped_dumps(self):
+        """
+        The NLMSG_DONE of an async dump was dropped with its batch: execute
+        the dump callback now, otherwise the dump would never complete. The
+        messages of the dump might have been dropped too, the caller should
+        dump the associated tables again.
+
+        :return: number of dumps completed
+        """
+        with self.netlinkq_lock:
+            dumps, self.netlinkq_dropped_dumps = self.netlinkq_dropped_dumps, []
+
+        for seq, pid in dumps:
+            with self.dump_sockets_lock:
+                done_callback = self.dump_callbacks.pop((seq, pid), None)
 
-        # NetlinkListener looks at the manager's target_seq and target_pid
-        # to know when we've RXed the ack that we want
+            log.warning("%s: NLMSG_DONE of dump seq %d, pid %d was dropped" % (self, seq, pid))
+
+            if done_callback:
+                done_callback(seq, pid)
+
+        return len(dumps)
+
+    def rx_histogram_add(self, rx_msgs):
+        if rx_msgs:
+            self.rx_histogram[min(rx_msgs.bit_length(), self.RX_HISTOGRAM_BUCKETS) - 1] += 1
+
+    def rx_histogram_str(self):
+        """
+        :return: the messages-per-wakeup histogram as a string:
+            "1: 12, 2-3: 4, 4-7: 0, ..., 1024+: 0"
+        """
+        buckets = []
+
+        for index, count in enumerate(self.rx_histogram):
+            low = 1 << index
+
+            if index == self.RX_HISTOGRAM_BUCKETS - 1:
+                buckets.append("%d+: %d" % (low, count))
+            elif low == 1:
+                buckets.append("1: %d" % count)
+            else:
+                buckets.append("%d-%d: %d" % (low, (low << 1) - 1, count))
+
+        return ", ".join(buckets)
+
+    def errorq_put(self, msg):
+        """
+        Queue the NLMSG_ERROR msg, indexed by (seq, pid), so the thread that
+        TXed the request can claim it with errorq_pop. Entries that were not
+        claimed after ERRORQ_EXPIRY seconds are dropped.
+        """
+        now = time.monotonic()
+
+        with self.errorq_lock:
+            while self.errorq:
+                key, (rx_time, _) = next(iter(self.errorq.items()))
+
+                if now - rx_time < self.ERRORQ_EXPIRY:
+                    break
+
+                del self.errorq[key]
+                self.errorq_counters["expired"] += 1
+
+            self.errorq[(msg.seq, msg.pid)] = (now, msg)
+            self.errorq_counters["queued"] += 1
+
+            if len(self.errorq) > self.errorq_counters["max_depth"]:
+                self.errorq_counters["max_depth"] = len(self.errorq)
+
+    def errorq_pop(self, seq, pid):
+        """
+        Remove and return the NLMSG_ERROR queued for (seq, pid) or None
+        """
+        start = time.perf_counter()
+
+        with self.errorq_lock:
+            entry = self.errorq.pop((seq, pid), None)
+
+            lookup_time = time.perf_counter() - start
+            self.errorq_counters["lookups"] += 1
+            self.errorq_counters["lookup_time"] += lookup_time
+
+            if lookup_time > self.errorq_counters["max_lookup_time"]:
+                self.errorq_counters["max_lookup_time"] = lookup_time
+
+            if not entry:
+                return None
+
+            self.errorq_counters["claimed"] += 1
+            return entry[1]
+
+    def errorq_reset(self):
+        with self.errorq_lock:
+            self.errorq.clear()
+
+    def errorq_stats(self):
+        """
+        :return: dict with the current errorq depth and the counters
+        """
+        with self.errorq_lock:
+            stats = dict(self.errorq_counters)
+            stats["depth"] = len(self.errorq)
+
+        return stats
+
+    def tx_nlpacket_async(self, nlpacket):
+        """
+        TX the message without waiting for the ack
+
+        Several requests can be in flight at the same time, each (seq, pid)
+        gets its own threading.Event which is set by the NetlinkListener once
+        the ACK (or NLMSG_ERROR) for this request is RXed. When errorq is
+        enabled the error is queued before the event is set.
+
+        :return: threading.Event
+        """
+        ack_event = Event()
+
+        # NetlinkListener looks up the (seq, pid) of each RXed ACK in
+        # tx_pending_acks to notify the right request
         with self.target_lock:
-            self.target_seq = nlpacket.seq
-            self.target_pid = nlpacket.pid
+            self.tx_pending_acks[(nlpacket.seq, nlpacket.pid)] = ack_event
 
             if not self.tx_socket:
                 self.tx_socket_allocate()
@@ -419,11 +748,80 @@ class NetlinkManagerWithListener(NetlinkManager):
                    (self,  NetlinkPacket.type_to_string[nlpacket.msgtype],
                     nlpacket.seq, nlpacket.pid, nlpacket.length))
 
-        self.tx_socket.sendall(nlpacket.message)
+        try:
+            self.tx_socket.sendall(nlpacket.message)
+        except Exception:
+            with self.target_lock:
+                self.tx_pending_acks.pop((nlpacket.seq, nlpacket.pid), None)
+            raise
 
+        return ack_event
+
+    def tx_nlpacket_get_response(self, nlpacket):
+        """
+        TX the message and wait for an ack
+        """
         # Wait for NetlinkListener to RX an ACK or DONE for this (seq, pid)
-        self.tx_socket_rxed_ack.wait()
-        self.tx_socket_rxed_ack.clear()
+        self.tx_nlpacket_async(nlpacket).wait()
+
+    def tx_nlpacket_dump_async(self, nlpacket, done_callback=None):
+        """
+        TX a dump request without waiting for the reply
+
+        The kernel only allows one dump in progress per netlink socket, each
+        dump request is sent on its own short-lived socket so several dumps
+        can be in flight at the same time. The NetlinkListener thread reads
+        the replies and queues them on the netlinkq (like any other message)
+        then closes the socket when the dump is done.
+
+        nlpacket shouldn't be built yet, its seq and pid are assigned here.
+        done_callback(seq, pid) is called by service_netlinkq once all the
+        messages of the dump were serviced.
+
+        :return: (seq, pid) of the dump request
+        """
+        dump_socket = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, 0)
+        try:
+            # let the kernel pick a unique port id for this socket
+            dump_socket.bind((0, 0))
+            nlpacket.build_message(next(self.sequence), dump_socket.getsockname()[0])
+
+            if nlpacket.msgtype in self.debug:
+                self.debug_seq_pid[(nlpacket.seq, nlpacket.pid)] = True
+
+            with self.dump_sockets_lock:
+                self.dump_callbacks[(nlpacket.seq, nlpacket.pid)] = done_callback
+                self.dump_sockets[dump_socket] = (nlpacket.seq, nlpacket.pid)
+
+            log.debug('%s DUMP: TXed %s seq %d, pid %d, %d bytes' %
+                      (self, NetlinkPacket.type_to_string[nlpacket.msgtype],
+                       nlpacket.seq, nlpacket.pid, nlpacket.length))
+
+            dump_socket.sendall(nlpacket.message)
+        except Exception:
+            with self.dump_sockets_lock:
+                self.dump_sockets.pop(dump_socket, None)
+                self.dump_callbacks.pop((nlpacket.seq, nlpacket.pid), None)
+            dump_socket.close()
+            raise
+
+        # wake up the listener thread so it starts watching the new socket
+        os.write(self.dump_sockets_wakeup[1], b"\0")
+        return nlpacket.seq, nlpacket.pid
+
+    def dump_async_done(self, msg):
+        """
+        Called by service_netlinkq for each NLMSG_DONE, if the message is
+        the end of a dump sent via tx_nlpacket_dump_async the associated
+        callback is executed.
+        """
+        with self.dump_sockets_lock:
+            if (msg.seq, msg.pid) not in self.dump_callbacks:
+                return
+            done_callback = self.dump_callbacks.pop((msg.seq, msg.pid))
+
+        if done_callback:
+            done_callback(msg.seq, msg.pid)
 
     # These are here to show some basic examples of how one might react to RXing
     # various netlink message types. Odds are our child class will redefine these
@@ -687,10 +1085,8 @@ class NetlinkManagerWithListener(NetlinkManager):
 
     def service_netlinkq(self, notify_event=None):
         msg_count = {}
-        processed = 0
 
-        for (msgtype, length, flags, seq, pid, data) in self.netlinkq:
-            processed += 1
+        for (msgtype, length, flags, seq, pid, data) in self.netlinkq_get():
 
             # If this is a reply to a TX message that debugs were enabled for then debug the reply
             if (seq, pid) in self.debug_seq_pid:
@@ -783,13 +1179,11 @@ class NetlinkManagerWithListener(NetlinkManager):
 
             elif msg.msgtype == NLMSG_DONE:
                 self.rx_nlmsg_done(msg)
+                self.dump_async_done(msg)
 
             else:
                 log.warning('RXed unknown netlink message type %s' % msgtype)
 
-        if processed:
-            self.netlinkq = self.netlinkq[processed:]
-
         if notify_event:
             notify_event.set()
 
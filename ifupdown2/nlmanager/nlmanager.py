@@ -35,6 +35,10 @@ import socket
 
 log = logging.getLogger(__name__)
 
+# As defined in linux/netlink.h
+SOL_NETLINK = 270
+NETLINK_GET_STRICT_CHK = 12
+
 
 class NetlinkError(Exception):
     pass
@@ -64,6 +68,8 @@ class Sequence(object):
 
 class NetlinkManager(object):
 
+    RECV_BUFFER = 65536
+
     def __init__(self, pid_offset=0, use_color=True, log_level=None):
         # PID_MAX_LIMIT is 2^22 allowing 1024 sockets per-pid. We default to 0
         # in the upper space (top 10 bits), which will simply be the PID. Other
@@ -128,12 +134,18 @@ class NetlinkManager(object):
     def debug_route(self, enabled):
         self._debug_set_clear((RTM_NEWROUTE, RTM_DELROUTE, RTM_GETROUTE), enabled)
 
+    def debug_rule(self, enabled):
+        self._debug_set_clear((RTM_NEWRULE, RTM_DELRULE, RTM_GETRULE), enabled)
+
     def debug_netconf(self, enabled):
         self._debug_set_clear((RTM_GETNETCONF, RTM_NEWNETCONF, RTM_DELNETCONF), enabled)
 
     def debug_mdb(self, enabled):
         self._debug_set_clear((RTM_GETMDB, RTM_NEWMDB, RTM_DELMDB), enabled)
 
+    def debug_tunnel(self, enabled):
+        self._debug_set_clear((RTM_GETTUNNEL, RTM_NEWTUNNEL, RTM_DELTUNNEL), enabled)
+
     def debug_this_packet(self, mtype):
         if mtype in self.debug:
             return True
@@ -178,6 +190,22 @@ class NetlinkManager(object):
                 self.tx_socket = None
             raise
 
+    def tx_socket_set_strict_check(self, enable=True):
+        """
+        Enable NETLINK_GET_STRICT_CHK on the TX socket, the kernel will then
+        honor the filters (ifindex...) set in our dump requests but it also
+        rejects requests with unexpected data in their header. Available
+        since linux 4.20, return False if the option isn't supported.
+        """
+        if not self.tx_socket:
+            self.tx_socket_allocate()
+        try:
+            self.tx_socket.setsockopt(SOL_NETLINK, NETLINK_GET_STRICT_CHK, int(enable))
+            return True
+        except (socket.error, OSError) as e:
+            log.debug("nlmanager: NETLINK_GET_STRICT_CHK: %s" % str(e))
+            return False
+
     def tx_nlpacket_raw(self, message):
         """
         TX a bunch of concatenated nlpacket.messages....do NOT wait for an ACK
@@ -222,6 +250,11 @@ class NetlinkManager(object):
         MAX_ERROR_NLE_INTR = 3
         msgs = []
 
+        # the replies are read in a preallocated buffer and walked with
+        # memoryview slices, each message is copied once when decoded
+        recv_buffer = bytearray(self.RECV_BUFFER)
+        recv_view = memoryview(recv_buffer)
+
         # Now listen to our socket and wait for the reply
         while True:
 
@@ -262,7 +295,7 @@ class NetlinkManager(object):
                 data = []
 
                 try:
-                    data = s.recv(4096)
+                    data = recv_view[:s.recv_into(recv_buffer)]
                 except Exception as e:
                     # 4 is Interrupted system call
                     if isinstance(e.args, tuple) and e[0] == 4:
@@ -308,7 +341,7 @@ class NetlinkManager(object):
                     elif msgtype == NLMSG_ERROR:
 
                         msg = Error(msgtype, nlpacket.debug)
-                        msg.decode_packet(length, flags, seq, pid, data)
+                        msg.decode_packet(length, flags, seq, pid, bytes(data[0:length]))
 
                         # The error code is a signed negative number.
                         error_code = abs(msg.negative_errno)
@@ -352,16 +385,22 @@ class NetlinkManager(object):
                         elif msgtype == RTM_NEWROUTE or msgtype == RTM_DELROUTE:
                             msg = Route(msgtype, nlpacket.debug, use_color=self.use_color)
 
+                        elif msgtype == RTM_NEWRULE or msgtype == RTM_DELRULE:
+                            msg = Rule(msgtype, nlpacket.debug, use_color=self.use_color)
+
                         elif msgtype in (RTM_GETNETCONF, RTM_NEWNETCONF):
                             msg = Netconf(msgtype, nlpacket.debug, use_color=self.use_color)
 
                         elif msgtype in (RTM_GETMDB, RTM_NEWMDB, RTM_DELMDB):
                             msg = MDB(msgtype, nlpacket.debug, use_color=self.use_color)
 
+                        elif msgtype in (RTM_GETTUNNEL, RTM_NEWTUNNEL, RTM_DELTUNNEL):
+                            msg = Tunnel(msgtype, nlpacket.debug, use_color=self.use_color)
+
                         else:
                             raise Exception("RXed unknown netlink message type %s" % msgtype)
 
-                        msg.decode_packet(length, flags, seq, pid, data)
+                        msg.decode_packet(length, flags, seq, pid, bytes(data[0:length]))
                         msgs.append(msg)
 
                         if nlpacket.debug:
@@ -399,6 +438,10 @@ class NetlinkManager(object):
             msg = Route(rtm_type, debug, use_color=self.use_color)
             msg.body = pack('Bxxxii', family, 0, 0)
 
+        elif rtm_type == RTM_GETRULE:
+            msg = Rule(rtm_type, debug, use_color=self.use_color)
+            msg.body = pack('=8BI', family, 0, 0, 0, 0, 0, 0, 0, 0)
+
         elif rtm_type == RTM_GETMDB:
             msg = MDB(rtm_type, debug, use_color=self.use_color)
             msg.body = pack('Bxxxii', family, 0, 0)
@@ -512,6 +555,14 @@ class NetlinkManager(object):
     def routes_dump(self, family=socket.AF_UNSPEC, debug=True):
         return self.request_dump(RTM_GETROUTE, family, debug)
 
+    def rules_dump(self, family=socket.AF_UNSPEC, debug=None):
+        """
+        ip [-4|-6] rule show
+        """
+        if debug is None:
+            debug = RTM_GETRULE in self.debug
+        return self.request_dump(RTM_GETRULE, family, debug)
+
     def routes_print(self, routes):
         """
         Print a table of 'routes'
@@ -1054,20 +1105,26 @@ class NetlinkManager(object):
     # =========
     # Addresses
     # =========
-    def addr_dump(self):
+    def addr_dump(self, ifindex=0):
         """
-            TODO: add ifname/ifindex filtering:
-                        - via the RTM_GETADDR request packet
-                        - or in python if kernel doesn't support per intf dump
+            ifindex filtering is done:
+                        - via the RTM_GETADDR request packet (the kernel only
+                          honors it with NETLINK_GET_STRICT_CHK, see
+                          tx_socket_set_strict_check)
+                        - and in python if kernel doesn't support per intf dump
         """
         debug = RTM_GETADDR in self.debug
 
         msg = Address(RTM_GETADDR, debug, use_color=self.use_color)
-        msg.body = pack('=Bxxxi', socket.AF_UNSPEC, 0)
+        msg.body = pack('=Bxxxi', socket.AF_UNSPEC, ifindex)
         msg.flags = NLM_F_REQUEST | NLM_F_ACK | NLM_F_DUMP
 
         msg.build_message(next(self.sequence), self.pid)
-        return self.tx_nlpacket_get_response(msg)
+        msgs = self.tx_nlpacket_get_response(msg)
+
+        if ifindex and msgs:
+            return [addr for addr in msgs if addr.ifindex == ifindex]
+        return msgs
 
     # =======
     # Netconf
@@ -1096,3 +1153,20 @@ class NetlinkManager(object):
         msg.flags = NLM_F_REQUEST | NLM_F_DUMP | NLM_F_ACK
         msg.build_message(next(self.sequence), self.pid)
         return self.tx_nlpacket_get_response(msg)
+
+    # ==========
+    # VNI filter
+    # ==========
+    def vni_filter_dump(self, ifindex=0):
+        """
+        bridge vni show [dev <ifname>]
+
+        The kernel only dumps the vni filter of ifindex (if set), without
+        ifindex all the vxlan devices with vnifilter enabled are dumped.
+        """
+        debug = RTM_GETTUNNEL in self.debug
+        msg = Tunnel(RTM_GETTUNNEL, debug, use_color=self.use_color)
+        msg.body = pack('=BBHI', socket.AF_BRIDGE, 0, 0, ifindex)
+        msg.flags = NLM_F_REQUEST | NLM_F_DUMP | NLM_F_ACK
+        msg.build_message(next(self.sequence), self.pid)
+        return self.tx_nlpacket_get_response(msg)
@@ -75,6 +75,10 @@ RTM_NEWROUTE  = 0x18
 RTM_DELROUTE  = 0x19
 RTM_GETROUTE  = 0x1A
 
+RTM_NEWRULE   = 0x20
+RTM_DELRULE   = 0x21
+RTM_GETRULE   = 0x22
+
 RTM_NEWQDISC  = 0x24
 RTM_DELQDISC  = 0x25
 RTM_GETQDISC  = 0x26
@@ -87,6 +91,10 @@ RTM_NEWMDB = 84
 RTM_DELMDB = 85
 RTM_GETMDB = 86
 
+RTM_NEWTUNNEL = 120
+RTM_DELTUNNEL = 121
+RTM_GETTUNNEL = 122
+
 # Netlink message flags
 NLM_F_REQUEST = 0x01  # It is query message.
 NLM_F_MULTI   = 0x02  # Multipart message, terminated by NLMSG_DONE
@@ -1497,6 +1505,12 @@ class AttributeIPAddress(Attribute):
                 elif self.atype == Route.RTA_DST:
                     prefixlen = parent_msg.dst_len
 
+            elif isinstance(parent_msg, Rule):
+                if self.atype == Rule.FRA_SRC:
+                    prefixlen = parent_msg.src_len
+                elif self.atype == Rule.FRA_DST:
+                    prefixlen = parent_msg.dst_len
+
             if self.family in (AF_INET, AF_BRIDGE):
                 self.value = ipnetwork.IPv4Network(unpack(self.PACK, self.data[4:])[0], prefixlen, scope)
 
@@ -1689,6 +1703,7 @@ class AttributeIFLA_AF_SPEC(Attribute):
     {
         Link.IFLA_BRIDGE_FLAGS: flags,
         Link.IFLA_BRIDGE_VLAN_INFO: (vflags, vlanid)
+        Link.IFLA_BRIDGE_VLAN_TUNNEL_INFO: [(tunnel_id, tunnel_vid, tunnel_flags)]
     }
     """
     def __init__(self, atype, string, family, logger):
@@ -1718,6 +1733,10 @@ class AttributeIFLA_AF_SPEC(Attribute):
                 for (vlan_flag, vlan_id) in sub_attr_value:
                     sub_attr_to_add.append((sub_attr_type, (vlan_flag, vlan_id)))
 
+            elif sub_attr_type == Link.IFLA_BRIDGE_VLAN_TUNNEL_INFO:
+                for (tunnel_id, tunnel_vid, tunnel_flags) in sub_attr_value:
+                    sub_attr_to_add.append((sub_attr_type, (tunnel_id, tunnel_vid, tunnel_flags)))
+
             else:
                 self.log.log(SYSLOG_EXTRA_DEBUG, 'Add support for encoding IFLA_AF_SPEC sub-attribute type %d' % sub_attr_type)
                 continue
@@ -1736,6 +1755,18 @@ class AttributeIFLA_AF_SPEC(Attribute):
                 sub_attr_payload.append(sub_attr_value[0])
                 sub_attr_payload.append(sub_attr_value[1])
 
+            elif sub_attr_type == Link.IFLA_BRIDGE_VLAN_TUNNEL_INFO:
+                # nested attributes (like iproute2 we don't set NLA_F_NESTED):
+                #     [IFLA_BRIDGE_VLAN_TUNNEL_ID]     __u32
+                #     [IFLA_BRIDGE_VLAN_TUNNEL_VID]    __u16
+                #     [IFLA_BRIDGE_VLAN_TUNNEL_FLAGS]  __u16
+                sub_attr_pack_layout.append('HHL')
+                sub_attr_payload.extend([8, Link.IFLA_BRIDGE_VLAN_TUNNEL_ID, sub_attr_value[0]])
+                sub_attr_pack_layout.append('HHHxx')
+                sub_attr_payload.extend([6, Link.IFLA_BRIDGE_VLAN_TUNNEL_VID, sub_attr_value[1]])
+                sub_attr_pack_layout.append('HHHxx')
+                sub_attr_payload.extend([6, Link.IFLA_BRIDGE_VLAN_TUNNEL_FLAGS, sub_attr_value[2]])
+
             sub_attr_length = calcsize(''.join(sub_attr_pack_layout))
             sub_attr_payload[sub_attr_length_index] = sub_attr_length
 
@@ -1821,7 +1852,9 @@ class AttributeIFLA_AF_SPEC(Attribute):
         self.decode_length_type(data)
         self.value = {}
 
-        data = self.data[4:]
+        # a bridge can have thousands of IFLA_BRIDGE_VLAN_INFO sub-attributes
+        # they are all unpacked from memoryview slices (no copy)
+        data = memoryview(self.data)[4:]
 
         while data:
             (sub_attr_length, sub_attr_type) = unpack('=HH', data[:4])
@@ -3505,6 +3538,9 @@ class NetlinkPacket(object):
         RTM_NEWROUTE  : 'RTM_NEWROUTE',
         RTM_DELROUTE  : 'RTM_DELROUTE',
         RTM_GETROUTE  : 'RTM_GETROUTE',
+        RTM_NEWRULE   : 'RTM_NEWRULE',
+        RTM_DELRULE   : 'RTM_DELRULE',
+        RTM_GETRULE   : 'RTM_GETRULE',
         RTM_NEWQDISC  : 'RTM_NEWQDISC',
         RTM_DELQDISC  : 'RTM_DELQDISC',
         RTM_GETQDISC  : 'RTM_GETQDISC',
@@ -3513,7 +3549,10 @@ class NetlinkPacket(object):
         RTM_DELNETCONF: 'RTM_DELNETCONF',
         RTM_NEWMDB    : 'RTM_NEWMDB',
         RTM_DELMDB    : 'RTM_DELMDB',
-        RTM_GETMDB    : 'RTM_GETMDB'
+        RTM_GETMDB    : 'RTM_GETMDB',
+        RTM_NEWTUNNEL : 'RTM_NEWTUNNEL',
+        RTM_DELTUNNEL : 'RTM_DELTUNNEL',
+        RTM_GETTUNNEL : 'RTM_GETTUNNEL'
     }
 
     af_family_to_string = {
@@ -3596,7 +3635,7 @@ class NetlinkPacket(object):
             foo.append('NLM_F_ECHO')
 
         # Modifiers to GET query
-        if msg_type in (RTM_GETLINK, RTM_GETADDR, RTM_GETNEIGH, RTM_GETROUTE, RTM_GETQDISC, RTM_GETNETCONF, RTM_GETMDB):
+        if msg_type in (RTM_GETLINK, RTM_GETADDR, RTM_GETNEIGH, RTM_GETROUTE, RTM_GETRULE, RTM_GETQDISC, RTM_GETNETCONF, RTM_GETMDB, RTM_GETTUNNEL):
             if flags & NLM_F_DUMP:
                 foo.append('NLM_F_DUMP')
             else:
@@ -3610,7 +3649,7 @@ class NetlinkPacket(object):
                 foo.append('NLM_F_ATOMIC')
 
         # Modifiers to NEW query
-        elif msg_type in (RTM_NEWLINK, RTM_NEWADDR, RTM_NEWNEIGH, RTM_NEWROUTE, RTM_NEWQDISC, RTM_NEWMDB):
+        elif msg_type in (RTM_NEWLINK, RTM_NEWADDR, RTM_NEWNEIGH, RTM_NEWROUTE, RTM_NEWRULE, RTM_NEWQDISC, RTM_NEWMDB, RTM_NEWTUNNEL):
             if flags & NLM_F_REPLACE:
                 foo.append('NLM_F_REPLACE')
 
@@ -3679,7 +3718,9 @@ class NetlinkPacket(object):
             self.dump_buffer.append("  Attributes")
             color = green if self.use_color else None
 
-        data = self.msg_data[self.LEN:]
+        # walk the attributes with a memoryview so we don't copy the rest
+        # of the message for each attribute, only the attribute is copied
+        data = memoryview(self.msg_data)[self.LEN:]
 
         while data:
             (length, attr_type) = unpack('=HH', data[:4])
@@ -3700,7 +3741,7 @@ class NetlinkPacket(object):
             #
             # How the attribute is decoded/unpacked is specific per AttributeXXXX class.
             attr_end = padded_length(length)
-            attr.decode(self, data[0:attr_end])
+            attr.decode(self, data[0:attr_end].tobytes())
 
             if self.debug:
                 self.line_number = attr.dump_lines(self.dump_buffer, self.line_number, color)
@@ -5041,6 +5082,182 @@ class MDB(NetlinkPacket):
             self.dump_buffer.append(data_to_color_text(2, color, bytearray(struct.pack('i', self.ifindex)),
                                               "Ifindex %s (%d)" % (zfilled_hex(self.ifindex, 8), self.ifindex)))
 
+class AttributeVxlanVnifilterEntry(Attribute):
+    """
+    VXLAN_VNIFILTER_ENTRY: one nested attribute per vni range
+
+    [VXLAN_VNIFILTER_ENTRY] = {
+        [VXLAN_VNIFILTER_ENTRY_START]   __u32
+        [VXLAN_VNIFILTER_ENTRY_END]     __u32 (only set for ranges)
+        [VXLAN_VNIFILTER_ENTRY_GROUP]   struct in_addr
+        [VXLAN_VNIFILTER_ENTRY_GROUP6]  struct in6_addr
+        [VXLAN_VNIFILTER_ENTRY_STATS]   (ignored)
+    }
+
+    A message usually carries many entries but NetlinkPacket.attributes only
+    holds one attribute per type: all the entries are decoded in the same
+    AttributeVxlanVnifilterEntry (see Tunnel.add_attribute) and encoded back
+    as one nested attribute each.
+
+    value is a list of (vni_start, vni_end, group), group is None or an
+    ipnetwork.IPv4Address/IPv6Address
+    """
+
+    def __init__(self, atype, string, family, logger):
+        Attribute.__init__(self, atype, string, logger)
+
+    def encode(self):
+        raw = bytes()
+
+        for (vni_start, vni_end, group) in self.value:
+            pack_layout = [self.HEADER_PACK, 'HHL']
+            payload = [0, self.atype | NLA_F_NESTED, 8, Tunnel.VXLAN_VNIFILTER_ENTRY_START, vni_start]
+
+            if vni_end != vni_start:
+                pack_layout.append('HHL')
+                payload.extend([8, Tunnel.VXLAN_VNIFILTER_ENTRY_END, vni_end])
+
+            if group:
+                group = ipnetwork.ip_address(str(group))
+
+                if group.version == 4:
+                    pack_layout.append('HH4s')
+                    payload.extend([8, Tunnel.VXLAN_VNIFILTER_ENTRY_GROUP, group.packed])
+                else:
+                    pack_layout.append('HH16s')
+                    payload.extend([20, Tunnel.VXLAN_VNIFILTER_ENTRY_GROUP6, group.packed])
+
+            pack_layout = ''.join(pack_layout)
+            payload[0] = calcsize(pack_layout)
+            raw += pack(pack_layout, *payload)
+
+        return raw
+
+    def decode(self, parent_msg, data):
+        self.decode_length_type(data)
+
+        if self.value is None:
+            self.value = []
+
+        vni_start = None
+        vni_end = None
+        group = None
+
+        data = self.data[4:]
+
+        while data:
+            (sub_attr_length, sub_attr_type) = unpack('=HH', data[:4])
+            sub_attr_end = padded_length(sub_attr_length)
+
+            if not sub_attr_length:
+                self.log.error('parsed a zero length sub-attr')
+                return
+
+            sub_attr_type &= NLA_TYPE_MASK
+
+            if sub_attr_type == Tunnel.VXLAN_VNIFILTER_ENTRY_START:
+                vni_start = unpack('=L', data[4:8])[0]
+
+            elif sub_attr_type == Tunnel.VXLAN_VNIFILTER_ENTRY_END:
+                vni_end = unpack('=L', data[4:8])[0]
+
+            elif sub_attr_type == Tunnel.VXLAN_VNIFILTER_ENTRY_GROUP:
+                group = ipnetwork.IPv4Address(unpack('>L', data[4:8])[0])
+
+            elif sub_attr_type == Tunnel.VXLAN_VNIFILTER_ENTRY_GROUP6:
+                (data1, data2) = unpack('>QQ', data[4:20])
+                group = ipnetwork.IPv6Address(data1 << 64 | data2)
+
+            data = data[sub_attr_end:]
+
+        if vni_start is not None:
+            self.value.append((vni_start, vni_end or vni_start, group))
+
+
+class Tunnel(NetlinkPacket):
+    """
+    RTM_NEWTUNNEL, RTM_DELTUNNEL, RTM_GETTUNNEL: vxlan vni filter (single
+    vxlan device), iproute2: bridge vni {add|del|show}
+
+    Service Header
+
+     0                   1                   2                   3
+     0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1
+    +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+    |   Family    |    Flags      |           Reserved              |
+    +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+    |                     Interface Index                           |
+    +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+
+    struct tunnel_msg {
+        __u8 family;
+        __u8 flags;
+        __u16 reserved2;
+        __u32 ifindex;
+    };
+    """
+    TUNNEL_MSG_FLAG_STATS = 0x01
+
+    # /usr/include/linux/if_link.h
+    VXLAN_VNIFILTER_UNSPEC = 0
+    VXLAN_VNIFILTER_ENTRY  = 1
+
+    VXLAN_VNIFILTER_ENTRY_UNSPEC = 0
+    VXLAN_VNIFILTER_ENTRY_START  = 1
+    VXLAN_VNIFILTER_ENTRY_END    = 2
+    VXLAN_VNIFILTER_ENTRY_GROUP  = 3
+    VXLAN_VNIFILTER_ENTRY_GROUP6 = 4
+    VXLAN_VNIFILTER_ENTRY_STATS  = 5
+
+    def __init__(self, msgtype, debug=False, logger=None, use_color=True, rx=False, tx=False):
+        NetlinkPacket.__init__(self, msgtype, debug, logger, use_color, rx, tx)
+        self.attribute_to_class = {
+            self.VXLAN_VNIFILTER_UNSPEC: ('VXLAN_VNIFILTER_UNSPEC', AttributeGeneric),
+            self.VXLAN_VNIFILTER_ENTRY: ('VXLAN_VNIFILTER_ENTRY', AttributeVxlanVnifilterEntry),
+        }
+        self.PACK = '=BBHI'
+        self.LEN = calcsize(self.PACK)
+
+    def add_attribute(self, attr_type, value):
+        # while decoding, the VXLAN_VNIFILTER_ENTRY attributes are all
+        # accumulated in the same attribute object
+        if value is None and attr_type & NLA_TYPE_MASK == self.VXLAN_VNIFILTER_ENTRY:
+            attr = self.attributes.get(self.VXLAN_VNIFILTER_ENTRY)
+
+            if attr:
+                return attr
+
+        return NetlinkPacket.add_attribute(self, attr_type, value)
+
+    def decode_attributes(self):
+        # build_message decodes the message it just built in debug mode
+        self.attributes.pop(self.VXLAN_VNIFILTER_ENTRY, None)
+        NetlinkPacket.decode_attributes(self)
+
+    def decode_service_header(self):
+        # Nothing to do if the message did not contain a service header
+        if self.length == self.header_LEN:
+            return
+
+        (self.family, self.tunnel_flags, _, self.ifindex) = unpack(self.PACK, self.msg_data[:self.LEN])
+
+        if self.debug:
+            color = yellow if self.use_color else None
+            color_start = "\033[%dm" % color if color else ""
+            color_end = "\033[0m" if color else ""
+            self.dump_buffer.append("  %sService Header%s" % (color_start, color_end))
+            self.dump_buffer.append(data_to_color_text(1, color, bytearray(struct.pack('!I', self.family)),
+                                              "Family %s (%d)" % (zfilled_hex(self.family, 2), self.family)))
+            self.dump_buffer.append(data_to_color_text(2, color, bytearray(struct.pack('i', self.ifindex)),
+                                              "Ifindex %s (%d)" % (zfilled_hex(self.ifindex, 8), self.ifindex)))
+
+    def get_vnis(self):
+        """
+        :return: list of (vni_start, vni_end, group)
+        """
+        return self.get_attribute_value(self.VXLAN_VNIFILTER_ENTRY, [])
+
+
 class Netconf(Link):
     """
     RTM_NEWNETCONF - Service Header
@@ -5620,6 +5837,175 @@ class Route(NetlinkPacket):
                 self.line_number += 1
 
 
+class Rule(NetlinkPacket):
+    """
+    RTM_NEWRULE, RTM_DELRULE, RTM_GETRULE: fib rules (ip rule)
+
+    Service Header
+
+    0                   1                   2                   3
+    0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1
+    +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+    |   Family    |  Dest length  |   Src length  |     TOS       |
+    +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+    |  Table ID   |   Reserved    |   Reserved    |    Action     |
+    +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+    |                          Flags                              |
+    +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+
+    struct fib_rule_hdr {
+        __u8 family;
+        __u8 dst_len;
+        __u8 src_len;
+        __u8 tos;
+        __u8 table;
+        __u8 res1;
+        __u8 res2;
+        __u8 action;
+        __u32 flags;
+    };
+    """
+
+    # Rule attributes
+    # /usr/include/linux/fib_rules.h
+    FRA_UNSPEC              = 0
+    FRA_DST                 = 1
+    FRA_SRC                 = 2
+    FRA_IIFNAME             = 3
+    FRA_GOTO                = 4
+    FRA_UNUSED2             = 5
+    FRA_PRIORITY            = 6
+    FRA_UNUSED3             = 7
+    FRA_UNUSED4             = 8
+    FRA_UNUSED5             = 9
+    FRA_FWMARK              = 10
+    FRA_FLOW                = 11
+    FRA_TUN_ID              = 12
+    FRA_SUPPRESS_IFGROUP    = 13
+    FRA_SUPPRESS_PREFIXLEN  = 14
+    FRA_TABLE               = 15
+    FRA_FWMASK              = 16
+    FRA_OIFNAME             = 17
+    FRA_PAD                 = 18
+    FRA_L3MDEV              = 19
+    FRA_UID_RANGE           = 20
+    FRA_PROTOCOL            = 21
+    FRA_IP_PROTO            = 22
+    FRA_SPORT_RANGE         = 23
+    FRA_DPORT_RANGE         = 24
+
+    attribute_to_class = {
+        FRA_UNSPEC              : ('FRA_UNSPEC', AttributeGeneric),
+        FRA_DST                 : ('FRA_DST', AttributeIPAddress),
+        FRA_SRC                 : ('FRA_SRC', AttributeIPAddress),
+        FRA_IIFNAME             : ('FRA_IIFNAME', AttributeStringInterfaceName),
+        FRA_GOTO                : ('FRA_GOTO', AttributeFourByteValue),
+        FRA_PRIORITY            : ('FRA_PRIORITY', AttributeFourByteValue),
+        FRA_FWMARK              : ('FRA_FWMARK', AttributeFourByteValue),
+        FRA_FLOW                : ('FRA_FLOW', AttributeFourByteValue),
+        FRA_TUN_ID              : ('FRA_TUN_ID', AttributeGeneric),
+        FRA_SUPPRESS_IFGROUP    : ('FRA_SUPPRESS_IFGROUP', AttributeFourByteValue),
+        FRA_SUPPRESS_PREFIXLEN  : ('FRA_SUPPRESS_PREFIXLEN', AttributeFourByteValue),
+        FRA_TABLE               : ('FRA_TABLE', AttributeFourByteValue),
+        FRA_FWMASK              : ('FRA_FWMASK', AttributeFourByteValue),
+        FRA_OIFNAME             : ('FRA_OIFNAME', AttributeStringInterfaceName),
+        FRA_PAD                 : ('FRA_PAD', AttributeGeneric),
+        FRA_L3MDEV              : ('FRA_L3MDEV', AttributeOneByteValue),
+        FRA_UID_RANGE           : ('FRA_UID_RANGE', AttributeGeneric),
+        FRA_PROTOCOL            : ('FRA_PROTOCOL', AttributeOneByteValue),
+        FRA_IP_PROTO            : ('FRA_IP_PROTO', AttributeOneByteValue),
+        FRA_SPORT_RANGE         : ('FRA_SPORT_RANGE', AttributeGeneric),
+        FRA_DPORT_RANGE         : ('FRA_DPORT_RANGE', AttributeGeneric),
+    }
+
+    # Rule actions
+    FR_ACT_UNSPEC       = 0
+    FR_ACT_TO_TBL       = 1  # Pass to fixed table
+    FR_ACT_GOTO         = 2  # Jump to another rule
+    FR_ACT_NOP          = 3  # No operation
+    FR_ACT_RES3         = 4
+    FR_ACT_RES4         = 5
+    FR_ACT_BLACKHOLE    = 6  # Drop without notification
+    FR_ACT_UNREACHABLE  = 7  # Drop with ENETUNREACH
+    FR_ACT_PROHIBIT     = 8  # Drop with EACCES
+
+    action_to_string = {
+        FR_ACT_UNSPEC       : 'FR_ACT_UNSPEC',
+        FR_ACT_TO_TBL       : 'FR_ACT_TO_TBL',
+        FR_ACT_GOTO         : 'FR_ACT_GOTO',
+        FR_ACT_NOP          : 'FR_ACT_NOP',
+        FR_ACT_RES3         : 'FR_ACT_RES3',
+        FR_ACT_RES4         : 'FR_ACT_RES4',
+        FR_ACT_BLACKHOLE    : 'FR_ACT_BLACKHOLE',
+        FR_ACT_UNREACHABLE  : 'FR_ACT_UNREACHABLE',
+        FR_ACT_PROHIBIT     : 'FR_ACT_PROHIBIT'
+    }
+
+    # Rule flags
+    FIB_RULE_PERMANENT  = 0x00000001
+    FIB_RULE_INVERT     = 0x00000002
+    FIB_RULE_UNRESOLVED = 0x00000004
+    FIB_RULE_IIF_DETACHED = 0x00000008
+    FIB_RULE_OIF_DETACHED = 0x00000010
+
+    def __init__(self, msgtype, debug=False, logger=None, use_color=True):
+        NetlinkPacket.__init__(self, msgtype, debug, logger, use_color)
+        self.PACK = '=8BI'
+        self.LEN = calcsize(self.PACK)
+
+    def get_action_string(self, index=None):
+        if index is None:
+            index = self.action
+        return self.get_string(self.action_to_string, index)
+
+    def get_table(self):
+        """
+        The table id is only stored in the header if it fits in a byte,
+        FRA_TABLE always holds the full table id
+        """
+        return self.get_attribute_value(self.FRA_TABLE, self.table_id)
+
+    def decode_service_header(self):
+
+        # Nothing to do if the message did not contain a service header
+        if self.length == self.header_LEN:
+            return
+
+        # the fib rule flags are stored in rule_flags, flags are the netlink
+        # header flags
+        (self.family, self.dst_len, self.src_len, self.tos,
+         self.table_id, _, _, self.action,
+         self.rule_flags) = \
+            unpack(self.PACK, self.msg_data[:self.LEN])
+
+        if self.debug:
+            color = yellow if self.use_color else None
+            color_start = "\033[%dm" % color if color else ""
+            color_end = "\033[0m" if color else ""
+            self.dump_buffer.append("  %sService Header%s" % (color_start, color_end))
+
+            for x in range(0, self.LEN//4):
+                if self.line_number == 5:
+                    extra = "Family %s (%s:%d), Destination Length %s (%d), Source Length %s (%d), TOS %s (%d)" % \
+                            (zfilled_hex(self.family, 2), get_family_str(self.family), self.family,
+                             zfilled_hex(self.dst_len, 2), self.dst_len,
+                             zfilled_hex(self.src_len, 2), self.src_len,
+                             zfilled_hex(self.tos, 2), self.tos)
+                elif self.line_number == 6:
+                    extra = "Table ID %s (%d), Action %s (%d - %s)" % \
+                            (zfilled_hex(self.table_id, 2), self.table_id,
+                             zfilled_hex(self.action, 2), self.action, self.get_action_string())
+                elif self.line_number == 7:
+                    extra = "Flags %s" % zfilled_hex(self.rule_flags, 8)
+                else:
+                    extra = "Unexpected line number %d" % self.line_number
+
+                start = x * 4
+                end = start + 4
+                self.dump_buffer.append(data_to_color_text(self.line_number, color, self.msg_data[start:end], extra))
+                self.line_number += 1
+
+
 class Done(NetlinkPacket):
     """
     NLMSG_DONE
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2015-2020 Cumulus Networks, Inc. all rights reserved
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+#
+# https://www.gnu.org/licenses/gpl-2.0-standalone.html
+#
+# Sock Diag --
+#    NETLINK_SOCK_DIAG queries (ss) and SOCK_DESTROY (ss -K)
+#
+
+from .nlpacket import NLMSG_ERROR, NLMSG_DONE, NLM_F_REQUEST, NLM_F_ACK, NLM_F_DUMP
+from .nlmanager import NetlinkError
+from itertools import count
+from select import select
+from struct import pack, unpack, calcsize
+import ipaddress
+import logging
+import socket
+import errno
+import os
+
+log = logging.getLogger(__name__)
+
+NETLINK_SOCK_DIAG = 4
+
+SOCK_DIAG_BY_FAMILY = 20
+SOCK_DESTROY = 21
+
+# inet_diag_req_v2 attributes
+INET_DIAG_REQ_BYTECODE = 1
+
+# inet_diag bytecode operations
+INET_DIAG_BC_DEV_COND = 9
+
+# tcp states (include/net/tcp_states.h)
+TCP_ESTABLISHED = 1
+TCP_SYN_SENT = 2
+TCP_SYN_RECV = 3
+TCP_FIN_WAIT1 = 4
+TCP_FIN_WAIT2 = 5
+TCP_TIME_WAIT = 6
+TCP_CLOSE = 7
+TCP_CLOSE_WAIT = 8
+TCP_LAST_ACK = 9
+TCP_LISTEN = 10
+TCP_CLOSING = 11
+
+TCPF_ALL = 0xFFF
+
+# ss default states: connected sockets
+TCPF_CONNECTED = TCPF_ALL & ~((1 << TCP_LISTEN) | (1 << TCP_CLOSE) | (1 << TCP_TIME_WAIT) | (1 << TCP_SYN_RECV))
+
+
+class InetDiagSocket:
+    """
+    Decoded inet_diag_msg (SOCK_DIAG_BY_FAMILY reply)
+
+    struct inet_diag_msg {
+        __u8    idiag_family;
+        __u8    idiag_state;
+        __u8    idiag_timer;
+        __u8    idiag_retrans;
+
+        struct inet_diag_sockid id;
+
+        __u32   idiag_expires;
+        __u32   idiag_rqueue;
+        __u32   idiag_wqueue;
+        __u32   idiag_uid;
+        __u32   idiag_inode;
+    };
+
+    struct inet_diag_sockid {
+        __be16  idiag_sport;
+        __be16  idiag_dport;
+        __be32  idiag_src[4];
+        __be32  idiag_dst[4];
+        __u32   idiag_if;
+        __u32   idiag_cookie[2];
+    };
+    """
+    __slots__ = ("family", "protocol", "state", "sport", "dport", "src", "dst", "ifindex", "uid", "inode", "sockid")
+
+    HEADER_PACK = "=BBBB"
+    SOCKID_PACK = ">HH16s16s"
+    SOCKID_TAIL_PACK = "=I8s"
+    TAIL_PACK = "=IIIII"
+
+    SOCKID_LEN = calcsize(SOCKID_PACK) + calcsize(SOCKID_TAIL_PACK)
+    LEN = calcsize(HEADER_PACK) + SOCKID_LEN + calcsize(TAIL_PACK)
+
+    def __init__(self, protocol, data):
+        self.protocol = protocol
+        offset = calcsize(self.HEADER_PACK)
+        self.family, self.state, _, _ = unpack(self.HEADER_PACK, data[:offset])
+
+        # the socket id is sent back as is in the SOCK_DESTROY request
+        self.sockid = bytes(data[offset:offset + self.SOCKID_LEN])
+        self.sport, self.dport, src, dst = unpack(self.SOCKID_PACK, self.sockid[:calcsize(self.SOCKID_PACK)])
+        self.ifindex, _ = unpack(self.SOCKID_TAIL_PACK, self.sockid[calcsize(self.SOCKID_PACK):])
+        self.src = self.__decode_address(src)
+        self.dst = self.__decode_address(dst)
+
+        offset += self.SOCKID_LEN
+        _, _, _, self.uid, self.inode = unpack(self.TAIL_PACK, data[offset:offset + calcsize(self.TAIL_PACK)])
+
+    def __decode_address(self, raw):
+        if self.family == socket.AF_INET:
+            return ipaddress.IPv4Address(raw[:4])
+
+        ip = ipaddress.IPv6Address(raw)
+        # ipv4 connections on a dual stack socket
+        return ip.ipv4_mapped or ip
+
+    def __str__(self):
+        return "%s %s:%s -> %s:%s (dev %s, inode %s)" % (
+            "tcp" if self.protocol == socket.IPPROTO_TCP else "udp" if self.protocol == socket.IPPROTO_UDP else self.protocol,
+            self.src, self.sport, self.dst, self.dport, self.ifindex, self.inode
+        )
+
+
+class SockDiag(object):
+    """
+    NETLINK_SOCK_DIAG socket: dump the inet sockets (ss) and destroy them
+    (ss -K, requires CONFIG_INET_DIAG_DESTROY)
+
+        with SockDiag() as sock_diag:
+            sockets = sock_diag.get_sockets(ifindex=ifindex)
+            sock_diag.destroy(sockets)
+    """
+
+    RECV_BUFFER = 65536
+
+    # max number of SOCK_DESTROY requests in flight
+    DESTROY_WINDOW = 256
+
+    def __init__(self):
+        self.sock = None
+        self.sequence = count(1)
+        self.bytecode_supported = True
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def open(self):
+        if not self.sock:
+            self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_SOCK_DIAG)
+            self.sock.bind((0, 0))
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    @staticmethod
+    def __request(msgtype, flags, seq, family, protocol, states, sockid=None, attributes=b""):
+        """
+        struct inet_diag_req_v2 {
+            __u8    sdiag_family;
+            __u8    sdiag_protocol;
+            __u8    idiag_ext;
+            __u8    pad;
+            __u32   idiag_states;
+            struct inet_diag_sockid id;
+        };
+        """
+        body = pack("=BBBxI", family, protocol, 0, states) + (sockid or b"\0" * InetDiagSocket.SOCKID_LEN) + attributes
+        return pack("=LHHLL", 16 + len(body), msgtype, flags, seq, 0) + body
+
+    @staticmethod
+    def __dev_cond_bytecode(ifindex):
+        """ inet_diag bytecode for "dev == ifindex" (bound device) """
+        # struct inet_diag_bc_op { __u8 code; __u8 yes; __u16 no; } + ifindex
+        # yes: jump to the end of the program (match), no: jump past it
+        bytecode = pack("=BBHI", INET_DIAG_BC_DEV_COND, 8, 12, ifindex)
+        return pack("=HH", 4 + len(bytecode), INET_DIAG_REQ_BYTECODE) + bytecode
+
+    def __recv(self, on_message):
+        """
+        Read the replies, on_message(msgtype, seq, data) returns True when
+        done reading (the rest of the datagram is still processed)
+        """
+        buf = bytearray(self.RECV_BUFFER)
+        done = False
+
+        while not done:
+            readable, _, _ = select([self.sock], [], [], 1)
+
+            if not readable:
+                raise NetlinkError("sock_diag: no reply from the kernel")
+
+            view = memoryview(buf)[:self.sock.recv_into(buf)]
+
+            while len(view) >= 16:
+                length, msgtype, flags, seq, pid = unpack("=LHHLL", view[:16])
+
+                if length < 16:
+                    break
+
+                if on_message(msgtype, seq, view[16:length]):
+                    done = True
+
+                view = view[(length + 3) & ~3:]
+
+    def __dump(self, family, protocol, states, ifindex):
+        seq = next(self.sequence)
+        attributes = self.__dev_cond_bytecode(ifindex) if ifindex and self.bytecode_supported else b""
+        sockets = []
+        error = []
+
+        def on_message(msgtype, msg_seq, data):
+            if msg_seq != seq:
+                return False
+            if msgtype == NLMSG_DONE:
+                return True
+            if msgtype == NLMSG_ERROR:
+                error.append(abs(unpack("=i", data[:4])[0]))
+                return True
+            if msgtype == SOCK_DIAG_BY_FAMILY and len(data) >= InetDiagSocket.LEN:
+                sockets.append(InetDiagSocket(protocol, data))
+            return False
+
+        self.sock.sendall(self.__request(SOCK_DIAG_BY_FAMILY, NLM_F_REQUEST | NLM_F_DUMP, seq, family, protocol, states,
+                                         attributes=attributes))
+        self.__recv(on_message)
+
+        if error and error[0]:
+            if attributes and error[0] == errno.EINVAL:
+                # kernel without INET_DIAG_BC_DEV_COND: filter the full dump
+                log.debug("sock_diag: bytecode filter not supported, filtering the full dump")
+                self.bytecode_supported = False
+                return self.__dump(family, protocol, states, ifindex)
+            raise NetlinkError("sock_diag dump failed with '%s' (%s)" % (os.strerror(error[0]), error[0]))
+
+        return sockets
+
+    def get_sockets(self, families=(socket.AF_INET, socket.AF_INET6), protocols=(socket.IPPROTO_TCP, socket.IPPROTO_UDP),
+                    states=TCPF_ALL, ifindex=None, local_addresses=None, local_port=None):
+        """
+        ss [-t|-u] [state ...] [dev == <ifindex>] [src <ip>] [sport == <port>]
+
+        :param ifindex: only the sockets bound to this device (filtered by the
+                        kernel when supported)
+        :param local_addresses: only the sockets with one of these local
+                                addresses (strings)
+        :param local_port: only the sockets with this local port
+        :return: list of InetDiagSocket
+        """
+        self.open()
+        local_addresses = set(local_addresses) if local_addresses is not None else None
+        sockets = []
+
+        for family in families:
+            for protocol in protocols:
+                for sock in self.__dump(family, protocol, states, ifindex):
+                    if ifindex and sock.ifindex != ifindex:
+                        continue
+                    if local_addresses is not None and str(sock.src) not in local_addresses:
+                        continue
+                    if local_port is not None and sock.sport != local_port:
+                        continue
+                    sockets.append(sock)
+
+        return sockets
+
+    def destroy(self, sockets):
+        """
+        ss -K: close the sockets, the SOCK_DESTROY requests are pipelined
+
+        :param sockets: list of InetDiagSocket
+        :return: list of (InetDiagSocket, errno) for the failed requests
+                 (ENOENT: the socket is already gone)
+        """
+        self.open()
+        errors = []
+        pending = {}
+
+        def on_message(msgtype, seq, data):
+            if msgtype != NLMSG_ERROR or seq not in pending:
+                return False
+            sock = pending.pop(seq)
+            error = abs(unpack("=i", data[:4])[0])
+            if error:
+                errors.append((sock, error))
+            return True
+
+        for sock in sockets:
+            if len(pending) >= self.DESTROY_WINDOW:
+                self.__recv(on_message)
+
+            seq = next(self.sequence)
+            pending[seq] = sock
+            self.sock.sendall(self.__request(SOCK_DESTROY, NLM_F_REQUEST | NLM_F_ACK, seq, sock.family, sock.protocol,
+                                             TCPF_ALL, sockid=sock.sockid))
+
+        while pending:
+            self.__recv(on_message)
+
+        return errors
+
+
+def get_socket_pids(inodes):
+    """
+    Find the processes holding the sockets (ss -p): scan the file
+    descriptors in /proc/<pid>/fd for socket:[<inode>]
+
+    :param inodes: iterable of socket inodes
+    :return: {inode: set of pids}
+    """
+    targets = dict(("socket:[%d]" % inode, inode) for inode in inodes if inode)
+    pids = {}
+
+    if not targets:
+        return pids
+
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        fd_dir = "/proc/%s/fd" % pid
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue
+        for fd in fds:
+            try:
+                inode = targets.get(os.readlink("%s/%s" % (fd_dir, fd)))
+            except OSError:
+                continue
+            if inode is not None:
+                pids.setdefault(inode, set()).add(int(pid))
+
+    return pids
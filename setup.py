@@ -36,6 +36,7 @@ if not build_deb_package():
             'ifdown = ifupdown2.__main__:main',
             'ifquery = ifupdown2.__main__:main',
             'ifreload = ifupdown2.__main__:main',
+            'ifupdown2d = ifupdown2.__main__:main',
         ],
     }
 
@@ -3,8 +3,25 @@
 
 """Tests for `ifupdown2` package."""
 
+import os
+import copy
+import pickle
+import logging
+import threading
+
 import pytest
 
+from collections import OrderedDict
+
+from ifupdown2.ifupdown.iface import iface, ifaceState, ifaceStatus
+from ifupdown2.ifupdown.ifupdownmain import ifupdownMain
+from ifupdown2.ifupdown.networkinterfaces import networkInterfaces
+from ifupdown2.ifupdown.parsecache import parseCache
+from ifupdown2.ifupdown.scheduler import ifaceScheduler
+from ifupdown2.ifupdown.statemanager import stateManager
+from ifupdown2.ifupdown.upperindex import ifaceUpperIndex
+from ifupdown2.ifupdownaddons.mstpctlutil import mstpctlutil
+
 
 @pytest.fixture
 def response():
@@ -20,3 +37,452 @@ def test_content(response):
     """Sample pytest test function with the pytest fixture as an argument."""
     # from bs4 import BeautifulSoup
     # assert 'GitHub' in BeautifulSoup(response.content).title.string
+
+
+UP_OPS = ['pre-up', 'up', 'post-up']
+
+
+class FakeFlags():
+    ADDONS_ENABLE = True
+    SCHED_SKIP_CHECK_UPPERIFACES = False
+
+
+class FakeModule():
+    """ addon recording the (ifacename, op) it runs """
+
+    def __init__(self, fail=()):
+        self.lock = threading.Lock()
+        self.calls = []
+        self.threads = set()
+        self.fail = fail
+
+    def run(self, ifaceobj, op, ifaceobj_getfunc=None):
+        with self.lock:
+            self.calls.append((ifaceobj.name, op))
+            self.threads.add(threading.current_thread().name)
+        if ifaceobj.name in self.fail:
+            raise Exception('%s: failed' % ifaceobj.name)
+
+
+class FakeBatchModule(FakeModule):
+    """ addon recording the levels it runs (see run_iface_level_ops) """
+
+    def __init__(self, fail=()):
+        FakeModule.__init__(self, fail)
+        self.batches = []
+
+    def run_batch(self, ifaceobjs, op, ifaceobj_getfunc=None):
+        self.batches.append((sorted(i.name for i in ifaceobjs), op))
+        if any(i.name in self.fail for i in ifaceobjs):
+            raise Exception('batch failed')
+
+
+class FakeIfupdown():
+    """ the ifupdownMain bits the scheduler uses """
+
+    def __init__(self, graph, modules, config=None):
+        self.logger = logging.getLogger('ifupdown.test')
+        self.flags = FakeFlags()
+        self.config = config or {}
+        self.type = None
+        self.modules = OrderedDict(modules)
+        self.module_ops = dict((op, list(self.modules)) for op in UP_OPS)
+        self.script_ops = {}
+        self.ops_handlers = {}
+        self.sched_hooks = {}
+        self.ifaceobjdict = OrderedDict()
+        for ifacename, lowers in graph.items():
+            ifaceobj = iface({'name': ifacename})
+            ifaceobj.lowerifaces = list(lowers)
+            self.ifaceobjdict[ifacename] = [ifaceobj]
+        for ifacename, lowers in graph.items():
+            for lower in lowers:
+                if lower not in self.ifaceobjdict:
+                    continue
+                ifaceobj = self.ifaceobjdict[lower][0]
+                ifaceobj.upperifaces = (ifaceobj.upperifaces or []) + [ifacename]
+
+    def get_ifaceobjs(self, ifacename):
+        return self.ifaceobjdict.get(ifacename)
+
+    def ignore_error(self, errmsg):
+        return False
+
+    def link_exists(self, ifacename):
+        return True
+
+    def is_ifaceobj_noconfig(self, ifaceobj):
+        return False
+
+    def is_iface_noconfig(self, ifacename):
+        return False
+
+
+# br0 -> bond0 -> swp1, swp2
+#     -> swp3
+# vrf0 -> swp4
+GRAPH = OrderedDict([
+    ('br0', ['bond0', 'swp3']),
+    ('bond0', ['swp1', 'swp2']),
+    ('vrf0', ['swp4']),
+    ('swp1', []),
+    ('swp2', []),
+    ('swp3', []),
+    ('swp4', []),
+])
+
+
+def assert_lowers_first(calls, graph):
+    """ every interface runs all its ops after all its lowerifaces """
+    for ifacename, lowers in graph.items():
+        first = calls.index((ifacename, UP_OPS[0]))
+        for lower in lowers:
+            assert calls.index((lower, UP_OPS[-1])) < first
+
+
+def test_sched_parallel_runs_lowers_first():
+    module = FakeModule()
+    ifupdownobj = FakeIfupdown(GRAPH, [('fake', module)])
+    ifaceScheduler.reset()
+    ifaceScheduler.run_iface_list_parallel(ifupdownobj, ['br0', 'vrf0'],
+                                           UP_OPS, njobs=4)
+    assert sorted(set(i for i, _ in module.calls)) == sorted(GRAPH)
+    assert len(module.calls) == len(GRAPH) * len(UP_OPS)
+    assert_lowers_first(module.calls, GRAPH)
+    assert all(t.startswith('ifupdown2-sched') for t in module.threads)
+    for ifaceobjs in ifupdownobj.ifaceobjdict.values():
+        assert ifaceobjs[0].state == ifaceState.POST_UP
+        assert ifaceobjs[0].status == ifaceStatus.SUCCESS
+    assert ifaceScheduler.get_sched_status()
+
+
+def test_sched_parallel_lower_failure_skips_uppers():
+    # swp9 has no iface object: bond0 and br0 are not brought up
+    graph = OrderedDict(GRAPH)
+    graph['bond0'] = ['swp1', 'swp9']
+    module = FakeModule()
+    ifupdownobj = FakeIfupdown(graph, [('fake', module)])
+    ifaceScheduler.reset()
+    ifaceScheduler.run_iface_list_parallel(ifupdownobj, ['br0', 'vrf0'],
+                                           UP_OPS, njobs=4)
+    ran = set(i for i, _ in module.calls)
+    assert ran == set(['swp1', 'swp3', 'swp4', 'vrf0'])
+    assert ifupdownobj.get_ifaceobjs('bond0')[0].status == ifaceStatus.ERROR
+    assert ifupdownobj.get_ifaceobjs('br0')[0].status == ifaceStatus.ERROR
+
+
+def test_mstpctl_batch_is_per_thread(monkeypatch):
+    executed = []
+    monkeypatch.setattr(mstpctlutil, '_mstpctlutil__exec_batch',
+                        staticmethod(lambda cmds: executed.append(list(cmds))))
+    mstpctlcmd = mstpctlutil()
+    barrier = threading.Barrier(2)
+
+    def configure(bridge):
+        mstpctlcmd.batch_start()
+        barrier.wait()
+        mstpctlcmd._mstpctlutil__execute_or_batch('setmaxage %s 20' % bridge)
+        barrier.wait()
+        mstpctlcmd.batch_commit()
+
+    threads = [threading.Thread(target=configure, args=(b,))
+               for b in ('br0', 'br1')]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(executed) == [['setmaxage br0 20'], ['setmaxage br1 20']]
+
+
+def test_sched_levels_batches_each_level():
+    batch_module = FakeBatchModule()
+    module = FakeModule()
+    ifupdownobj = FakeIfupdown(GRAPH, [('batch', batch_module),
+                                       ('fake', module)])
+    ifaceScheduler.reset()
+    ifaceScheduler.run_iface_list_levels(ifupdownobj, ['br0', 'vrf0'], UP_OPS)
+    levels = [['swp1', 'swp2', 'swp3', 'swp4'], ['bond0', 'vrf0'], ['br0']]
+    assert batch_module.batches == [(level, op) for level in levels
+                                    for op in UP_OPS]
+    # run_batch is used instead of run
+    assert not batch_module.calls
+    # the modules without run_batch are run interface by interface
+    assert len(module.calls) == len(GRAPH) * len(UP_OPS)
+    assert_lowers_first(module.calls, GRAPH)
+    for ifaceobjs in ifupdownobj.ifaceobjdict.values():
+        assert ifaceobjs[0].status == ifaceStatus.SUCCESS
+
+
+def test_sched_levels_batch_error_marks_the_level():
+    batch_module = FakeBatchModule(fail=('swp4',))
+    ifupdownobj = FakeIfupdown(GRAPH, [('batch', batch_module)])
+    ifaceScheduler.reset()
+    ifaceScheduler.run_iface_list_levels(ifupdownobj, ['br0', 'vrf0'], UP_OPS)
+    for ifacename in ('swp1', 'swp2', 'swp3', 'swp4'):
+        status = ifupdownobj.get_ifaceobjs(ifacename)[0].status
+        assert status == ifaceStatus.ERROR
+    assert not ifaceScheduler.get_sched_status()
+    ifaceScheduler.reset()
+
+
+def test_mstpctl_batch_commit_replays_by_owner(monkeypatch):
+    executed = []
+
+    def exec_batch(cmds):
+        executed.append(list(cmds))
+        if any('br1' in cmd for cmd in cmds):
+            raise Exception('mstpctl batch failed')
+
+    monkeypatch.setattr(mstpctlutil, '_mstpctlutil__exec_batch',
+                        staticmethod(exec_batch))
+    mstpctlcmd = mstpctlutil()
+    errors = []
+    mstpctlcmd.batch_start()
+    for bridge in ('br0', 'br1'):
+        mstpctlcmd.batch_set_owner(bridge)
+        # nested batches are folded in the outer one
+        mstpctlcmd.batch_start()
+        mstpctlcmd._mstpctlutil__execute_or_batch('setmaxage %s 20' % bridge)
+        mstpctlcmd._mstpctlutil__execute_or_batch('setfdelay %s 15' % bridge)
+        mstpctlcmd.batch_commit()
+    assert not executed
+    mstpctlcmd.batch_commit(on_error=lambda owner, e: errors.append(owner))
+    assert executed == [
+        ['setmaxage br0 20', 'setfdelay br0 15',
+         'setmaxage br1 20', 'setfdelay br1 15'],
+        ['setmaxage br0 20', 'setfdelay br0 15'],
+        ['setmaxage br1 20', 'setfdelay br1 15'],
+    ]
+    assert errors == ['br1']
+
+
+class FakeLinkCache():
+    """ the netlink cache bits used by ifaceUpperIndex """
+
+    def __init__(self, links):
+        self.links = set(links)
+        self.watchers = []
+
+    def register_link_watcher(self, callback):
+        self.watchers.append(callback)
+
+    def unregister_link_watcher(self, callback):
+        self.watchers.remove(callback)
+
+    def link_exists(self, ifname):
+        return ifname in self.links
+
+    def set_link(self, ifname, exists):
+        if exists:
+            self.links.add(ifname)
+        else:
+            self.links.discard(ifname)
+        for callback in self.watchers:
+            callback(ifname, exists)
+
+
+def test_upper_index_tracks_link_changes():
+    graph = OrderedDict(GRAPH)
+    # swp3 is also enslaved to a second upper
+    graph['br1'] = ['swp3']
+    ifupdownobj = FakeIfupdown(graph, [])
+    cache = FakeLinkCache(['br0', 'swp1', 'swp2', 'swp3', 'swp4'])
+    index = ifaceUpperIndex(ifupdownobj, cache)
+
+    assert index.get_upperifaces('swp3') == ['br0', 'br1']
+    assert index.get_alive_upperifaces('swp1') == []
+    assert index.get_alive_upperifaces('swp3') == ['br0']
+    assert index.get_alive_upperifaces('swp3', skip='br0') == []
+    assert index.get_alive_upperifaces('bond0') == ['br0']
+
+    cache.set_link('bond0', True)
+    cache.set_link('br1', True)
+    assert index.get_alive_upperifaces('swp1') == ['bond0']
+    assert index.get_alive_upperifaces('swp3', skip='br0') == ['br1']
+    # notifications for links that already exist are ignored
+    cache.set_link('br1', True)
+    cache.set_link('br0', False)
+    assert index.get_alive_upperifaces('swp3') == ['br1']
+    assert index.get_alive_upperifaces('bond0') == []
+
+    index.close()
+    assert not cache.watchers
+
+
+def test_check_upperifaces_uses_the_index():
+    ifupdownobj = FakeIfupdown(GRAPH, [], config={'warn_on_ifdown': '1'})
+    cache = FakeLinkCache(['bond0', 'swp1'])
+    swp1 = ifupdownobj.get_ifaceobjs('swp1')[0]
+    ifaceScheduler._UPPER_INDEX = ifaceUpperIndex(ifupdownobj, cache)
+    try:
+        # bond0 is still around: swp1 can't be brought down on its own
+        assert not ifaceScheduler._check_upperifaces(ifupdownobj, swp1,
+                                                     ['down'], None)
+        assert ifaceScheduler._check_upperifaces(ifupdownobj, swp1,
+                                                 ['down'], 'bond0')
+        cache.set_link('bond0', False)
+        assert ifaceScheduler._check_upperifaces(ifupdownobj, swp1,
+                                                 ['down'], None)
+    finally:
+        ifaceScheduler._UPPER_INDEX.close()
+        ifaceScheduler._UPPER_INDEX = None
+
+
+def new_iface(name, config):
+    ifaceobj = iface({'name': name, 'config': OrderedDict(config)})
+    ifaceobj.update_config_fingerprint()
+    return ifaceobj
+
+
+def test_config_fingerprint_reset_on_config_write():
+    ifaceobj = new_iface('swp1', [('mtu', ['9000'])])
+    other = copy.deepcopy(ifaceobj)
+    assert ifaceobj.compare(other)
+
+    # direct assignment, as done by the addons translate()
+    other.config = OrderedDict([('mtu', ['1500'])])
+    assert ifaceobj.get_config_fingerprint() != other.get_config_fingerprint()
+    assert not ifaceobj.compare(other)
+
+    other.config = OrderedDict([('mtu', ['9000'])])
+    assert ifaceobj.compare(other)
+    fingerprint = other.get_config_fingerprint()
+
+    other.replace_config('link-speed', '1000')
+    assert other.get_config_fingerprint() != fingerprint
+    other.delete_config('link-speed')
+    assert other.get_config_fingerprint() == fingerprint
+    other.update_config('alias', 'uplink')
+    assert not ifaceobj.compare(other)
+
+
+def test_config_fingerprint_is_pickled_with_config():
+    ifaceobj = new_iface('swp1', [('mtu', ['9000'])])
+    restored = pickle.loads(pickle.dumps(ifaceobj))
+    assert restored.config == ifaceobj.config
+    assert restored._config_fingerprint == ifaceobj.get_config_fingerprint()
+    assert restored.compare(ifaceobj)
+
+
+def test_statemanager_sync_sees_config_writes():
+    statemanager = stateManager()
+    saved = new_iface('swp1', [('mtu', ['9000'])])
+    statemanager.ifaceobj_sync(saved, 'up')
+    statemanager.changed_ifacenames.clear()
+
+    ifaceobj = new_iface('swp1', [('mtu', ['9000'])])
+    statemanager.ifaceobj_sync(ifaceobj, 'up')
+    assert not statemanager.changed_ifacenames
+
+    ifaceobj = new_iface('swp1', [('mtu', ['9000'])])
+    ifaceobj.config = OrderedDict([('mtu', ['1500'])])
+    statemanager.ifaceobj_sync(ifaceobj, 'up')
+    assert statemanager.changed_ifacenames == set(['swp1'])
+    assert ifaceobj in statemanager.get_ifaceobjs('swp1')
+
+
+def parse(interfacesfile, state_dir):
+    """ parses interfacesfile with a parse cache in state_dir, returns
+    (the iface objects found, True if the cache was used) """
+    parse_cache = parseCache(str(state_dir))
+    nifaces = networkInterfaces(str(interfacesfile), parse_cache=parse_cache)
+    ifaceobjs = []
+    nifaces.subscribe('iface_found', ifaceobjs.append)
+    nifaces.load()
+    return ifaceobjs, not parse_cache.files
+
+
+def write_file(path, content):
+    path.write_text(content)
+    # make sure the change is seen even on a coarse mtime
+    st = os.stat(str(path))
+    os.utime(str(path), ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+@pytest.fixture
+def interfaces(tmp_path):
+    os.mkdir(str(tmp_path / 'state'))
+    os.mkdir(str(tmp_path / 'interfaces.d'))
+    write_file(tmp_path / 'interfaces',
+               'auto swp1\niface swp1\n    mtu 9000\n\n'
+               'source interfaces.d/*\n')
+    write_file(tmp_path / 'interfaces.d' / 'swp2',
+               'auto swp2\niface swp2\n    mtu 9000\n')
+    return tmp_path
+
+
+def test_parse_cache_replays_unchanged_files(interfaces):
+    ifaceobjs, cached = parse(interfaces / 'interfaces', interfaces / 'state')
+    assert not cached
+    assert [o.name for o in ifaceobjs] == ['swp1', 'swp2']
+
+    ifaceobjs, cached = parse(interfaces / 'interfaces', interfaces / 'state')
+    assert cached
+    assert [o.name for o in ifaceobjs] == ['swp1', 'swp2']
+    assert ifaceobjs[1].get_attr_value_first('mtu') == '9000'
+
+
+def test_parse_cache_invalidated_by_changes(interfaces):
+    parse(interfaces / 'interfaces', interfaces / 'state')
+
+    # sourced file changed
+    write_file(interfaces / 'interfaces.d' / 'swp2',
+               'auto swp2\niface swp2\n    mtu 1500\n')
+    ifaceobjs, cached = parse(interfaces / 'interfaces', interfaces / 'state')
+    assert not cached
+    assert ifaceobjs[1].get_attr_value_first('mtu') == '1500'
+    assert parse(interfaces / 'interfaces', interfaces / 'state')[1]
+
+    # new file matching the source glob
+    write_file(interfaces / 'interfaces.d' / 'swp3',
+               'auto swp3\niface swp3\n')
+    os.utime(str(interfaces / 'interfaces.d'),
+             ns=(0, os.stat(str(interfaces / 'interfaces.d')).st_mtime_ns
+                 + 10 ** 9))
+    ifaceobjs, cached = parse(interfaces / 'interfaces', interfaces / 'state')
+    assert not cached
+    assert [o.name for o in ifaceobjs] == ['swp1', 'swp2', 'swp3']
+
+    # main interfaces file changed
+    write_file(interfaces / 'interfaces', 'auto swp1\niface swp1\n')
+    ifaceobjs, cached = parse(interfaces / 'interfaces', interfaces / 'state')
+    assert not cached
+    assert [o.name for o in ifaceobjs] == ['swp1']
+
+
+def test_parse_cache_skips_parses_with_warnings(interfaces):
+    # missing sourced file: parser warning
+    write_file(interfaces / 'interfaces',
+               'auto swp1\niface swp1\n\nsource missing\n')
+    for _ in range(2):
+        assert not parse(interfaces / 'interfaces', interfaces / 'state')[1]
+
+
+class FakeSyntaxChecker():
+    """ the ifupdownMain bits _iface_configattr_syntax_checker uses """
+
+    def __init__(self, parse_cache):
+        self.logger = logging.getLogger('ifupdown.test')
+        self.module_attrs = {
+            'fake': {'attrs': {'mtu': {},
+                               'old-mtu': {'deprecated': True,
+                                           'new-attribute': 'mtu'}}}}
+        self._parse_cache = parse_cache
+
+
+def test_parse_cache_skips_deprecated_attributes(interfaces):
+    write_file(interfaces / 'interfaces', 'auto swp1\niface swp1\n'
+               '    old-mtu 9000\n')
+    for _ in range(2):
+        parse_cache = parseCache(str(interfaces / 'state'))
+        checker = FakeSyntaxChecker(parse_cache)
+        nifaces = networkInterfaces(str(interfaces / 'interfaces'),
+                                    parse_cache=parse_cache)
+        nifaces.subscribe('iface_found', lambda ifaceobj: None)
+        nifaces.subscribe('validateifaceattr',
+            lambda *args: ifupdownMain._iface_configattr_syntax_checker(
+                checker, *args))
+        nifaces.load()
+        # the file was parsed: the deprecation warning is logged again
+        assert parse_cache.files
+        assert not parse_cache.cacheable